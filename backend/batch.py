@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+批量提示词任务
+
+一次提交一批 {model, prompt} 记录（POST /api/jobs 或 batch_cli.py），server 在后台逐条交给对应模型的 bot。
+  持久化   每个任务在 JOBS_DIR 下有 <job_id>.json（任务定义与状态，先写临时文件再替换）和
+           <job_id>.jsonl（结果，每完成一条追加一行并 fsync）。server 重启后重新加载未结束的任务，
+           跳过结果文件中已有的条目继续执行。
+  并发     每个模型同时进行的批量条目不超过 BATCH_CONCURRENCY（单个模型可用 'batch_concurrency' 覆盖）；
+           每个任务在 task_manager 中相当于一个连接，与前端对话轮流获得生成名额，不会把交互请求挤到后面。
+  重试     出错、返回 "Error: ..." 或空回答时按指数退避重试，最多 max_attempts 次，仍失败记为 error。
+  结果行   {index, id, model, prompt, status, answer, error, attempts, wait, ttfc, seconds, finished_at}
+           wait 为任务开始到该条目开始生成的时间，ttfc / seconds 为最后一次尝试的首块延迟与生成耗时。
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from logs import get_logger
+from task_manager import AdmissionTimeout
+
+log = get_logger('batch')
+
+# 任务状态
+QUEUED, RUNNING, DONE, CANCELLED = 'queued', 'running', 'done', 'cancelled'
+
+
+class BatchJob:
+    def __init__(self, directory: str, data: dict):
+        self.directory = directory
+        self.id = data["id"]
+        # [{"model", "prompt", "id"(可选)}]
+        self.items = data["items"]
+        self.max_attempts = data["max_attempts"]
+        self.status = data.get("status", QUEUED)
+        self.created_at = data.get("created_at", time.time())
+        self.finished_at = data.get("finished_at")
+        self.started_at = None
+        # Key: 条目序号, Value: "ok" / "error"（来自结果文件）
+        self.completed = {}
+        # Key: 条目序号, Value: 正在生成的 chat_id（取消时点击停止按钮）
+        self.running = {}
+        self.retries = 0
+        self.task = None
+
+    @property
+    def spec_path(self) -> str:
+        return os.path.join(self.directory, f"{self.id}.json")
+
+    @property
+    def output_path(self) -> str:
+        return os.path.join(self.directory, f"{self.id}.jsonl")
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, CANCELLED)
+
+    # --- 持久化（在线程池中执行） ---
+
+    def save(self):
+        """任务定义与状态：先写临时文件再替换，崩溃时不会留下半截的 JSON"""
+        data = {"id": self.id, "items": self.items, "max_attempts": self.max_attempts, "status": self.status,
+                "created_at": self.created_at, "finished_at": self.finished_at}
+        tmp = self.spec_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.spec_path)
+
+    def load_results(self):
+        """
+        读取已完成的条目；截掉崩溃时写了一半的最后一行（否则后续追加会接在它后面）。
+        无法解析的行跳过并记录警告，对应条目视为未完成、重新执行
+        """
+        if not os.path.exists(self.output_path):
+            return
+        with open(self.output_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+                data = data[:data.rfind(b'\n') + 1]
+        skipped = 0
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            try:
+                record = json.loads(line)
+                self.completed[record["index"]] = record["status"]
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+        if skipped:
+            log.warning("结果文件中有无法解析的行，已跳过", job=self.id, file=self.output_path, lines=skipped)
+
+    def append_result(self, record: dict):
+        with open(self.output_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    # --- 进度 ---
+
+    def stats(self) -> dict:
+        total = len(self.items)
+        ok = sum(1 for s in self.completed.values() if s == "ok")
+        failed = len(self.completed) - ok
+        # Key: model_name, Value: {"total", "ok", "error"}
+        by_model = {}
+        for index, item in enumerate(self.items):
+            counts = by_model.setdefault(item["model"], {"total": 0, "ok": 0, "error": 0})
+            counts["total"] += 1
+            if index in self.completed:
+                counts[self.completed[index]] += 1
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": total,
+            "ok": ok,
+            "error": failed,
+            "running": len(self.running),
+            "pending": total - len(self.completed) - len(self.running),
+            "retries": self.retries,
+            "progress": len(self.completed) / total if total else 1.0,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "elapsed": elapsed,
+            "by_model": by_model,
+        }
+
+
+class BatchRunner:
+    def __init__(self, directory: str, stream, slot, stop, concurrency: dict = None, default_concurrency: int = 2,
+                 max_attempts: int = 3, retry_delay: float = 5):
+        """
+        stream(model, chat_id, prompt): 产出回答完整内容的异步生成器（server.chat_stream）
+        slot(conn_id, model): 占用一个生成名额的异步上下文（task_manager.slot）
+        stop(chat_id): 点击该对话所在标签页的停止按钮
+        """
+        self.directory = directory
+        self.stream = stream
+        self.slot = slot
+        self.stop = stop
+        # Key: model_name, Value: 该模型同时进行的批量条目上限
+        self.concurrency = concurrency or {}
+        self.default_concurrency = default_concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # Key: job_id, Value: BatchJob
+        self.jobs = {}
+        # Key: model_name, Value: asyncio.Semaphore（所有任务共用）
+        self._semaphores = {}
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(self.concurrency.get(model) or self.default_concurrency)
+        return self._semaphores[model]
+
+    # --- 任务管理 ---
+
+    async def load(self):
+        """启动时加载已有任务，继续执行未结束的任务"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        def read_all():
+            jobs = []
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(".json"):
+                    continue
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    job = BatchJob(self.directory, json.load(f))
+                job.load_results()
+                jobs.append(job)
+            return jobs
+
+        resumed = 0
+        for job in await asyncio.to_thread(read_all):
+            self.jobs[job.id] = job
+            if not job.finished:
+                self._start(job)
+                resumed += 1
+        if self.jobs:
+            log.info("已加载批量任务", jobs=len(self.jobs), resumed=resumed)
+
+    async def submit(self, items: list, max_attempts: int = None) -> BatchJob:
+        job_id = f"job_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+        job = BatchJob(self.directory, {"id": job_id, "items": items,
+                                        "max_attempts": max_attempts or self.max_attempts})
+        await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+        await asyncio.to_thread(job.save)
+        self.jobs[job.id] = job
+        self._start(job)
+        log.info("批量任务已提交", job=job.id, items=len(items))
+        return job
+
+    async def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or job.finished:
+            return False
+        job.status = CANCELLED
+        job.finished_at = time.time()
+        for chat_id in list(job.running.values()):
+            self.stop(chat_id)
+        if job.task:
+            job.task.cancel()
+        await asyncio.to_thread(job.save)
+        log.info("批量任务已取消", job=job.id, completed=len(job.completed))
+        return True
+
+    async def shutdown(self):
+        """停止执行（任务状态保持不变，下次启动时继续）"""
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, job: BatchJob):
+        job.task = asyncio.create_task(self._run(job))
+
+    # --- 执行 ---
+
+    async def _run(self, job: BatchJob):
+        job.status = RUNNING
+        job.started_at = time.time()
+        await asyncio.to_thread(job.save)
+        pending = [i for i in range(len(job.items)) if i not in job.completed]
+        await asyncio.gather(*(self._run_item(job, i) for i in pending))
+        job.status = DONE
+        job.finished_at = time.time()
+        await asyncio.to_thread(job.save)
+        stats = job.stats()
+        log.info("批量任务完成", job=job.id, ok=stats["ok"], error=stats["error"],
+                 seconds=round(stats["elapsed"], 1))
+
+    async def _run_item(self, job: BatchJob, index: int):
+        item = job.items[index]
+        model, prompt = item["model"], item["prompt"]
+        record = {"index": index, "id": item.get("id"), "model": model, "prompt": prompt, "status": "error",
+                  "answer": "", "error": None, "attempts": 0, "wait": None, "ttfc": None, "seconds": None}
+        attempt = 0
+        while attempt < job.max_attempts:
+            attempt += 1
+            record["attempts"] = attempt
+            try:
+                async with self._semaphore(model), self.slot(f"batch:{job.id}", model):
+                    if record["wait"] is None:
+                        record["wait"] = time.time() - job.started_at
+                    await self._generate(job, index, attempt, record)
+                record["status"], record["error"] = "ok", None
+                break
+            except asyncio.CancelledError:
+                raise
+            except AdmissionTimeout:
+                # 前端对话占满了生成名额，继续排队，不算一次尝试
+                attempt -= 1
+                continue
+            except Exception as e:
+                record["error"] = str(e)
+                if attempt < job.max_attempts:
+                    job.retries += 1
+                    log.warning("批量条目失败，稍后重试", job=job.id, index=index, model=model, attempt=attempt,
+                                error=str(e))
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+        record["finished_at"] = time.time()
+        await asyncio.to_thread(job.append_result, record)
+        job.completed[index] = record["status"]
+
+    async def _generate(self, job: BatchJob, index: int, attempt: int, record: dict):
+        """生成一次：每个条目每次尝试都是一个新对话"""
+        chat_id = f"{job.id}_{index}_{attempt}"
+        job.running[index] = chat_id
+        start = time.perf_counter()
+        answer = ""
+        record["ttfc"] = None
+        try:
+            async for answer in self.stream(record["model"], chat_id, record["prompt"]):
+                if record["ttfc"] is None and answer:
+                    record["ttfc"] = time.perf_counter() - start
+        finally:
+            job.running.pop(index, None)
+            record["seconds"] = time.perf_counter() - start
+        record["answer"] = answer
+        # bot 以 "Error: ..." 文本报告发送失败
+        if answer.startswith("Error:"):
+            raise RuntimeError(answer)
+        if not answer.strip():
+            raise RuntimeError("空回答")
+
+    def stats(self) -> list:
+        return [job.stats() for job in sorted(self.jobs.values(), key=lambda j: j.created_at, reverse=True)]
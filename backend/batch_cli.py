@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+批量任务命令行
+
+输入文件每行一个 JSON：{"model": "gpt", "prompt": "...", "id": "可选的自定义编号"}，
+缺少 model 的行使用 --model 指定的模型。任务由 server 执行（见 batch.py），本工具只负责提交与查询。
+
+用法: python batch_cli.py submit prompts.jsonl [--model gpt] [--max-attempts 3] [--wait] [--output results.jsonl]
+      python batch_cli.py status <job_id>
+      python batch_cli.py list
+      python batch_cli.py cancel <job_id>
+      python batch_cli.py results <job_id> [--output results.jsonl]
+"""
+import argparse
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_SERVER = "http://127.0.0.1:8000"
+
+
+def request(server: str, method: str, path: str, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(server + path, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.read().decode("utf-8")
+    except urllib.error.HTTPError as e:
+        detail = e.read().decode("utf-8")
+        sys.exit(f"❌ {e.code}: {detail}")
+
+
+def read_items(path: str, model: str = None) -> list:
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record.setdefault("model", model)
+            if not record.get("model") or not record.get("prompt"):
+                sys.exit(f"❌ 第 {lineno} 行缺少 model 或 prompt")
+            items.append({k: record[k] for k in ("model", "prompt", "id") if record.get(k) is not None})
+    return items
+
+
+def format_progress(stats: dict) -> str:
+    return (f"{stats['id']}  {stats['status']:<9}  {stats['progress']:6.1%}  成功 {stats['ok']}  失败 {stats['error']}  "
+            f"进行中 {stats['running']}  等待 {stats['pending']}  重试 {stats['retries']}  {stats['elapsed']:.0f}s")
+
+
+def save_results(server: str, job_id: str, output: str) -> int:
+    """下载结果并按输入顺序写入 output"""
+    records = [json.loads(line) for line in request(server, "GET", f"/api/jobs/{job_id}/results").splitlines()
+               if line.strip()]
+    records.sort(key=lambda r: r["index"])
+    with open(output, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", default=DEFAULT_SERVER)
+    sub = parser.add_subparsers(dest="command", required=True)
+    submit = sub.add_parser("submit")
+    submit.add_argument("file")
+    submit.add_argument("--model", help="输入行未指定 model 时使用的模型")
+    submit.add_argument("--max-attempts", type=int)
+    submit.add_argument("--wait", action="store_true", help="等待任务结束并下载结果")
+    submit.add_argument("--output", help="结果文件（配合 --wait）")
+    submit.add_argument("--interval", type=float, default=2, help="查询进度的间隔 (s)")
+    for name in ("status", "cancel"):
+        sub.add_parser(name).add_argument("job_id")
+    sub.add_parser("list")
+    results = sub.add_parser("results")
+    results.add_argument("job_id")
+    results.add_argument("--output")
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        items = read_items(args.file, args.model)
+        stats = json.loads(request(args.server, "POST", "/api/jobs", {"items": items,
+                                                                     "max_attempts": args.max_attempts}))
+        print(f"✅ 已提交 {stats['total']} 条: {stats['id']}")
+        if not args.wait:
+            return
+        try:
+            while stats["status"] not in ("done", "cancelled"):
+                time.sleep(args.interval)
+                stats = json.loads(request(args.server, "GET", f"/api/jobs/{stats['id']}"))
+                print(format_progress(stats), flush=True)
+        except KeyboardInterrupt:
+            print(f"\n任务仍在 server 上运行，可用 `python batch_cli.py cancel {stats['id']}` 取消")
+            return
+        output = args.output or f"{stats['id']}.jsonl"
+        print(f"📄 {save_results(args.server, stats['id'], output)} 条结果已写入 {output}")
+    elif args.command == "status":
+        print(format_progress(json.loads(request(args.server, "GET", f"/api/jobs/{args.job_id}"))))
+    elif args.command == "list":
+        for stats in json.loads(request(args.server, "GET", "/api/jobs")):
+            print(format_progress(stats))
+    elif args.command == "cancel":
+        print(format_progress(json.loads(request(args.server, "POST", f"/api/jobs/{args.job_id}/cancel"))))
+    elif args.command == "results":
+        if args.output:
+            print(f"📄 {save_results(args.server, args.job_id, args.output)} 条结果已写入 {args.output}")
+        else:
+            sys.stdout.write(request(args.server, "GET", f"/api/jobs/{args.job_id}/results"))
+
+
+if __name__ == '__main__':
+    main()
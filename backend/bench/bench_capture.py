@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+首 token 延迟基准：网络层捕获 vs DOM 抓取
+
+在本地模拟站点上分别用两种方式驱动同一个 bot，记录从调用 stream_chat 到收到第一段非空内容的时间
+以及完整回答的总耗时。需要本机安装 Chromium / Chrome，不访问外网。
+
+用法: python bench/bench_capture.py --browser /usr/bin/chromium [--runs 5] [--tokens 200] [--interval 20]
+"""
+import argparse
+import asyncio
+import copy
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from DrissionPage import ChromiumOptions, ChromiumPage  # noqa: E402
+from crawler_base import BaseBot  # noqa: E402
+from mock_site import MOCK_CONF, start_mock_server  # noqa: E402
+
+
+class MockSiteBot(BaseBot):
+    def __init__(self, page, url, conf):
+        super().__init__(page, 'mock')
+        self.conf = conf
+        self.url = url
+
+    def activate_tab(self):
+        self.tab = self.page.new_tab(self.url)
+        self.tab.wait.doc_loaded()
+
+
+async def measure(bot):
+    t0 = time.perf_counter()
+    ttft = None
+    async for chunk in bot.stream_chat("你好"):
+        if ttft is None and chunk:
+            ttft = time.perf_counter() - t0
+    return ttft, time.perf_counter() - t0
+
+
+async def run_path(page, url, with_capture, runs):
+    conf = copy.deepcopy(MOCK_CONF)
+    if not with_capture:
+        conf.pop('stream')
+    results = []
+    for _ in range(runs):
+        bot = MockSiteBot(page, url, conf)
+        results.append(await measure(bot))
+        await bot.io.run(bot.tab.close)
+    return results
+
+
+def report(name, results):
+    ttfts = [r[0] for r in results if r[0] is not None]
+    totals = [r[1] for r in results]
+    print(f"{name:<10} 首 token: 中位 {statistics.median(ttfts) * 1000:7.0f} ms  "
+          f"最小 {min(ttfts) * 1000:7.0f} ms   总耗时: 中位 {statistics.median(totals):.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--browser', required=True, help='本地 Chromium/Chrome 可执行文件路径')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--tokens', type=int, default=200)
+    parser.add_argument('--interval', type=int, default=20, help='每个 token 的间隔 (ms)')
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server()
+    url = f"{base_url}?tokens={args.tokens}&interval={args.interval}"
+    co = ChromiumOptions(read_file=False).set_browser_path(args.browser).auto_port()
+    if args.headless:
+        co.headless()
+    page = ChromiumPage(addr_or_opts=co)
+    try:
+        network = asyncio.run(run_path(page, url, True, args.runs))
+        dom = asyncio.run(run_path(page, url, False, args.runs))
+        print(f"模拟站点: {args.tokens} tokens, 间隔 {args.interval} ms, 每种方式 {args.runs} 次")
+        report('网络捕获', network)
+        report('DOM 抓取', dom)
+    finally:
+        page.quit()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+事件循环响应性基准测试
+
+用会阻塞线程的假标签页（每次 CDP 调用 sleep 若干毫秒）驱动多个 bot 同时流式输出，
+同时用一个心跳协程测量事件循环的调度延迟。浏览器操作都在各标签页的工作线程中执行时，
+心跳延迟应保持在毫秒级，且多个流的总耗时接近单个流的耗时（真正并行）。
+
+--legacy 使用非 CSS 选择器，关闭单次往返探针，对比每次轮询的 CDP 调用次数。
+
+结束时检查每个流：没有 "Error: ..." 内容、帧数不少于 --min-frames、最后一帧包含全部段落，
+且心跳 p99 延迟不超过 --max-lag；任一不满足时打印原因并以非零状态退出。
+
+用法: python bench/bench_event_loop.py [--bots 5] [--latency 0.03] [--legacy] [--min-frames 5] [--max-lag 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from browser_io import shutdown_all  # noqa: E402
+from crawler_base import BaseBot  # noqa: E402
+
+
+class FakeElement:
+    def __init__(self, tab, kind):
+        self.tab = tab
+        self.kind = kind
+
+    @property
+    def inner_html(self):
+        self.tab._call()
+        return self.tab.answer_html()
+
+    def clear(self):
+        self.tab._call()
+
+    def input(self, text):
+        self.tab._call()
+
+    def click(self):
+        self.tab._call()
+        if self.kind == 'send':
+            self.tab.start()
+
+
+class FakeTab:
+    """模拟一个正在生成回答的标签页：发送后每 interval 秒增长一个段落"""
+
+    def __init__(self, latency, paragraphs=30, interval=0.15):
+        self.latency = latency
+        self.paragraphs = paragraphs
+        self.interval = interval
+        self.started_at = None
+        # 模拟的 CDP 调用次数
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        time.sleep(self.latency)
+
+    def start(self):
+        self.started_at = time.time()
+
+    def _produced(self):
+        if self.started_at is None:
+            return 0
+        return min(self.paragraphs, int((time.time() - self.started_at) / self.interval) + 1)
+
+    def answer_html(self):
+        return ''.join('<p>段落 %d：流式输出内容。</p>' % i for i in range(self._produced()))
+
+    def _generating(self):
+        return 0 < self._produced() < self.paragraphs
+
+    def ele(self, selector, timeout=None):
+        self._call()
+        if selector.endswith('stop'):
+            return FakeElement(self, 'stop') if self._generating() else None
+        if selector.endswith('send'):
+            return FakeElement(self, 'send')
+        return FakeElement(self, 'input')
+
+    def eles(self, selector):
+        self._call()
+        return [FakeElement(self, 'answer')] if self.started_at else []
+
+    def run_js(self, script, as_expr=False):
+        """只模拟 page_probe 的探针脚本"""
+        self._call()
+        html = self.answer_html()
+        count = 1 if self.started_at else 0
+        return json.dumps({"answer": 0 if count else -1, "stop": 0 if self._generating() else -1,
+                           "count": count, "fresh": count > 0, "scoped": False,
+                           "len": len(html), "html": html, "present": self._generating()})
+
+
+class FakeBot(BaseBot):
+    def __init__(self, index, latency, legacy=False):
+        super().__init__(None, f"fake{index}")
+        self.latency = latency
+        prefix = 'tag:' if legacy else 'css:'
+        self.conf = {'selectors': {'input': prefix + 'input', 'send': prefix + 'send',
+                                   'stop': prefix + 'stop', 'answer': prefix + 'answer'}}
+
+    def activate_tab(self):
+        self.tab = FakeTab(self.latency)
+
+
+async def heartbeat(stop_event, lags):
+    """每 10ms 唤醒一次，记录实际唤醒延迟"""
+    while not stop_event.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - t0 - 0.01)
+
+
+async def consume(bot):
+    t0 = time.perf_counter()
+    chunks = 0
+    content = ''
+    async for content in bot.stream_chat("hello"):
+        chunks += 1
+    return chunks, time.perf_counter() - t0, bot.tab.calls, content
+
+
+def check(args, results, p99) -> list:
+    """返回不满足的检查项"""
+    failures = []
+    last_paragraph = '段落 %d' % (FakeTab(0).paragraphs - 1)
+    for i, (chunks, _, _, content) in enumerate(results):
+        if content.startswith('Error:'):
+            failures.append(f"fake{i}: 流出错 {content!r}")
+        elif chunks < args.min_frames:
+            failures.append(f"fake{i}: 只收到 {chunks} 帧（至少 {args.min_frames}）")
+        elif last_paragraph not in content:
+            failures.append(f"fake{i}: 回答不完整（缺少「{last_paragraph}」）")
+    if p99 > args.max_lag:
+        failures.append(f"事件循环 p99 延迟 {p99 * 1000:.1f}ms 超过 {args.max_lag * 1000:.0f}ms")
+    return failures
+
+
+async def main(args):
+    lags = []
+    stop_event = asyncio.Event()
+    hb = asyncio.create_task(heartbeat(stop_event, lags))
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(consume(FakeBot(i, args.latency, args.legacy)) for i in range(args.bots)))
+    wall = time.perf_counter() - t0
+    stop_event.set()
+    await hb
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0
+    print(f"并发流数: {args.bots}，模拟 CDP 延迟: {args.latency * 1000:.0f} ms，探针: {'关' if args.legacy else '开'}")
+    for i, (chunks, elapsed, calls, _) in enumerate(results):
+        print(f"  fake{i}: {chunks} 帧, {elapsed:.2f}s, CDP 调用 {calls} 次")
+    print(f"总耗时: {wall:.2f}s (单流最长 {max(r[1] for r in results):.2f}s)")
+    print(f"事件循环延迟: p50={lags[len(lags) // 2] * 1000:.1f}ms p99={p99 * 1000:.1f}ms max={lags[-1] * 1000:.1f}ms")
+    shutdown_all()
+    failures = check(args, results, p99)
+    for failure in failures:
+        print(f"❌ {failure}")
+    return not failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bots', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.03)
+    parser.add_argument('--legacy', action='store_true')
+    parser.add_argument('--min-frames', type=int, default=5, help='每个流至少应收到的帧数')
+    parser.add_argument('--max-lag', type=float, default=0.05, help='心跳 p99 延迟上限 (s)')
+    sys.exit(0 if asyncio.run(main(parser.parse_args())) else 1)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+对话列表基准测试
+
+在临时目录中生成 N 个对话文件，对比：
+  原方式: 每次请求 glob + 逐个 json.load + 排序（FileHistoryStore.list_sessions）
+  缓存:   HistoryIndex 启动时构建一次（冷），之后全量列表 / 游标分页（热）
+
+用法: python bench/bench_history.py [--sizes 10000,100000] [--messages 6] [--limit 50]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from history_index import HistoryIndex  # noqa: E402
+from history_store import FileHistoryStore  # noqa: E402
+
+MODELS = ['deepseek', 'gpt', 'doubao', 'gemini', 'kimi']
+
+
+def generate(directory, count, messages):
+    base = 1768600000.0
+    for i in range(count):
+        updated_at = base + random.random() * 1e6
+        data = {
+            "id": f"chat_{i}",
+            "title": f"对话 {i}",
+            "model": random.choice(MODELS),
+            "messages": [{"role": "user" if j % 2 == 0 else "assistant",
+                          "content": "给我讲个故事，" * 20 if j % 2 == 0 else "从前有座山，山里有座庙。" * 80,
+                          "timestamp": updated_at * 1000} for j in range(messages)],
+            "updated_at": updated_at
+        }
+        with open(os.path.join(directory, f"chat_{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def timed(fn, repeat=1):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def run(count, args):
+    with tempfile.TemporaryDirectory() as directory:
+        t0 = time.perf_counter()
+        generate(directory, count, args.messages)
+        print(f"\n=== {count} 个对话（生成耗时 {time.perf_counter() - t0:.1f}s） ===")
+        store = FileHistoryStore(directory)
+
+        legacy, sessions = timed(store.list_sessions)
+        print(f"原方式 list_sessions:        {legacy * 1000:9.1f} ms")
+
+        index = HistoryIndex(store)
+        cold, _ = timed(index.build)
+        print(f"缓存构建（冷，启动时一次）:  {cold * 1000:9.1f} ms")
+
+        warm_all, result = timed(index.all, repeat=20)
+        assert [s["id"] for s in result] == [s["id"] for s in sessions]
+        print(f"缓存全量列表（热）:          {warm_all * 1000:9.3f} ms")
+
+        first, page = timed(lambda: index.page(args.limit), repeat=200)
+        print(f"缓存首页 limit={args.limit}（热）:    {first * 1000:9.3f} ms")
+        middle_cursor = index.page(count // 2)["next_cursor"]
+        deep, _ = timed(lambda: index.page(args.limit, middle_cursor), repeat=200)
+        print(f"缓存中间页（游标，热）:      {deep * 1000:9.3f} ms")
+
+        rescan, changed = timed(lambda: index.apply_changes(index.collect_changes()))
+        print(f"mtime 扫描（无变化）:        {rescan * 1000:9.1f} ms (变化 {changed})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--messages', type=int, default=6)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+    for size in args.sizes.split(','):
+        run(int(size), args)
+
+
+if __name__ == '__main__':
+    main()
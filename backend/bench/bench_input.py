@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+提示词写入耗时基准
+
+在本机 Chromium 中打开一个本地页面，包含两种输入框:
+  textarea   受控文本框：每次 input 事件同步一份状态并重算字数（模拟 React 受控组件）
+  editor     contenteditable 富文本编辑器：每次变化按段落整体重绘，paste 由编辑器自己解析成段落
+              （模拟 ProseMirror / Lexical）
+对不同大小的提示词（日志 + 代码混排，多行）分别测量各写入方式（prompt_input.py）的耗时与是否读回一致，
+并与旧路径（clear + input + 固定 sleep 0.5s）对比。不访问外网。
+
+用法: python bench/bench_input.py --browser /usr/bin/chromium [--sizes 1,8,32,128] [--runs 3] [--headless]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from DrissionPage import ChromiumOptions, ChromiumPage  # noqa: E402
+from prompt_input import _normalize, _verify, _write  # noqa: E402
+
+PAGE = """<!doctype html><html><head><meta charset="utf-8"></head><body>
+<textarea id="textarea" rows="8" cols="80"></textarea>
+<div id="editor" contenteditable="true" style="white-space: pre-wrap"><p><br></p></div>
+<div id="status"></div>
+<script>
+const ta = document.getElementById('textarea');
+const status = document.getElementById('status');
+let state = '';
+ta.addEventListener('input', () => { state = ta.value; status.textContent = state.length + ' 字'; });
+
+const editor = document.getElementById('editor');
+function render(text) {
+  editor.innerHTML = '';
+  for (const line of text.split('\\n')) {
+    const p = document.createElement('p');
+    if (line) p.textContent = line; else p.appendChild(document.createElement('br'));
+    editor.appendChild(p);
+  }
+}
+editor.addEventListener('paste', (e) => {
+  e.preventDefault();
+  render(e.clipboardData.getData('text/plain'));
+});
+editor.addEventListener('input', () => { render(editor.innerText.replace(/\\n\\n/g, '\\n')); });
+</script></body></html>"""
+
+LOG_LINE = "2024-05-01 12:00:{:02d} ERROR worker-{} Traceback: KeyError('session') in handler.py line {}\n"
+CODE = "def handle(req):\n    session = req.get('session')\n    if not session:\n        raise KeyError('session')\n\n"
+
+# Key: 输入框, Value: 适用的写入方式
+MODES = {
+    'textarea': ('value', 'insert', 'type'),
+    'editor': ('paste', 'insert', 'type'),
+}
+
+
+def make_prompt(kb: int) -> str:
+    parts = ["请分析下面的日志和代码，找出报错原因：\n\n"]
+    i = 0
+    while sum(len(p) for p in parts) < kb * 1024:
+        parts.append(LOG_LINE.format(i % 60, i % 8, 100 + i) if i % 5 else CODE)
+        i += 1
+    return ''.join(parts)[:kb * 1024]
+
+
+def measure(tab, ele, prompt: str, mode: str) -> tuple:
+    expected = _normalize(prompt)
+    start = time.perf_counter()
+    text = _write(tab, ele, prompt, mode)
+    ok = _verify(ele, expected, text, 5)
+    return time.perf_counter() - start, ok
+
+
+def measure_legacy(ele, prompt: str) -> float:
+    start = time.perf_counter()
+    ele.clear()
+    ele.input(prompt)
+    time.sleep(0.5)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--browser', required=True, help='本地 Chromium/Chrome 可执行文件路径')
+    parser.add_argument('--sizes', default='1,8,32,128', help='提示词大小 (KB)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args()
+    logging.getLogger('aiworld').setLevel(logging.WARNING)
+
+    co = ChromiumOptions(read_file=False).set_browser_path(args.browser).auto_port()
+    if args.headless:
+        co.headless()
+    page = ChromiumPage(addr_or_opts=co)
+    tab = page.new_tab('data:text/html;charset=utf-8,' + quote(PAGE))
+    try:
+        for kb in (int(s) for s in args.sizes.split(',')):
+            prompt = make_prompt(kb)
+            for box, modes in MODES.items():
+                ele = tab.ele(f'#{box}')
+                legacy = statistics.median(measure_legacy(ele, prompt) for _ in range(args.runs))
+                cells = [f"旧路径 {legacy * 1000:7.0f} ms"]
+                for mode in modes:
+                    results = [measure(tab, ele, prompt, mode) for _ in range(args.runs)]
+                    ok = all(r[1] for r in results)
+                    cells.append(f"{mode} {statistics.median(r[0] for r in results) * 1000:6.1f} ms"
+                                 f"{'' if ok else '（读回不一致）'}")
+                print(f"{kb:>4} KB  {box:<8}  " + '  '.join(cells))
+    finally:
+        page.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+精简模式资源占用对比
+
+分别以关闭 / 开启精简模式（lean_mode.py）启动一个全新的 Chromium（临时用户数据目录），依次打开各模型的首页，
+等页面稳定后统计每个标签页:
+  RSS      该标签页渲染进程的常驻内存（打开标签页前后新出现的渲染进程，读取 /proc，仅 Linux）
+  CPU      观察窗口内渲染进程的 CPU 占用（SystemInfo.getProcessInfo 的 cpuTime 差值 / 窗口长度）
+  堆 / 节点 JS 堆已用大小与 DOM 节点数
+  拦截     精简模式下按资源类型统计的被拦截请求数
+需要本机安装 Chromium / Chrome 并能访问各模型站点（未登录的首页即可）。
+
+用法: python bench/bench_lean.py --browser /usr/bin/chromium [--models gpt,gemini] [--settle 20] [--window 30] [--headless]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from DrissionPage import ChromiumOptions, ChromiumPage  # noqa: E402
+from config import MODEL_CONFIG  # noqa: E402
+from lean_mode import lean_summary, open_tab, release_lean  # noqa: E402
+
+
+def renderers(page) -> dict:
+    """Key: 渲染进程 pid, Value: 累计 CPU 时间（秒）"""
+    info = page.browser._run_cdp('SystemInfo.getProcessInfo')['processInfo']
+    return {p['id']: p['cpuTime'] for p in info if p['type'] == 'renderer'}
+
+
+def rss_mb(pid: int):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def run(args, lean: bool) -> list:
+    co = ChromiumOptions(read_file=False).set_browser_path(args.browser).auto_port()
+    co.set_user_data_path(tempfile.mkdtemp(prefix='aiworld-lean-'))
+    if args.headless:
+        co.headless()
+    page = ChromiumPage(addr_or_opts=co)
+    rows = []
+    try:
+        tabs = []
+        for name in args.models.split(','):
+            conf = dict(MODEL_CONFIG[name], lean=lean)
+            before = set(renderers(page))
+            tab = open_tab(page, conf['home_url'], name, conf)
+            time.sleep(args.settle)
+            tabs.append((name, tab, set(renderers(page)) - before))
+        start = renderers(page)
+        time.sleep(args.window)
+        end = renderers(page)
+        blocked = lean_summary()
+        for name, tab, pids in tabs:
+            rss = [rss_mb(pid) for pid in pids]
+            cpu = sum(end.get(pid, 0) - start.get(pid, 0) for pid in pids) / args.window
+            heap = tab.run_cdp('Runtime.getHeapUsage')['usedSize'] / 2 ** 20
+            nodes = tab.run_cdp('Memory.getDOMCounters')['nodes']
+            rows.append({"model": name, "lean": lean, "rss": sum(r for r in rss if r) if pids else None,
+                         "cpu": cpu, "heap": heap, "nodes": nodes,
+                         "blocked": sum(blocked.get(name, {}).get("blocked", {}).values())})
+            release_lean(tab)
+    finally:
+        page.quit()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--browser', required=True, help='本地 Chromium/Chrome 可执行文件路径')
+    parser.add_argument('--models', default=','.join(MODEL_CONFIG))
+    parser.add_argument('--settle', type=float, default=20, help='打开标签页后等待页面稳定的时间 (s)')
+    parser.add_argument('--window', type=float, default=30, help='统计 CPU 占用的观察窗口 (s)')
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args()
+    logging.getLogger('aiworld').setLevel(logging.WARNING)
+
+    rows = run(args, False) + run(args, True)
+    print(f"{'模型':<10}{'精简':<6}{'RSS MB':>9}{'CPU %':>8}{'堆 MB':>8}{'节点':>9}{'拦截':>7}")
+    for row in sorted(rows, key=lambda r: (r["model"], r["lean"])):
+        rss = f"{row['rss']:.0f}" if row['rss'] is not None else '-'
+        print(f"{row['model']:<10}{'是' if row['lean'] else '否':<6}{rss:>9}{row['cpu'] * 100:>8.1f}"
+              f"{row['heap']:>8.1f}{row['nodes']:>9}{row['blocked']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+增量 Markdown 转换基准测试
+
+模拟一个包含标题、代码块、表格、列表的长回答逐步流式增长，
+对比「每次全量 markdownify」与 IncrementalMarkdown 的耗时，并逐帧校验输出逐字节一致。
+
+用法: python bench/bench_markdown.py [--blocks 120] [--step 40]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from bs4 import BeautifulSoup, NavigableString
+from markdownify import markdownify as md
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from markdown_stream import IncrementalMarkdown  # noqa: E402
+
+WORDS = "流式 回答 markdown 转换 性能 浏览器 标签页 model token 缓存 incremental 解析 表格 代码".split()
+
+
+def _sentence(rng, n=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def make_blocks(rng, count):
+    """生成回答的顶层块列表，块之间偶尔带空白文本节点（与真实 inner_html 一致）"""
+    blocks = []
+    for i in range(count):
+        kind = i % 7
+        if kind == 0:
+            html = '<h2>第 %d 节 %s</h2>' % (i, _sentence(rng, 3))
+        elif kind == 1:
+            html = '<p>%s <strong>%s</strong> <code>x_%d</code> %s</p>' % (
+                _sentence(rng), _sentence(rng, 2), i, _sentence(rng))
+        elif kind == 2:
+            lines = '\n'.join('    value_%d = compute(%d)  # %s' % (j, j, rng.choice(WORDS)) for j in range(8))
+            html = '<pre><code class="language-python">def f_%d():\n%s\n</code></pre>' % (i, lines)
+        elif kind == 3:
+            rows = ''.join('<tr><td>%s</td><td>%d</td><td>%s</td></tr>' % (rng.choice(WORDS), j, rng.choice(WORDS))
+                           for j in range(6))
+            html = '<table><thead><tr><th>名称</th><th>数值</th><th>说明</th></tr></thead><tbody>%s</tbody></table>' % rows
+        elif kind == 4:
+            items = ''.join('<li>%s<ul><li>%s</li></ul></li>' % (_sentence(rng, 4), _sentence(rng, 3)) for _ in range(4))
+            html = '<ul>%s</ul>' % items
+        elif kind == 5:
+            items = ''.join('<li><p>%s</p></li>' % _sentence(rng, 5) for _ in range(3))
+            html = '<ol start="3">%s</ol>' % items
+        else:
+            html = '<blockquote><p>%s</p></blockquote><hr>' % _sentence(rng, 8)
+        blocks.append(html)
+        if rng.random() < 0.3:
+            blocks.append('\n')
+    return blocks
+
+
+def truncate_html(html, limit):
+    """保留前 limit 个文本字符，生成仍然闭合良好的 HTML（模拟正在生成的最后一个块）"""
+    soup = BeautifulSoup(html, 'html.parser')
+    remaining = limit
+    for node in list(soup.descendants):
+        if isinstance(node, NavigableString):
+            if remaining <= 0:
+                node.replace_with('')
+            elif len(node) > remaining:
+                node.replace_with(str(node)[:remaining])
+                remaining = 0
+            else:
+                remaining -= len(node)
+    return str(soup)
+
+
+def stream_snapshots(blocks, step):
+    """按 step 个字符的粒度生成流式快照序列"""
+    done = ''
+    for block in blocks:
+        text_len = len(BeautifulSoup(block, 'html.parser').get_text())
+        for n in range(step, text_len, step):
+            yield done + truncate_html(block, n)
+        done += block
+        yield done
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=120)
+    parser.add_argument('--step', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    snapshots = list(stream_snapshots(make_blocks(rng, args.blocks), args.step))
+    print(f"快照数: {len(snapshots)}，最终 HTML 长度: {len(snapshots[-1])} 字符")
+
+    t0 = time.perf_counter()
+    full = [md(html, heading_style="atx") for html in snapshots]
+    t_full = time.perf_counter() - t0
+
+    converter = IncrementalMarkdown(heading_style="atx")
+    t0 = time.perf_counter()
+    incremental = [converter.convert(html) for html in snapshots]
+    t_inc = time.perf_counter() - t0
+
+    mismatches = sum(1 for a, b in zip(full, incremental) if a != b)
+    print(f"全量 markdownify : {t_full:8.3f}s  ({t_full / len(snapshots) * 1000:.2f} ms/帧)")
+    print(f"增量转换         : {t_inc:8.3f}s  ({t_inc / len(snapshots) * 1000:.2f} ms/帧)")
+    print(f"加速比           : {t_full / t_inc:8.1f}x")
+    print(f"缓存命中/未命中  : {converter.hits}/{converter.misses}")
+    print(f"不一致帧数       : {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+各模型 bot 的离线基准测试
+
+为 MODEL_CONFIG 中的每个模型启动本地仿站（bench/mock_site.py，独立进程），用真实的 bot 类
+（选择器、结束判定参数、流式捕获规则都来自 MODEL_CONFIG）驱动本机 Chromium 完成若干轮问答，
+统计每条流的:
+  首块延迟   调用 stream_chat 到收到第一段非空内容（含仿站的思考时间 --ttft）
+  块速率     首块之后每秒产出的内容块数
+  结束滞后   页面写完最后一个 token 到 bot 判定生成结束
+  CPU        后端进程 CPU 时间，以及该标签页渲染进程主线程的忙碌时间（CDP Performance.getMetrics）
+不访问外网，结果不受真实站点负载影响。
+
+用法: python bench/bench_models.py --browser /usr/bin/chromium [--models gpt,kimi] [--runs 3]
+      [--script markdown] [--tokens 0] [--interval 20] [--ttft 300] [--no-capture] [--headless]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from DrissionPage import ChromiumOptions, ChromiumPage  # noqa: E402
+from browser_io import shutdown_all  # noqa: E402
+from config import MODEL_CONFIG  # noqa: E402
+from crawler_base import BotFactory  # noqa: E402
+from mock_site import SCRIPTS, mock_conf, model_url, start_mock_process  # noqa: E402
+
+
+def renderer_busy(tab) -> float:
+    """渲染进程主线程累计忙碌时间（秒）"""
+    metrics = tab.run_cdp('Performance.getMetrics')['metrics']
+    return next((m['value'] for m in metrics if m['name'] == 'TaskDuration'), 0.0)
+
+
+def open_tab(page, url):
+    tab = page.new_tab(url)
+    tab.wait.doc_loaded()
+    tab.run_cdp('Performance.enable')
+    return tab
+
+
+async def run_once(page, name: str, url: str, conf: dict) -> dict:
+    bot = BotFactory.get_bot(name, page)
+    bot.conf = conf
+    bot.tab = await bot.io.run(open_tab, page, url)
+    try:
+        busy_before = await bot.io.run(renderer_busy, bot.tab)
+        cpu_before = time.process_time()
+        t0 = time.perf_counter()
+        first = last = None
+        chunks = 0
+        async for chunk in bot.stream_chat("请讲讲快速排序"):
+            if not chunk:
+                continue
+            last = time.perf_counter()
+            first = first or last
+            chunks += 1
+        finished_at = time.time()
+        cpu = time.process_time() - cpu_before
+        done_at = await bot.io.run(bot.tab.run_js, 'return window.__mockDoneAt || 0')
+        busy = await bot.io.run(renderer_busy, bot.tab) - busy_before
+    finally:
+        await bot.io.run(bot.tab.close)
+    return {
+        "ttfc": first - t0 if first else None,
+        "chunks": chunks,
+        "rate": (chunks - 1) / (last - first) if chunks > 1 and last > first else 0.0,
+        "lag": finished_at - done_at / 1000 if done_at else None,
+        "cpu": cpu,
+        "renderer": busy,
+    }
+
+
+def median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else float('nan')
+
+
+def report(name: str, path: str, results: list):
+    print(f"{name:<10} {path:<6} 首块 {median(r['ttfc'] for r in results) * 1000:7.0f} ms  "
+          f"块速率 {median(r['rate'] for r in results):6.1f}/s  "
+          f"结束滞后 {median(r['lag'] for r in results) * 1000:6.0f} ms "
+          f"(最大 {max((r['lag'] or 0) for r in results) * 1000:.0f})  "
+          f"后端 CPU {median(r['cpu'] for r in results) * 1000:6.0f} ms  "
+          f"渲染 CPU {median(r['renderer'] for r in results) * 1000:6.0f} ms  "
+          f"块数 {median(r['chunks'] for r in results):.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--browser', required=True, help='本地 Chromium/Chrome 可执行文件路径')
+    parser.add_argument('--models', default=','.join(MODEL_CONFIG))
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--script', default='markdown', choices=sorted(SCRIPTS))
+    parser.add_argument('--tokens', type=int, default=0, help='回答 token 数（0 为剧本原长）')
+    parser.add_argument('--interval', type=int, default=20, help='每个 token 的间隔 (ms)')
+    parser.add_argument('--ttft', type=int, default=300, help='首 token 前的思考时间 (ms)')
+    parser.add_argument('--no-capture', action='store_true', help='忽略 stream 配置，只测 DOM 监听')
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--verbose', action='store_true', help='输出 bot 日志')
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger('aiworld').setLevel(logging.WARNING)
+
+    process, base_url = start_mock_process()
+    co = ChromiumOptions(read_file=False).set_browser_path(args.browser).auto_port()
+    if args.headless:
+        co.headless()
+    page = ChromiumPage(addr_or_opts=co)
+    print(f"剧本 {args.script}，tokens={args.tokens or '原长'}，间隔 {args.interval} ms，"
+          f"思考 {args.ttft} ms，每个模型 {args.runs} 次")
+    try:
+        for name in args.models.split(','):
+            conf = mock_conf(name, base_url)
+            if args.no_capture:
+                conf.pop('stream', None)
+            url = model_url(base_url, name, script=args.script, tokens=args.tokens,
+                             interval=args.interval, ttft=args.ttft)
+            results = [asyncio.run(run_once(page, name, url, conf)) for _ in range(args.runs)]
+            report(name, '网络' if 'stream' in conf else 'DOM', results)
+    finally:
+        page.quit()
+        shutdown_all()
+        process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+全文检索基准测试
+
+用 history_storage 中的样例对话切句、随机拼接，生成指定数量的消息建立索引，
+测量建索引耗时、进程内存，以及各类查询（双字 / 多字 / 单字 / 英文 / 无结果）的延迟。
+
+用法: python bench/bench_search.py [--messages 100000] [--per-chat 10] [--rounds 50]
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import resource
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+from history_search import SearchIndex  # noqa: E402
+
+QUERIES = ['故事', '讲个故事', '小兔子', '月', '今天是几号', 'markdown', 'python 代码', '完全不存在的查询词']
+EXTRA = ['Python 代码示例', 'markdown 表格', 'GPT 的回答', '数据库索引', '异步 IO 与 asyncio', '浏览器标签页']
+
+
+def load_sentences():
+    sentences = []
+    for f in glob.glob(os.path.join(BACKEND, 'history_storage', '*.json')):
+        with open(f, 'r', encoding='utf-8') as file:
+            for message in json.load(file).get('messages', []):
+                sentences.extend(s for s in re.split(r'(?<=[。！？\n])', message['content']) if s.strip())
+    return sentences + EXTRA
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--per-chat', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(1)
+    sentences = load_sentences()
+    base_rss = rss_mb()
+    index = SearchIndex()
+    t0 = time.perf_counter()
+    total_chars = 0
+    for c in range(args.messages // args.per_chat):
+        messages = []
+        for m in range(args.per_chat):
+            text = ''.join(random.choice(sentences) for _ in range(random.randint(1, 8)))
+            total_chars += len(text)
+            messages.append({"role": "user" if m % 2 == 0 else "assistant", "content": text})
+        index.index_chat({"id": f"chat_{c}", "messages": messages})
+    build = time.perf_counter() - t0
+    stats = index.stats()
+    print(f"索引 {stats['messages']} 条消息 / {stats['chats']} 个对话 / {total_chars / 1e6:.1f}M 字符，"
+          f"{stats['terms']} 个词项")
+    print(f"建索引耗时 {build:.1f}s，进程内存增长约 {rss_mb() - base_rss:.0f} MB")
+
+    for query in QUERIES:
+        times = []
+        results = []
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            results = index.search(query, 20)
+            times.append(time.perf_counter() - t0)
+        times.sort()
+        print(f"  {query!r:<20} 结果 {len(results):>2}  p50={times[len(times) // 2] * 1000:7.2f}ms  "
+              f"p99={times[int(len(times) * 0.99) - 1] * 1000:7.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+/ws/chat 压测
+
+开启数百个并发 WebSocket 连接，每个连接循环发起新对话，按 --stop-ratio 的比例在生成途中发送 stop，
+统计:
+  吞吐       每秒收到的内容帧数 / 完成的对话数
+  延迟       首块延迟（发送 chat 到收到第一帧）与块间隔的 p50 / p99
+  取消       发送 stop 到收到 done 的耗时 p50 / p99
+  内存       server 进程 RSS：压测前、压测结束、静置后（取自 /metrics），以及静置后仍在进行的任务数
+--slow-ratio 比例的连接每读一帧停顿 --slow-delay 秒，模拟网络差 / 页面在后台的客户端，
+其统计单独列出，并报告 server 为其合并掉的内容块数（正常连接的块间隔不应受影响）。
+
+默认以 mock bot 后端（AIWORLD_BOT_BACKEND=mock）在临时目录中启动一个 server 子进程，
+对话历史写入临时目录，不影响 history_storage；也可以用 --url 压测已经在运行的 server。
+mock 回答的节奏由 config.MOCK_BOT 决定（默认 0.3s 思考、每 20ms 一块），--mock 可覆盖其中的项。
+
+用法: python bench/load_ws.py [--connections 200] [--duration 30] [--stop-ratio 0.2] [--protocol 2]
+      python bench/load_ws.py --url ws://127.0.0.1:8000/ws/chat
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+
+import websockets
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND)
+from config import MODEL_CONFIG  # noqa: E402
+
+
+class Stats:
+    def __init__(self):
+        self.ttfc = []
+        self.gaps = []
+        self.cancel = []
+        self.chunks = 0
+        self.bytes = 0
+        self.chats = 0
+        self.stopped = 0
+        self.errors = 0
+        self.queued = 0
+        self.failed_connections = 0
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run_chat(ws, stats: Stats, model: str, protocol: int, stop_ratio: float, stop_window: float,
+                   read_delay: float = 0):
+    chat_id = f"load_{uuid.uuid4().hex[:12]}"
+    await ws.send(json.dumps({"type": "chat", "model": model, "message": "压测消息", "chatId": chat_id,
+                              "protocol": protocol}))
+    sent = time.perf_counter()
+    stop_at = sent + random.uniform(0, stop_window) if random.random() < stop_ratio else None
+    stop_sent = None
+    last = None
+    while True:
+        timeout = max(0.0, stop_at - time.perf_counter()) if stop_at and not stop_sent else 60
+        try:
+            raw = await asyncio.wait_for(ws.recv(), timeout)
+        except asyncio.TimeoutError:
+            if stop_at and not stop_sent:
+                await ws.send(json.dumps({"type": "stop", "chatId": chat_id}))
+                stop_sent = time.perf_counter()
+                continue
+            stats.errors += 1
+            return
+        now = time.perf_counter()
+        frame = json.loads(raw)
+        if frame.get("chatId") != chat_id:
+            continue
+        if frame.get("type") == "done":
+            stats.chats += 1
+            if stop_sent:
+                stats.stopped += 1
+                stats.cancel.append(now - stop_sent)
+            return
+        if frame.get("type") == "error":
+            stats.errors += 1
+            return
+        if frame.get("type") == "queued":
+            # 生成数已达上限在排队，首块延迟照常从发送 chat 算起
+            stats.queued += 1
+            continue
+        stats.chunks += 1
+        stats.bytes += len(raw)
+        if last is None:
+            stats.ttfc.append(now - sent)
+        else:
+            stats.gaps.append(now - last)
+        last = now
+        if read_delay:
+            await asyncio.sleep(read_delay)
+        if frame.get("v") == 2:
+            # 与前端一样确认已处理的帧，server 据此流控
+            await ws.send(json.dumps({"type": "ack", "chatId": chat_id, "seq": frame["seq"]}))
+
+
+def small_buffer_socket(url: str):
+    """接收缓冲很小的 TCP 连接：本机回环的内核缓冲有数 MB，不缩小的话慢客户端的积压全被内核吸收，server 感知不到"""
+    host, port = re.match(r'wss?://([^:/]+):(\d+)', url).groups()
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.connect((host, int(port)))
+    sock.setblocking(False)
+    return sock
+
+
+async def connection(url: str, stats: Stats, deadline: float, models: list, args, read_delay: float = 0):
+    try:
+        # 慢客户端：客户端库只缓存少量消息、内核接收缓冲很小，背压直接传到 server；
+        # 同时关闭 permessage-deflate（快照帧与上一帧几乎相同，压缩后只有几个字节，积压不出来），
+        # 以及客户端心跳（pong 排在积压的数据之后，会被判定超时）
+        options = {"max_queue": 2, "sock": small_buffer_socket(url), "compression": None,
+                   "ping_interval": None} if read_delay else {}
+        async with websockets.connect(url, max_size=None, **options) as ws:
+            while time.perf_counter() < deadline:
+                await run_chat(ws, stats, random.choice(models), args.protocol, args.stop_ratio, args.stop_window,
+                               read_delay)
+    except (OSError, websockets.WebSocketException):
+        stats.failed_connections += 1
+
+
+def report(name: str, stats: Stats, elapsed: float):
+    print(f"  [{name}] 吞吐: {stats.chunks / elapsed:,.0f} 帧/s  {stats.bytes / elapsed / 1024:,.0f} KB/s  "
+          f"{stats.chats / elapsed:,.1f} 对话/s  (完成 {stats.chats}，其中停止 {stats.stopped}，排队 {stats.queued})")
+    print(f"    首块: p50={percentile(stats.ttfc, 0.5) * 1000:.1f}ms  p99={percentile(stats.ttfc, 0.99) * 1000:.1f}ms")
+    print(f"    块间隔: p50={percentile(stats.gaps, 0.5) * 1000:.1f}ms  p99={percentile(stats.gaps, 0.99) * 1000:.1f}ms")
+    print(f"    取消生效: p50={percentile(stats.cancel, 0.5) * 1000:.1f}ms  "
+          f"p99={percentile(stats.cancel, 0.99) * 1000:.1f}ms  ({len(stats.cancel)} 次)")
+
+
+def read_metrics(http_base: str) -> dict:
+    with urllib.request.urlopen(http_base + '/metrics', timeout=10) as resp:
+        text = resp.read().decode('utf-8')
+    values = {}
+    for name in ('process_resident_memory_bytes', 'aiworld_active_tasks', 'aiworld_ws_coalesced_total'):
+        match = re.search(rf'^{name} (\S+)$', text, re.M)
+        values[name] = float(match.group(1)) if match else None
+    return values
+
+
+def rss_mb(metrics: dict):
+    rss = metrics.get('process_resident_memory_bytes')
+    return f"{rss / 1024 / 1024:.0f} MB" if rss else "n/a"
+
+
+def spawn_server(mock_params: str = None):
+    """在临时目录中以 mock 后端启动 server，返回 (process, ws_url, http_base, 日志路径)"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    workdir = tempfile.mkdtemp(prefix='aiworld_load_')
+    log_path = os.path.join(workdir, 'server.log')
+    env = dict(os.environ, AIWORLD_BOT_BACKEND='mock')
+    if mock_params:
+        env['AIWORLD_MOCK_BOT'] = mock_params
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--app-dir', os.path.abspath(BACKEND),
+         '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=open(log_path, 'w'))
+    http_base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while True:
+        try:
+            read_metrics(http_base)
+            break
+        except OSError:
+            if process.poll() is not None or time.time() > deadline:
+                process.terminate()
+                raise RuntimeError(f"server 启动失败，见 {log_path}")
+            time.sleep(0.2)
+    return process, f"ws://127.0.0.1:{port}/ws/chat", http_base, log_path
+
+
+async def run_load(url: str, http_base: str, args):
+    stats, slow = Stats(), Stats()
+    models = args.models.split(',')
+    slow_count = int(args.connections * args.slow_ratio)
+    before = read_metrics(http_base)
+    start = time.perf_counter()
+    deadline = start + args.duration
+    tasks = []
+    for i in range(args.connections):
+        is_slow = i < slow_count
+        tasks.append(asyncio.create_task(connection(url, slow if is_slow else stats, deadline, models, args,
+                                                    args.slow_delay if is_slow else 0)))
+        await asyncio.sleep(args.ramp / args.connections)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    after = read_metrics(http_base)
+    await asyncio.sleep(args.settle)
+    settled = read_metrics(http_base)
+
+    print(f"{args.connections} 个连接（其中慢客户端 {slow_count} 个），{elapsed:.1f}s，"
+          f"stop 比例 {args.stop_ratio:.0%}，协议 v{args.protocol}")
+    report('正常连接', stats, elapsed)
+    if slow_count:
+        report('慢客户端', slow, elapsed)
+        coalesced = (settled.get('aiworld_ws_coalesced_total') or 0) - (before.get('aiworld_ws_coalesced_total') or 0)
+        print(f"  server 合并掉的内容块: {coalesced:.0f}")
+    print(f"  内存: 压测前 {rss_mb(before)} -> 结束 {rss_mb(after)} -> 静置 {args.settle:.0f}s 后 {rss_mb(settled)}；"
+          f"静置后进行中的任务 {settled.get('aiworld_active_tasks')}")
+    print(f"  错误: {stats.errors + slow.errors} 个 error 帧 / 超时，"
+          f"{stats.failed_connections + slow.failed_connections} 个连接失败")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='已运行的 server 的 WebSocket 地址，不填则以 mock 后端启动子进程')
+    parser.add_argument('--connections', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--ramp', type=float, default=2, help='在多少秒内逐步建立全部连接')
+    parser.add_argument('--stop-ratio', type=float, default=0.2)
+    parser.add_argument('--stop-window', type=float, default=2, help='stop 在发送 chat 后的 [0, N] 秒内随机发出')
+    parser.add_argument('--protocol', type=int, default=2)
+    parser.add_argument('--slow-ratio', type=float, default=0, help='慢客户端连接所占比例')
+    parser.add_argument('--slow-delay', type=float, default=0.2, help='慢客户端每读一帧后的停顿 (s)')
+    parser.add_argument('--models', default=','.join(MODEL_CONFIG))
+    parser.add_argument('--settle', type=float, default=3)
+    parser.add_argument('--mock', help='覆盖 MOCK_BOT 的 JSON，例如 \'{"length": 4000}\'')
+    args = parser.parse_args()
+
+    process = None
+    if args.url:
+        url = args.url
+        http_base = re.sub(r'^ws', 'http', url.split('/ws/')[0])
+    else:
+        process, url, http_base, log_path = spawn_server(args.mock)
+        print(f"mock server: {http_base}（日志 {log_path}）")
+    try:
+        asyncio.run(run_load(url, http_base, args))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟聊天页面
+
+一个不依赖外网的假聊天站点：页面有输入框、发送/停止按钮和回答容器，
+点击发送后页面通过 fetch 读取 /api/stream 的 SSE 流，把 token 逐个渲染进最新的回答框。
+供基准测试驱动 bot 使用（DOM 抓取与网络捕获两条路径都能跑）。
+
+/model/<名称>/ 为 MODEL_CONFIG 中的每个模型生成一个仿站页面：输入框、发送、停止按钮和回答框
+按该模型配置的（首选）CSS 选择器构造，停止按钮的表现也照搬选择器的写法：
+  与发送按钮相同      -> 同一个按钮，生成中点击即停止（DeepSeek / 豆包）
+  发送按钮加额外类名  -> 生成中给发送按钮加上这些类（Gemini / Kimi）
+  其他               -> 生成中出现一个独立的停止按钮（GPT）
+流式接口的路径和帧格式与模型的 'stream' 配置一致，网络捕获同样可以命中。
+页面把剧本（SCRIPTS）中的 Markdown 按 token 流式渲染成 HTML，可用查询参数调节：
+  script=markdown  tokens=0(不截断)  interval=20(ms/token)  ttft=300(ms，首 token 前的思考时间)
+回答结束时页面记录 window.__mockDoneAt（毫秒时间戳），供基准测试计算结束判定滞后。
+
+用法: python bench/mock_site.py [--port 8765]  然后浏览器打开 http://127.0.0.1:8765/model/gpt/
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from config import MODEL_CONFIG  # noqa: E402
+from dom_observer import css_of  # noqa: E402
+
+# 与页面结构对应的 bot 配置（格式同 MODEL_CONFIG）
+MOCK_CONF = {
+    'domain': '127.0.0.1',
+    'home_url': None,  # 启动后由 start_mock_server 填入
+    'selectors': {
+        'input': 'css:#prompt',
+        'send': 'css:#send',
+        'stop': 'css:#stop',
+        'answer': 'css:.answer'
+    },
+    'stream': {'url': r'/api/stream', 'parser': 'sse_json'},
+}
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Mock Chat</title></head>
+<body>
+<div id="thread"></div>
+<textarea id="prompt"></textarea>
+<button id="send">发送</button>
+<script>
+const params = new URLSearchParams(location.search);
+const tokens = params.get('tokens') || 200;
+const interval = params.get('interval') || 20;
+document.getElementById('send').addEventListener('click', async () => {
+  const prompt = document.getElementById('prompt').value;
+  const box = document.createElement('div');
+  box.className = 'answer';
+  const para = document.createElement('p');
+  box.appendChild(para);
+  document.getElementById('thread').appendChild(box);
+  const stop = document.createElement('button');
+  stop.id = 'stop';
+  document.body.appendChild(stop);
+  const res = await fetch(`/api/stream?tokens=${tokens}&interval=${interval}`,
+                          {method: 'POST', body: JSON.stringify({prompt})});
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const {value, done} = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, {stream: true});
+    const lines = buffer.split('\\n');
+    buffer = lines.pop();
+    for (const line of lines) {
+      if (!line.startsWith('data:') || line.includes('[DONE]')) continue;
+      para.textContent += JSON.parse(line.slice(5)).choices[0].delta.content;
+    }
+  }
+  stop.remove();
+});
+</script>
+</body></html>
+"""
+
+
+# --- 各模型的仿站页面 ---
+
+# 回答剧本（Markdown），页面按 token 流式渲染
+SCRIPTS = {
+    'short': "好的，这是一个简短的回答。今天天气不错，适合出门散步。",
+    'markdown': """## 快速排序
+
+快速排序是一种**分治**算法，平均时间复杂度为 `O(n log n)`。
+
+### 步骤
+
+1. 选择一个基准元素 (pivot)
+2. 把小于基准的元素放到左边，大于基准的放到右边
+3. 对左右两部分递归排序
+
+```python
+def quick_sort(arr):
+    if len(arr) <= 1:
+        return arr
+    pivot = arr[len(arr) // 2]
+    left = [x for x in arr if x < pivot]
+    middle = [x for x in arr if x == pivot]
+    right = [x for x in arr if x > pivot]
+    return quick_sort(left) + middle + quick_sort(right)
+```
+
+| 算法 | 平均复杂度 | 稳定 |
+| --- | --- | --- |
+| 快速排序 | O(n log n) | 否 |
+| 归并排序 | O(n log n) | 是 |
+
+- 优点：原地排序，常数小
+- 缺点：最坏情况退化为 `O(n²)`
+
+希望这对你有帮助！""",
+}
+SCRIPTS['long'] = '\n\n'.join([SCRIPTS['markdown']] * 6)
+
+# 近似真实分词：汉字 1~2 个一组，其他字符 1~4 个一组，前导空白并入下一个 token
+TOKEN_RE = re.compile(r'\s*[一-鿿]{1,2}|\s*[^\s一-鿿]{1,4}|\s+')
+
+
+def script_tokens(name: str, limit: int = 0) -> list:
+    """剧本切成 token；limit > 0 时循环拼接剧本直到凑满 limit 个"""
+    tokens = TOKEN_RE.findall(SCRIPTS[name])
+    if limit <= 0:
+        return tokens
+    result = list(tokens)
+    while len(result) < limit:
+        result += ['\n\n'] + tokens
+    return result[:limit]
+
+
+COMPOUND_RE = re.compile(r'([a-zA-Z][\w-]*)|#([\w-]+)|\.([\w-]+)|\[([\w-]+)(?:[*^$~|]?=\s*"?([^"\]]*)"?)?\]')
+
+
+def parse_css(selector, default_tag: str = 'div') -> list:
+    """把（首选的）CSS 选择器解析成要构造的元素链，只支持标签 / #id / .类名 / [属性] 和后代关系"""
+    if isinstance(selector, list):
+        selector = selector[0]
+    css = css_of(selector)
+    if css is None:
+        raise ValueError(f"模拟页面只支持 CSS 选择器: {selector}")
+    chain = []
+    for part in css.split():
+        if part == '>':
+            continue
+        node = {'tag': None, 'id': None, 'classes': [], 'attrs': {}}
+        for tag, id_, cls, attr, value in COMPOUND_RE.findall(part):
+            if tag:
+                node['tag'] = tag
+            elif id_:
+                node['id'] = id_
+            elif cls:
+                node['classes'].append(cls)
+            elif attr:
+                node['attrs'][attr] = value
+        chain.append(node)
+    for node in chain:
+        node['tag'] = node['tag'] or default_tag
+    return chain
+
+
+def stop_spec(send_chain: list, stop_chain: list) -> dict:
+    """按选择器的写法决定停止按钮的表现"""
+    if stop_chain == send_chain:
+        return {'mode': 'same'}
+    if len(stop_chain) == len(send_chain) and stop_chain[:-1] == send_chain[:-1]:
+        send, stop = send_chain[-1], stop_chain[-1]
+        if (stop['tag'], stop['id'], stop['attrs']) == (send['tag'], send['id'], send['attrs']) \
+                and set(send['classes']) < set(stop['classes']):
+            return {'mode': 'class', 'classes': [c for c in stop['classes'] if c not in send['classes']]}
+    return {'mode': 'separate', 'chain': stop_chain}
+
+
+def example_path(pattern: str) -> str:
+    """由 URL / 字段路径正则构造一个能匹配它的字面路径（可选分组去掉，多选分组取第一个）"""
+    text = pattern.strip('^$')
+    text = re.sub(r'\([^()]*\)\?', '', text)
+    text = re.sub(r'\(([^()|]*)(?:\|[^()]*)?\)', r'\1', text)
+    return text.replace('-?', '').replace(r'\d+', '0').replace('\\', '')
+
+
+def stream_spec(name: str, conf: dict) -> dict:
+    """流式接口的路径与帧格式，与模型的 'stream' 配置保持一致"""
+    spec = dict(conf.get('stream') or {'parser': 'sse_json'})
+    url = f"/model/{name}/stream"
+    if 'url' in spec:
+        candidate = f"/model/{name}" + example_path(spec['url'])
+        if re.search(spec['url'], candidate):
+            url = candidate
+    fmt = spec.get('parser', 'sse_json')
+    default_path = ['choices', 0, 'delta', 'content'] if fmt == 'sse_json' else ['content']
+    return {'url': url, 'format': fmt, 'path': spec.get('path', default_path),
+            'content_path': example_path(spec.get('content_path', 'content'))}
+
+
+def page_spec(name: str) -> dict:
+    conf = MODEL_CONFIG[name]
+    selectors = conf['selectors']
+    input_chain = parse_css(selectors['input'])
+    if len(input_chain) == 1 and input_chain[0]['tag'] == 'div' and 'editor' not in ' '.join(input_chain[0]['classes']):
+        input_chain[0]['tag'] = 'textarea'
+    send_chain = parse_css(selectors['send'], 'button')
+    return {
+        'input': input_chain,
+        'send': send_chain,
+        'stop': stop_spec(send_chain, parse_css(selectors['stop'], 'button')),
+        'answer': parse_css(selectors['answer']),
+        'stream': stream_spec(name, conf),
+    }
+
+
+def mock_conf(name: str, base_url: str) -> dict:
+    """指向本地仿站的模型配置（选择器、流式规则与 MODEL_CONFIG 相同）"""
+    conf = copy.deepcopy(MODEL_CONFIG[name])
+    conf['domain'] = urlparse(base_url).netloc
+    conf['home_url'] = f"{base_url}model/{name}/"
+    conf.pop('alt_domain', None)
+    return conf
+
+
+def model_url(base_url: str, name: str, **params) -> str:
+    query = '&'.join(f"{k}={v}" for k, v in params.items() if v is not None)
+    return f"{base_url}model/{name}/" + (f"?{query}" if query else '')
+
+
+def make_frame(stream: dict, token: str, first: bool) -> str:
+    fmt = stream['format']
+    if fmt == 'sse_patch':
+        obj = {'p': stream['content_path'], 'o': 'append', 'v': token} if first else {'v': token}
+        return f"data: {json.dumps(obj, ensure_ascii=False)}\n\n"
+    obj = token
+    for key in reversed(stream['path']):
+        obj = [None] * key + [obj] if isinstance(key, int) else {key: obj}
+    if fmt == 'ndjson':
+        return json.dumps(obj, ensure_ascii=False) + '\n'
+    return f"data: {json.dumps(obj, ensure_ascii=False)}\n\n"
+
+
+MODEL_PAGE = r"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Mock __NAME__</title></head>
+<body>
+<div id="thread"></div>
+<div id="composer"></div>
+<script>
+const SPEC = __SPEC__;
+const thread = document.getElementById('thread');
+const composer = document.getElementById('composer');
+
+function build(chain) {
+  let root = null, parent = null;
+  for (const node of chain) {
+    const el = document.createElement(node.tag);
+    if (node.id) el.id = node.id;
+    for (const c of node.classes) el.classList.add(c);
+    for (const [k, v] of Object.entries(node.attrs)) el.setAttribute(k, v);
+    if (parent) parent.appendChild(el); else root = el;
+    parent = el;
+  }
+  return [root, parent];
+}
+
+function esc(s) { return s.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;'); }
+function inline(s) {
+  return esc(s).replace(/\*\*(.+?)\*\*/g, '<strong>$1</strong>').replace(/`([^`]+)`/g, '<code>$1</code>');
+}
+// 够用的 Markdown 渲染：标题、段落、有序 / 无序列表、代码块、表格、粗体、行内代码
+function render(md) {
+  const out = [];
+  let para = [], list = null, code = null, table = null;
+  const closePara = () => { if (para.length) { out.push('<p>' + inline(para.join(' ')) + '</p>'); para = []; } };
+  const closeList = () => { if (list) { out.push('</' + list + '>'); list = null; } };
+  const closeTable = () => { if (table) { out.push('<table>' + table.join('') + '</table>'); table = null; } };
+  const closeAll = () => { closePara(); closeList(); closeTable(); };
+  for (const line of md.split('\n')) {
+    if (code !== null) {
+      if (line.startsWith('```')) { out.push('<pre><code>' + esc(code.join('\n')) + '</code></pre>'); code = null; }
+      else code.push(line);
+      continue;
+    }
+    let m;
+    if (line.startsWith('```')) { closeAll(); code = []; continue; }
+    if ((m = line.match(/^(#{1,6})\s+(.*)/))) { closeAll(); out.push(`<h${m[1].length}>${inline(m[2])}</h${m[1].length}>`); continue; }
+    if ((m = line.match(/^\s*(?:[-*]|(\d+)\.)\s+(.*)/))) {
+      const tag = m[1] ? 'ol' : 'ul';
+      closePara(); closeTable();
+      if (list !== tag) { closeList(); list = tag; out.push('<' + tag + '>'); }
+      out.push('<li>' + inline(m[2]) + '</li>');
+      continue;
+    }
+    if (line.trim().startsWith('|')) {
+      closePara(); closeList();
+      const cells = line.trim().replace(/^\||\|$/g, '').split('|').map(c => c.trim());
+      if (cells.every(c => /^:?-+:?$/.test(c))) continue;
+      const cell = table ? 'td' : 'th';
+      table = table || [];
+      table.push('<tr>' + cells.map(c => `<${cell}>${inline(c)}</${cell}>`).join('') + '</tr>');
+      continue;
+    }
+    if (!line.trim()) { closeAll(); continue; }
+    closeList(); closeTable();
+    para.push(line);
+  }
+  if (code !== null) out.push('<pre><code>' + esc(code.join('\n')) + '</code></pre>');
+  closeAll();
+  return out.join('');
+}
+
+function dig(obj, path) {
+  for (const key of path) { if (obj == null) return null; obj = obj[key]; }
+  return obj;
+}
+function extract(line) {
+  const fmt = SPEC.stream.format;
+  if (fmt !== 'ndjson') {
+    if (!line.startsWith('data:')) return null;
+    line = line.slice(5).trim();
+    if (!line || line === '[DONE]') return null;
+  } else if (!line.trim()) return null;
+  const obj = JSON.parse(line);
+  const value = fmt === 'sse_patch' ? obj.v : dig(obj, SPEC.stream.path);
+  return typeof value === 'string' ? value : null;
+}
+
+const [inputRoot, inputLeaf] = build(SPEC.input);
+if (inputRoot.tagName !== 'TEXTAREA' && inputRoot.tagName !== 'INPUT') inputRoot.contentEditable = 'true';
+composer.appendChild(inputRoot);
+const [sendBtn] = build(SPEC.send);
+sendBtn.textContent = sendBtn.textContent || '发送';
+composer.appendChild(sendBtn);
+
+let generating = false, controller = null, stopBtn = null;
+
+function setGenerating(on) {
+  generating = on;
+  const stop = SPEC.stop;
+  if (stop.mode === 'class') for (const c of stop.classes) sendBtn.classList.toggle(c, on);
+  if (stop.mode === 'separate') {
+    if (on) { stopBtn = build(stop.chain)[0]; stopBtn.textContent = '停止'; stopBtn.onclick = () => controller.abort(); composer.appendChild(stopBtn); }
+    else if (stopBtn) { stopBtn.remove(); stopBtn = null; }
+  }
+}
+
+async function send() {
+  const prompt = inputRoot.value !== undefined && inputRoot.tagName === 'TEXTAREA' ? inputRoot.value : inputRoot.innerText;
+  if (!prompt.trim()) return;
+  if (inputRoot.tagName === 'TEXTAREA') inputRoot.value = ''; else { inputRoot.innerHTML = ''; if (inputLeaf !== inputRoot) inputRoot.appendChild(build(SPEC.input.slice(1))[0]); }
+  const [box] = build(SPEC.answer);
+  thread.appendChild(box);
+  controller = new AbortController();
+  setGenerating(true);
+  let md = '';
+  try {
+    const res = await fetch(SPEC.stream.url + location.search, {method: 'POST', body: JSON.stringify({prompt}), signal: controller.signal});
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const {value, done} = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, {stream: true});
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      let changed = false;
+      for (const line of lines) {
+        const token = extract(line);
+        if (token) { md += token; changed = true; }
+      }
+      if (changed) box.innerHTML = render(md);
+    }
+  } catch (e) {
+    // 停止（AbortError）时保留已生成的部分
+  }
+  setGenerating(false);
+  window.__mockDoneAt = Date.now();
+}
+
+sendBtn.addEventListener('click', () => {
+  if (generating) { if (SPEC.stop.mode !== 'separate') controller.abort(); }
+  else send();
+});
+</script>
+</body></html>
+"""
+
+
+def model_page(name: str) -> bytes:
+    return (MODEL_PAGE.replace('__NAME__', name)
+            .replace('__SPEC__', json.dumps(page_spec(name), ensure_ascii=False))).encode('utf-8')
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _model_name(self):
+        parts = urlparse(self.path).path.split('/')
+        if len(parts) > 2 and parts[1] == 'model':
+            if parts[2] not in MODEL_CONFIG:
+                self.send_error(404)
+                return False
+            return parts[2]
+        return None
+
+    def do_GET(self):
+        name = self._model_name()
+        if name is False:
+            return
+        body = model_page(name) if name else PAGE.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        name = self._model_name()
+        if name is False:
+            return
+        if name:
+            self._stream_model(name)
+            return
+        query = parse_qs(urlparse(self.path).query)
+        tokens = int(query.get('tokens', ['200'])[0])
+        interval = float(query.get('interval', ['20'])[0]) / 1000
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        for i in range(tokens):
+            frame = {"choices": [{"delta": {"content": f"词{i} "}}]}
+            self.wfile.write(f"data: {json.dumps(frame, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(interval)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _stream_model(self, name: str):
+        """按模型的帧格式流式输出剧本（客户端中途停止时连接被断开，直接结束）"""
+        query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        tokens = script_tokens(query.get('script', 'markdown'), int(query.get('tokens', 0)))
+        interval = float(query.get('interval', 20)) / 1000
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        stream = stream_spec(name, MODEL_CONFIG[name])
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson' if stream['format'] == 'ndjson' else 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            time.sleep(float(query.get('ttft', 300)) / 1000)
+            for i, token in enumerate(tokens):
+                self.wfile.write(make_frame(stream, token, i == 0).encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(interval)
+            if stream['format'] != 'ndjson':
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_mock_server(port: int = 0):
+    """在后台线程启动模拟站点，返回 (server, base_url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    MOCK_CONF['home_url'] = base_url
+    return server, base_url
+
+
+def _serve_forever(port: int):
+    ThreadingHTTPServer(('127.0.0.1', port), MockHandler).serve_forever()
+
+
+def start_mock_process(port: int = 0):
+    """在独立进程中启动模拟站点（基准测试统计 CPU 时不计入站点自身），返回 (process, base_url)"""
+    if not port:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+    process = multiprocessing.Process(target=_serve_forever, args=(port,), daemon=True)
+    process.start()
+    deadline = time.time() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            break
+        except OSError:
+            if time.time() > deadline:
+                process.terminate()
+                raise RuntimeError("模拟站点进程启动失败")
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}/"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    server, url = start_mock_server(args.port)
+    print(f"模拟站点已启动: {url}")
+    for name in MODEL_CONFIG:
+        print(f"  {name:<10} {url}model/{name}/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器 I/O 层
+
+DrissionPage 的调用都是同步阻塞的 (CDP 往返、元素查找、time.sleep)。
+每个标签页分配一个专属的单线程执行器，所有针对该标签页的操作都在它自己的线程里串行执行，
+bot 通过 await TabWorker.run(...) 取得结果，asyncio 事件循环本身永不阻塞，
+不同模型的流也因此可以真正并行。
+提交到工作线程的函数在调用方的 contextvars 上下文中执行（日志中的 chatId / model 随之传递）。
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TabWorker:
+    """单个标签页的专属工作线程"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"tab-{name}")
+
+    async def run(self, fn, *args, **kwargs):
+        """在工作线程中执行同步函数并等待结果"""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务但不等待（用于停止按钮等可在同步上下文触发的操作）"""
+        return self.executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = False):
+        self.executor.shutdown(wait=wait)
+
+
+# Key: 标签页标识 (当前每个模型一个标签页，使用 model_name), Value: TabWorker
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def get_worker(key: str) -> TabWorker:
+    """获取 (必要时创建) 指定标签页的工作线程"""
+    with _workers_lock:
+        worker = _workers.get(key)
+        if worker is None:
+            worker = TabWorker(key)
+            _workers[key] = worker
+        return worker
+
+
+def shutdown_all(wait: bool = False):
+    """关闭所有工作线程 (服务退出时调用)"""
+    with _workers_lock:
+        workers = list(_workers.values())
+        _workers.clear()
+    for worker in workers:
+        worker.shutdown(wait=wait)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+自适应的生成结束判定
+
+以「停止按钮消失」为主信号：按钮出现过、且消失持续 stop_grace 秒、内容也静默了 silence_min 秒即判定结束。
+停止按钮不可靠的模型（停止与发送共用同一个选择器）或从未看到按钮时，改用内容静默窗口，
+窗口大小由该模型历史上观察到的 token 间隔分布决定（高分位数 × 系数，限制在 [silence_min, silence_max]）。
+每次判定都会记录检测滞后：判定时刻距离「真实结束」（最后一次内容变化 / 按钮消失）的时间。
+
+各参数可在 MODEL_CONFIG 的 'completion' 中按模型覆盖，见 DEFAULTS。
+"""
+import threading
+import time
+from collections import deque
+
+DEFAULTS = {
+    'stop_reliable': True,      # 停止按钮能否准确反映生成状态
+    'stop_grace': 0.3,          # 停止按钮消失需持续的时间（防抖）
+    'silence_min': 0.3,         # 判定结束前内容至少静默的时间
+    'silence_max': 3.0,         # 静默窗口上限（没有足够样本时也使用该值）
+    'silence_quantile': 0.99,   # 使用 token 间隔分布的分位数
+    'silence_factor': 1.5,      # 分位数的放大系数
+    'min_samples': 30,          # 样本数不足时使用 silence_max
+    'idle_timeout': 60,         # 内容长时间无变化的超时保护
+}
+
+
+class GapStats:
+    """某个模型最近若干次内容变化之间的间隔"""
+
+    def __init__(self, maxlen: int = 2000):
+        self.gaps = deque(maxlen=maxlen)
+        self.lags = deque(maxlen=200)
+        # 出现过停止按钮的生成次数：按钮通常会出现时，没看到按钮就不急于按静默窗口结束
+        self.stop_streams = 0
+        self._lock = threading.Lock()
+
+    def add_gap(self, gap: float):
+        with self._lock:
+            self.gaps.append(gap)
+
+    def add_lag(self, lag: float):
+        with self._lock:
+            self.lags.append(lag)
+
+    def quantile(self, q: float):
+        with self._lock:
+            if not self.gaps:
+                return None
+            ordered = sorted(self.gaps)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> dict:
+        with self._lock:
+            lags = sorted(self.lags)
+            samples = len(self.gaps)
+        return {
+            "gap_samples": samples,
+            "gap_p50": self.quantile(0.5),
+            "gap_p99": self.quantile(0.99),
+            "detections": len(lags),
+            "lag_p50": lags[len(lags) // 2] if lags else None,
+            "lag_max": lags[-1] if lags else None,
+        }
+
+
+# Key: model_name, Value: GapStats
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def gap_stats(model_name: str) -> GapStats:
+    with _stats_lock:
+        if model_name not in _stats:
+            _stats[model_name] = GapStats()
+        return _stats[model_name]
+
+
+def completion_summary() -> dict:
+    """各模型的 token 间隔分布与检测滞后"""
+    with _stats_lock:
+        items = list(_stats.items())
+    return {name: stats.summary() for name, stats in items}
+
+
+class CompletionDetector:
+    """单次生成的结束判定器"""
+
+    def __init__(self, model_name: str, overrides: dict = None):
+        self.model_name = model_name
+        self.params = dict(DEFAULTS)
+        self.params.update(overrides or {})
+        self.stats = gap_stats(model_name)
+
+        now = time.time()
+        self.started_at = now
+        self.last_change = now
+        self.has_content = False
+        self.stop_seen = False
+        self.stop_missing_since = None
+        self.reason = None
+        self.lag = None
+
+    def silence_window(self) -> float:
+        """根据历史 token 间隔分布计算的静默窗口"""
+        p = self.params
+        if len(self.stats.gaps) < p['min_samples']:
+            return p['silence_max']
+        q = self.stats.quantile(p['silence_quantile']) or p['silence_max']
+        return min(p['silence_max'], max(p['silence_min'], q * p['silence_factor']))
+
+    def on_content(self, now: float = None):
+        now = now or time.time()
+        if self.has_content:
+            self.stats.add_gap(now - self.last_change)
+        self.has_content = True
+        self.last_change = now
+        self.stop_missing_since = None
+
+    def on_stop_state(self, present: bool, now: float = None):
+        now = now or time.time()
+        if present:
+            if not self.stop_seen:
+                self.stats.stop_streams += 1
+            self.stop_seen = True
+            self.stop_missing_since = None
+        elif self.stop_missing_since is None:
+            self.stop_missing_since = now
+
+    def check(self, now: float = None) -> bool:
+        """返回是否判定结束；判定后 reason / lag 可用"""
+        now = now or time.time()
+        p = self.params
+        silence = now - self.last_change
+
+        if silence > p['idle_timeout']:
+            return self._finish('timeout', now, self.last_change)
+        if not self.has_content:
+            return False
+
+        if p['stop_reliable'] and self.stop_seen:
+            if self.stop_missing_since is None:
+                return False
+            if now - self.stop_missing_since >= p['stop_grace'] and silence >= p['silence_min']:
+                return self._finish('stop_button', now, max(self.last_change, self.stop_missing_since))
+            return False
+
+        # 停止按钮不可用：按静默窗口判定（按钮仍在时不结束，除非标记为不可靠）
+        if p['stop_reliable'] and self.stop_missing_since is None:
+            return False
+        window = self.silence_window()
+        if p['stop_reliable'] and self.stats.stop_streams:
+            # 该模型平时会显示停止按钮，这次还没看到，可能只是按钮尚未渲染，使用保守的窗口
+            window = p['silence_max']
+        if silence >= window:
+            return self._finish('silence', now, self.last_change)
+        return False
+
+    def next_check_in(self, now: float = None) -> float:
+        """距离下一个可能改变判定结果的时间点，用于推送模式下设置等待超时"""
+        now = now or time.time()
+        p = self.params
+        candidates = [p['silence_min'] - (now - self.last_change), self.silence_window() - (now - self.last_change)]
+        if self.stop_missing_since is not None:
+            candidates.append(p['stop_grace'] - (now - self.stop_missing_since))
+        future = [c for c in candidates if c > 0]
+        return min(future) if future else 0.05
+
+    def _finish(self, reason: str, now: float, real_end: float) -> bool:
+        self.reason = reason
+        self.lag = max(0.0, now - real_end)
+        if reason != 'timeout':
+            self.stats.add_lag(self.lag)
+        return True
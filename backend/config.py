@@ -1,16 +1,126 @@
-from DrissionPage import ChromiumOptions
+import json
+import os
 
+# --- 浏览器基础配置 ---
+CHROME_PATH = r'C:\Program Files\Google\Chrome\Application\chrome.exe'
+# 启动时由 warmup.ensure_browser_path 写入 DrissionPage 配置文件（路径未变时不写）
 
-path = r'C:\Program Files\Google\Chrome\Application\chrome.exe'
-ChromiumOptions().set_browser_path(path).save()
+# --- 启动预热 ---
+# server 启动后在后台启动浏览器，并行打开所有模型的标签页（含池中的每个标签页）；False 时在第一条消息时才打开
+WARMUP_TABS = True
+# 标签页就绪（输入框出现）的最长等待时间（秒）
+TAB_READY_TIMEOUT = 30
+# 浏览器仍在启动时，对话请求最多等待的时间（秒）
+BROWSER_START_TIMEOUT = 60
 
+# --- bot 后端 ---
+# "browser": 驱动真实站点；"mock": 不启动浏览器，由 MockBot 按 MOCK_BOT 参数生成脚本化回答（压测 / 前端联调）
+# 可用环境变量 AIWORLD_BOT_BACKEND 覆盖，便于压测脚本直接启动 server
+BOT_BACKEND = os.environ.get("AIWORLD_BOT_BACKEND", "browser")
+# mock 回答参数：首块前的思考时间与块间隔（秒）、每块字符数、回答总长度（字符）
+# 环境变量 AIWORLD_MOCK_BOT（JSON）可覆盖其中的项，例如 '{"length": 4000}'
+MOCK_BOT = {"ttft": 0.3, "interval": 0.02, "chunk_chars": 4, "length": 800,
+            **json.loads(os.environ.get("AIWORLD_MOCK_BOT", "{}"))}
 
-from DrissionPage import ChromiumOptions
+# --- WebSocket 发送队列 ---
+# 每个连接待发送内容的上限（按字符数估算）；超出后同一对话尚未发出的内容块被最新内容替换（done / error 不受影响）
+WS_SEND_QUEUE_BYTES = 256 * 1024
+# 增量协议的客户端回复 ack 后，每个流最多有多少帧已发出但未确认；达到后暂停发送该对话的内容，期间的新内容合并成一块
+WS_ACK_WINDOW = 4
 
-# --- 浏览器基础配置 ---
-CHROME_PATH = r'C:\Program Files\Google\Chrome\Application\chrome.exe'
-# 初始化配置（如果需要在导入时就生效，保留此行；通常建议在 main.py 或使用处调用）
-ChromiumOptions().set_browser_path(CHROME_PATH).save()
+# --- 提示词输入 ---
+# 默认写入方式（value / paste / insert / type，见 prompt_input.py），单个模型可在 MODEL_CONFIG 中用 'input_mode' 覆盖
+INPUT_MODE = "insert"
+# 写入后等待编辑器内容与提示词一致的最长时间（秒），超时则换下一种方式
+INPUT_VERIFY_TIMEOUT = 1.0
+
+# --- 日志 ---
+# "json": 每行一个 JSON 事件（便于采集）；"text": 便于阅读的单行文本
+LOG_FORMAT = "json"
+LOG_LEVEL = "INFO"
+
+# --- 流式监听配置 ---
+# 是否向模型标签页注入 MutationObserver，由页面主动推送变化（失败时自动回退到 200ms 轮询）
+# 单个模型可以在 MODEL_CONFIG 中用 'dom_observer': False 关闭
+DOM_OBSERVER = True
+
+# --- 标签页池配置 ---
+# 每个模型默认打开的标签页数量（单个模型可在 MODEL_CONFIG 中用 'tabs' 覆盖）
+TAB_POOL_SIZE = 1
+# 标签页全部占用时最多排队的请求数，超出直接拒绝
+TAB_POOL_MAX_QUEUE = 8
+# 排队等待标签页的超时时间（秒）
+TAB_POOL_WAIT_TIMEOUT = 120
+# 每个模型最多记住多少个对话所在的标签页与会话 URL（最久未使用的先淘汰，淘汰后追问按新对话处理）
+TAB_AFFINITY_MAX = 1000
+
+# --- 精简模式 ---
+# 标签页打开时拦截图片 / 字体 / 媒体和埋点上报、降低渲染开销（见 lean_mode.py），只影响页面展示，不影响读取文字
+# 单个模型可在 MODEL_CONFIG 中用 'lean' 覆盖开关，用 'lean_block_urls' 追加要屏蔽的地址
+# 登录页的验证码等依赖图片，需要在浏览器里登录时先关闭
+LEAN_MODE = False
+# 拦截的资源类型（CDP Network.ResourceType）
+LEAN_BLOCK_TYPES = ["Image", "Font", "Media"]
+# 屏蔽的 URL 通配符（埋点、监控上报、广告）
+LEAN_BLOCK_URLS = [
+    "*google-analytics.com/*",
+    "*googletagmanager.com/*",
+    "*doubleclick.net/*",
+    "*.sentry.io/*",
+    "*browser-intake-datadoghq.com/*",
+    "*api.segment.io/*",
+    "*.hotjar.com/*",
+]
+# 视口大小（None 表示不修改）；是否声明 prefers-reduced-motion 让站点关闭动画
+LEAN_VIEWPORT = {"width": 1280, "height": 800}
+LEAN_REDUCED_MOTION = True
+
+# --- 标签页生命周期 ---
+# 每次生成结束后通过 CDP 采样标签页的 DOM 节点数与 JS 堆，达到任一预算时在后台回收标签页（回收完成前不交给下一个请求）
+# turns: 页面加载后完成的生成轮数；dom_nodes: DOM 节点数；js_heap_mb: JS 堆已用大小（MB）；0 表示不限制
+# 单个模型可在 MODEL_CONFIG 中用 'tab_budget' 覆盖其中的项
+TAB_BUDGET = {"turns": 30, "dom_nodes": 60000, "js_heap_mb": 400}
+# 回收方式："navigate" 在原标签页打开新对话页；"new_tab" 新建标签页后关闭旧的
+TAB_RECYCLE_MODE = "navigate"
+
+# --- 生成并发控制 ---
+# 同时进行的生成总数上限，以及每个模型的默认上限（单个模型可在 MODEL_CONFIG 中用 'max_concurrent' 覆盖）
+MAX_CONCURRENT_CHATS = 32
+MAX_CONCURRENT_PER_MODEL = 8
+# 达到上限时请求按连接轮转排队，超过该时间（秒）仍未轮到则返回错误
+CHAT_QUEUE_TIMEOUT = 60
+
+# --- 批量任务 ---
+# 任务定义（<job_id>.json）与结果（<job_id>.jsonl）所在目录
+JOBS_DIR = "batch_jobs"
+# 每个模型同时进行的批量条目数（单个模型可在 MODEL_CONFIG 中用 'batch_concurrency' 覆盖）
+BATCH_CONCURRENCY = 2
+# 每个条目最多尝试的次数；首次重试前等待 BATCH_RETRY_DELAY 秒，之后每次翻倍
+BATCH_MAX_ATTEMPTS = 3
+BATCH_RETRY_DELAY = 5
+
+# --- 多进程分片配置 ---
+# 大于 0 时启动对应数量的浏览器工作进程，每个进程一个独立的 Chromium（自动分配端口）
+# 0 表示在 server 进程内直接使用单个浏览器
+SHARDS = 0
+# 各分片浏览器的用户数据目录（每个分片一个子目录，保留登录状态）
+SHARD_DATA_DIR = "browser_data"
+
+# --- 对话历史存储 ---
+# "file": history_storage 下每个对话一个 JSON 文件；"sqlite": 单个 SQLite 库（WAL 模式）
+# 切换到 sqlite 时，如果库为空会自动导入 HISTORY_DIR 中已有的 JSON 文件
+HISTORY_BACKEND = "file"
+HISTORY_DIR = "history_storage"
+HISTORY_DB = "history.db"
+# 文件存储下按 mtime 扫描目录、发现外部修改的间隔（秒）
+HISTORY_SCAN_INTERVAL = 10
+
+# --- 回答缓存 ---
+# 新对话第一条消息按 (模型, 规范化提问) 缓存回答，相同提问直接回放；正在生成的相同提问合并为一次生成
+# 命中缓存的对话在浏览器里没有对应会话，后续追问模型看不到这一轮，因此默认关闭（见 response_cache.py）
+RESPONSE_CACHE = False
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
 
 # --- 模型抓取配置 ---
 # 集中管理 URL 和 CSS 选择器
@@ -18,6 +128,20 @@ ChromiumOptions().set_browser_path(CHROME_PATH).save()
 # domain: 用于查找已有标签页的域名片段
 # home_url: 如果没找到标签页，新开页面的地址
 # selectors: 页面元素选择器，支持字符串或列表（列表用于存放备用选择器）
+#   turn: (可选) 每一轮对话的容器，配置后只在最新的轮次中查找回答（见 page_probe.py）
+# dom_observer: (可选) 覆盖全局 DOM_OBSERVER 开关
+# tabs: (可选) 该模型的标签页池大小，覆盖全局 TAB_POOL_SIZE
+# stream: (可选) 网络层捕获规则，直接从流式补全请求中读取文本，失败时回退到 DOM 抓取
+#   url: 流式请求 URL 的正则；parser: 帧解析器 (sse_json / ndjson / sse_patch，见 network_capture.py)
+#   path / content_path: 解析器参数，指定增量文本在帧中的位置
+# cache: (可选) 设为 False 时该模型不使用回答缓存
+# input_mode: (可选) 提示词写入方式，覆盖全局 INPUT_MODE（textarea 用 value，富文本编辑器用 paste）
+# batch_concurrency: (可选) 该模型同时进行的批量条目数，覆盖全局 BATCH_CONCURRENCY
+# max_concurrent: (可选) 该模型同时进行的生成上限，覆盖全局 MAX_CONCURRENT_PER_MODEL
+# tab_budget: (可选) 覆盖全局 TAB_BUDGET 中的项，例如 {'turns': 10}
+# lean: (可选) True / False 覆盖全局 LEAN_MODE；lean_block_urls: (可选) 该模型额外屏蔽的 URL 通配符
+# completion: (可选) 结束判定参数覆盖，见 completion.py 的 DEFAULTS
+#   停止按钮与发送按钮共用选择器的站点应设置 'stop_reliable': False，改用静默窗口判定
 MODEL_CONFIG = {
     'deepseek': {
         'domain': 'chat.deepseek.com',
@@ -27,6 +151,13 @@ MODEL_CONFIG = {
             'send': 'css:._7436101',
             'stop': 'css:._7436101', #aria-disabled="false"
             'answer': 'css:.ds-markdown'
+        },
+        'input_mode': 'value',
+        'completion': {'stop_reliable': False},
+        'stream': {
+            'url': r'/api/v0/chat/completion',
+            'parser': 'sse_patch',
+            'content_path': r'response/(content|fragments/-?\d+/content)$'
         }
     },
     'gpt': {
@@ -37,7 +168,15 @@ MODEL_CONFIG = {
             'input': ['css:#prompt-textarea p', 'css:#prompt-textarea'],
             'send': ['css:#composer-submit-button', 'css:[data-testid="send-button"]'],
             'stop': 'css:[data-testid="stop-button"]',
-            'answer': 'css:.markdown.markdown-new-styling'
+            'answer': 'css:.markdown.markdown-new-styling',
+            'turn': 'css:article[data-testid^="conversation-turn-"]'
+        },
+        'input_mode': 'paste',
+        'lean_block_urls': ['*chatgpt.com/ces/*'],
+        'stream': {
+            'url': r'/backend-api/(f/)?conversation$',
+            'parser': 'sse_patch',
+            'content_path': r'^/message/content/parts/0$'
         }
     },
     'doubao': {
@@ -48,7 +187,9 @@ MODEL_CONFIG = {
             'send': 'css:#flow-end-msg-send',
             'stop': 'css:#flow-end-msg-send',
             'answer': 'css:.container-P2rR72'
-        }
+        },
+        'input_mode': 'value',
+        'completion': {'stop_reliable': False}
     },
     'gemini': {
         'domain': 'gemini.google.com',
@@ -57,8 +198,11 @@ MODEL_CONFIG = {
             'input': ['css:.ql-editor.textarea p', 'css:.ql-editor.textarea'],
             'send': 'css:.send-button',
             'stop': 'css:.send-button.stop',
-            'answer': 'css:.markdown.markdown-main-panel'
-        }
+            'answer': 'css:.markdown.markdown-main-panel',
+            'turn': 'css:.conversation-container'
+        },
+        'input_mode': 'paste',
+        'lean_block_urls': ['*play.google.com/log*']
     },
     'kimi': {
         'domain': 'kimi.com',
@@ -67,7 +211,9 @@ MODEL_CONFIG = {
             'input': 'css:.chat-input-editor',
             'send': 'css:.send-button-container',
             'stop': 'css:.send-button-container.stop',
-            'answer': 'css:.markdown'
-        }
+            'answer': 'css:.markdown',
+            'turn': 'css:.chat-content-item'
+        },
+        'input_mode': 'paste'
     }
 }
\ No newline at end of file
@@ -7,7 +7,19 @@ import asyncio
 import re
 
 # 引入配置文件
-from config import MODEL_CONFIG
+from config import MODEL_CONFIG, DOM_OBSERVER, BOT_BACKEND, MOCK_BOT, TAB_READY_TIMEOUT
+from markdown_stream import IncrementalMarkdown
+from browser_io import get_worker
+from dom_observer import AnswerObserver
+from network_capture import NetworkCapture, CaptureFailed
+from completion import CompletionDetector
+from page_probe import PageProbe, selector_cache
+from prompt_input import fill_prompt
+from lean_mode import open_tab
+from logs import get_logger
+from metrics import span, observe_stage
+
+log = get_logger('bot')
 
 class BaseBot(ABC):
     def __init__(self, page: ChromiumPage, model_name: str = None):
@@ -15,44 +27,151 @@ class BaseBot(ABC):
         self.tab = None
         self.conf = MODEL_CONFIG.get(model_name) if model_name else None
         self.model_name = model_name
+        # 该模型标签页的专属工作线程，所有 DrissionPage 调用都经由它执行
+        self.io = get_worker(model_name or 'default')
+        # 各角色上次命中的选择器（同一模型的所有 bot 共享）
+        self.selector_cache = selector_cache(model_name or 'default')
+        self._probe = None
+
+    def attach(self, slot):
+        """绑定到标签页池分配的标签页及其工作线程"""
+        self.tab = slot.tab
+        self.io = slot.worker
 
     @abstractmethod
     def activate_tab(self):
+        """[工作线程] 查找或新建该模型的标签页"""
         pass
 
-    @abstractmethod
-    def stream_chat(self, message: str):
-        pass
+    def _open_new_tab(self):
+        """[工作线程] 新建该模型的标签页（按配置开启精简模式），等到输入框出现"""
+        self.tab = open_tab(self.page, self.conf['home_url'], self.model_name, self.conf)
+        if not self.wait_ready():
+            log.warning("标签页未就绪：等待输入框超时", model=self.model_name, timeout=TAB_READY_TIMEOUT)
+
+    def wait_ready(self, timeout: float = TAB_READY_TIMEOUT) -> bool:
+        """[工作线程] 等待页面出现输入框（不计入选择器命中统计），超时返回 False"""
+        selectors = self.selector_cache.ordered('input', self.conf['selectors']['input'])
+        deadline = time.time() + timeout
+        while True:
+            if any(self.tab.ele(sel, timeout=0) for sel in selectors):
+                return True
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    async def stream_chat(self, message: str):
+        """通用的发送 + 流式监听逻辑，所有浏览器操作都在该标签页的工作线程中执行"""
+        if not self.tab:
+            with span('activate_tab', self.model_name):
+                await self.io.run(self.activate_tab)
+        log.info("发送消息", model=self.model_name, chars=len(message))
+        # 声明了流式请求规则的模型，在发送前开启网络捕获
+        capture = await self._start_capture()
+        try:
+            with span('send', self.model_name):
+                existing_count = await self.io.run(self._send_message, message)
+        except Exception as e:
+            if capture: self.io.submit(capture.stop)
+            yield f"Error: {e}"; return
+        if existing_count is None:
+            if capture: self.io.submit(capture.stop)
+            yield "Error: 找不到输入框"; return
+
+        sent_at = time.perf_counter()
+        if capture:
+            try:
+                async for chunk in self._timed(capture.stream(), sent_at):
+                    yield chunk
+                return
+            except CaptureFailed as e:
+                log.warning("网络捕获失败，回退到 DOM 监听", model=self.model_name, error=str(e))
+            finally:
+                self.io.submit(capture.stop)
+
+        with span('answer_box', self.model_name):
+            answer_box = await self._wait_for_answer_box(existing_count)
+        if not answer_box: yield ""; return
+
+        async for chunk in self._timed(self._robust_stream_loop(answer_box, self.conf['selectors']['answer']), sent_at):
+            yield chunk
+
+    async def _timed(self, chunks, sent_at: float):
+        """记录发送后到首个内容块、以及到生成结束的耗时"""
+        first = True
+        async for chunk in chunks:
+            if first and chunk:
+                observe_stage('first_chunk', time.perf_counter() - sent_at, self.model_name)
+                first = False
+            yield chunk
+        observe_stage('generation', time.perf_counter() - sent_at, self.model_name)
+
+    async def _start_capture(self):
+        """按 MODEL_CONFIG 中的 'stream' 规则开启网络层捕获，未配置或失败时返回 None"""
+        spec = self.conf.get('stream')
+        if not spec:
+            return None
+        capture = NetworkCapture(self.tab, spec, asyncio.get_running_loop())
+        if await self.io.run(capture.start):
+            return capture
+        return None
+
+    def _send_message(self, message: str):
+        """[工作线程] 输入并发送消息，返回发送前的回答数量（探针按轮次容器计数时为轮次数）；找不到输入框时返回 None"""
+        probe = self._get_probe()
+        if probe:
+            existing_count = probe.run()['count']
+        else:
+            existing_count = len(self.tab.eles(self.conf['selectors']['answer']))
+
+        input_ele = self._get_ele(self.conf['selectors']['input'], 'input')
+        if not input_ele: return None
+        # 整段写入并读回确认，代替逐字输入后固定等待
+        with span('input', self.model_name):
+            mode = fill_prompt(self.tab, input_ele, message, self.model_name, self.conf.get('input_mode'))
+        if not mode:
+            log.warning("输入框内容与提示词不一致，仍然发送", model=self.model_name, chars=len(message))
+
+        send_btn = self._get_ele(self.conf['selectors']['send'], 'send', wait=False)
+        if send_btn: send_btn.click()
+        else: input_ele.input('\n')
+        return existing_count
 
     def stop_generation(self):
-        """通用的停止生成逻辑"""
-        print(f"[{self.model_name}] 尝试停止生成...")
+        """通用的停止生成逻辑（提交到标签页工作线程，不阻塞调用方）"""
+        log.info("尝试停止生成", model=self.model_name)
         if not self.tab or not self.conf: return
+        self.io.submit(self._click_stop)
 
+    def _click_stop(self):
+        """[工作线程] 点击停止按钮"""
         try:
             stop_selector = self.conf['selectors']['stop']
-            stop_btn = self._get_ele(stop_selector)
+            stop_btn = self._get_ele(stop_selector, 'stop', wait=False)
 
             if stop_btn:
                 stop_btn.click()
-                print(f"[{self.model_name}] 已点击停止按钮")
+                log.info("已点击停止按钮", model=self.model_name)
             else:
-                print(f"[{self.model_name}] 未找到停止按钮")
+                log.warning("未找到停止按钮", model=self.model_name)
         except Exception as e:
-            print(f"[{self.model_name}] 停止操作失败: {e}")
+            log.error("停止操作失败", model=self.model_name, error=str(e))
 
-    def _safe_to_markdown(self, content: str) -> str:
-        """智能判断内容类型并转换为 Markdown"""
+    def _safe_to_markdown(self, content: str, converter: IncrementalMarkdown = None) -> str:
+        """智能判断内容类型并转换为 Markdown（流式场景传入增量转换器，只重算最后一个块）"""
         if not content: return ""
         html_pattern = re.compile(r'<(p|div|span|pre|code|br|ul|ol|li|h[1-6]|table|blockquote|em|strong|b|i)\b', re.IGNORECASE)
         if not html_pattern.search(content): return content
         try:
+            if converter: return converter.convert(content)
             return md(content, heading_style="atx")
         except Exception:
             return content
 
-    def _get_ele(self, selector_config):
-        """辅助函数：根据配置获取元素"""
+    def _get_ele(self, selector_config, role: str = None, wait: bool = True):
+        """辅助函数：根据配置获取元素（指定角色时优先尝试上次命中的选择器）"""
+        if role:
+            return self.selector_cache.resolve(self.tab, role, selector_config, wait)
         if isinstance(selector_config, list):
             for sel in selector_config:
                 ele = self.tab.ele(sel)
@@ -61,89 +180,137 @@ class BaseBot(ABC):
         else:
             return self.tab.ele(selector_config)
 
-    def _wait_for_answer_box(self, existing_count, timeout=10):
+    def _get_probe(self):
+        """[工作线程] 当前标签页的单次往返探针，选择器不全是 CSS 时返回 None"""
+        if self._probe is None or self._probe.tab is not self.tab:
+            self._probe = PageProbe(self.tab, self.model_name, self.conf['selectors'])
+        return self._probe if self._probe.available else None
+
+    def _latest_answer(self, answer_selector, existing_count=0):
+        """
+        [工作线程] 回答数量超过 existing_count 时返回最新的回答框，否则返回 None。
+        探针模式下返回探针本身，之后每次轮询都由探针直接读取最新的回答（配置了轮次容器时只看新增的轮次）
+        """
+        probe = self._get_probe()
+        if probe:
+            probe.since = existing_count
+            return probe if probe.run()['fresh'] else None
+        current_answers = self.tab.eles(answer_selector)
+        if len(current_answers) > existing_count:
+            return current_answers[-1]
+        return None
+
+    async def _wait_for_answer_box(self, existing_count, timeout=10):
         """等待新回答框出现的通用逻辑"""
         answer_selector = self.conf['selectors']['answer']
         wait_start = time.time()
         while time.time() - wait_start < timeout:
-            current_answers = self.tab.eles(answer_selector)
-            if len(current_answers) > existing_count:
-                return current_answers[-1]
-            time.sleep(0.2)
+            answer_box = await self.io.run(self._latest_answer, answer_selector, existing_count)
+            if answer_box:
+                return answer_box
+            await asyncio.sleep(0.2)
 
-        current_answers = self.tab.eles(answer_selector)
-        if current_answers:
-            return current_answers[-1]
+        return await self.io.run(self._latest_answer, answer_selector)
+
+    def _poll_answer(self, answer_box, answer_selector, refresh, previous_len, converter):
+        """
+        [工作线程] 单次轮询：必要时刷新回答框、读取内容、转换 Markdown、检查停止按钮。
+        返回 (answer_box, current_len, markdown 或 None, is_generating)
+        """
+        if isinstance(answer_box, PageProbe):
+            # 一次 JS 调用同时取得最新回答（长度变化时才带 HTML）和停止按钮状态
+            state = answer_box.run(previous_len)
+            markdown_content = None
+            if state['len'] > previous_len:
+                with span('markdown', self.model_name):
+                    markdown_content = self._safe_to_markdown(state['html'], converter)
+            return answer_box, state['len'], markdown_content, state['present']
+
+        # [关键优化] 元素保活：解决页面局部重绘导致持有的 element 失效的问题
+        if refresh:
+            try:
+                latest_answers = self.tab.eles(answer_selector)
+                if latest_answers:
+                    answer_box = latest_answers[-1]
+            except:
+                pass # 忽略刷新失败
+
+        current_html = answer_box.inner_html
+        current_len = len(current_html)
+        markdown_content = None
+        if current_len > previous_len:
+            with span('markdown', self.model_name):
+                markdown_content = self._safe_to_markdown(current_html, converter)
+
+        is_generating = bool(self._get_ele(self.conf['selectors']['stop'], 'stop', wait=False))
+        return answer_box, current_len, markdown_content, is_generating
+
+    async def _start_observer(self):
+        """按配置注入 MutationObserver，失败或关闭时返回 None（使用轮询）"""
+        if not self.conf.get('dom_observer', DOM_OBSERVER):
+            return None
+        observer = AnswerObserver(self.tab, self.conf['selectors'], asyncio.get_running_loop())
+        if await self.io.run(observer.install):
+            return observer
         return None
 
+    async def _wait_for_change(self, observer, detector):
+        """推送模式下等待页面变化事件（最多等到下一个可能结束的时间点），否则固定轮询间隔"""
+        if observer:
+            await observer.wait(min(0.5, detector.next_check_in()))
+        else:
+            await asyncio.sleep(0.2)
+
     async def _robust_stream_loop(self, answer_box, answer_selector):
         """
         核心优化：稳健的流式监听循环
-        包含：元素保活、双重防抖退出、超时保护
+        包含：元素保活、自适应结束判定、超时保护
         """
-        previous_len = 0
-
-        # 初始缓冲，等待 UI 稳定 (新聊天尤其重要)
-        time.sleep(2)
+        # 每个回答流独立的增量转换器，缓存已闭合块的 Markdown
+        converter = IncrementalMarkdown(heading_style="atx")
+        observer = await self._start_observer()
+        try:
+            async for chunk in self._watch_answer(answer_box, answer_selector, converter, observer):
+                yield chunk
+        finally:
+            if observer:
+                self.io.submit(observer.close)
 
-        # 计时器初始化
-        last_content_change_time = time.time()
-        stop_btn_missing_start_time = None # 记录停止按钮开始消失的时间点
+    async def _watch_answer(self, answer_box, answer_selector, converter, observer):
+        previous_len = 0
+        # 以停止按钮消失为主信号、按 token 间隔分布自适应静默窗口的结束判定
+        detector = CompletionDetector(self.model_name, self.conf.get('completion'))
 
         while True:
             try:
-                # [关键优化] 元素保活：如果 2秒 没动静，尝试重新获取最新的 answer_box
-                # 解决页面局部重绘导致持有的 element 失效的问题
-                if time.time() - last_content_change_time > 2:
-                    try:
-                        latest_answers = self.tab.eles(answer_selector)
-                        if latest_answers:
-                            answer_box = latest_answers[-1]
-                    except:
-                        pass # 忽略刷新失败
-
-                # 获取内容
-                current_html = answer_box.inner_html
-                current_len = len(current_html)
+                # 如果 2秒 没动静，轮询时顺便重新获取最新的 answer_box
+                refresh = time.time() - detector.last_change > 2
+                answer_box, current_len, markdown_content, is_generating = await self.io.run(
+                    self._poll_answer, answer_box, answer_selector, refresh, previous_len, converter
+                )
 
                 # --- 状态检查 1：内容变化 ---
-                if current_len > previous_len:
-                    markdown_content = self._safe_to_markdown(current_html)
+                if markdown_content is not None:
                     yield markdown_content
                     previous_len = current_len
-                    last_content_change_time = time.time() # 重置内容静默计时
-                    stop_btn_missing_start_time = None # 内容在变，说明还在生成
+                    detector.on_content()
 
                 # --- 状态检查 2：停止按钮 ---
-                is_generating = self._get_ele(self.conf['selectors']['stop'])
-
-                if not is_generating:
-                    if stop_btn_missing_start_time is None:
-                        stop_btn_missing_start_time = time.time()
-                else:
-                    stop_btn_missing_start_time = None # 按钮出现了，重置消失计时
-
-                # --- 计算持续时间 ---
-                content_silence_duration = time.time() - last_content_change_time
-
-                btn_missing_duration = 0
-                if stop_btn_missing_start_time:
-                    btn_missing_duration = time.time() - stop_btn_missing_start_time
-
-                # --- 退出判定 (双重防抖) ---
-                # 条件：内容 3秒没变 AND 停止按钮 持续消失超过 2秒
-                if content_silence_duration > 3 and btn_missing_duration > 2:
-                    print(f"[{self.model_name}] 生成结束 (静默+按钮消失确认)")
-                    break
-
-                # --- 超时保护 ---
-                if content_silence_duration > 60:
-                    print(f"[{self.model_name}] 超时退出 (60s无响应)")
+                detector.on_stop_state(is_generating)
+
+                # --- 退出判定 ---
+                if detector.check():
+                    if detector.reason == 'timeout':
+                        log.warning("超时退出", model=self.model_name, idle_timeout=detector.params['idle_timeout'])
+                    else:
+                        observe_stage('completion_lag', detector.lag, self.model_name)
+                        log.info("生成结束", model=self.model_name, reason=detector.reason,
+                                 lag_ms=round(detector.lag * 1000))
                     break
 
-                await asyncio.sleep(0.2)
+                await self._wait_for_change(observer, detector)
             except Exception as e:
-                print(f"监听异常: {e}")
+                log.error("监听异常", model=self.model_name, error=str(e))
                 break
 
 class DeepSeekBot(BaseBot):
@@ -154,38 +321,15 @@ class DeepSeekBot(BaseBot):
             # 1. 尝试按域名查找
             self.tab = self.page.get_tab(url=self.conf['domain'])
             if self.tab:
-                print(f"✅ [DeepSeek] 找到已有标签页: {self.tab.title}")
+                log.info("找到已有标签页", model=self.model_name, title=self.tab.title)
                 self.tab.activate()
                 return # 成功找到并激活，直接返回
         except Exception as e:
-            print(f"⚠️ [DeepSeek] 查找标签页时出错: {e}")
+            log.warning("查找标签页时出错", model=self.model_name, error=str(e))
 
         # 2. 如果没找到，新建
-        print("🆕 [DeepSeek] 未找到已有页面，正在新建...")
-        self.tab = self.page.new_tab(self.conf['home_url'])
-        time.sleep(1)
-
-    async def stream_chat(self, message: str):
-        if not self.tab: self.activate_tab()
-        print(f"[DeepSeek] 发送: {message}")
-        try:
-            answer_selector = self.conf['selectors']['answer']
-            existing_count = len(self.tab.eles(answer_selector))
-
-            input_ele = self._get_ele(self.conf['selectors']['input'])
-            if not input_ele: yield "Error: 找不到输入框"; return
-            input_ele.clear(); input_ele.input(message); time.sleep(0.5)
-
-            send_btn = self._get_ele(self.conf['selectors']['send'])
-            if send_btn: send_btn.click()
-            else: input_ele.input('\n')
-        except Exception as e: yield f"Error: {e}"; return
-
-        answer_box = self._wait_for_answer_box(existing_count)
-        if not answer_box: yield ""; return
-
-        async for chunk in self._robust_stream_loop(answer_box, answer_selector):
-            yield chunk
+        log.info("未找到已有页面，正在新建", model=self.model_name)
+        self._open_new_tab()
 
 class GPTBot(BaseBot):
     def __init__(self, page): super().__init__(page, 'gpt')
@@ -198,37 +342,14 @@ class GPTBot(BaseBot):
                 self.tab = self.page.get_tab(url=self.conf['alt_domain'])
 
             if self.tab:
-                print(f"✅ [GPT] 找到已有标签页: {self.tab.title}")
+                log.info("找到已有标签页", model=self.model_name, title=self.tab.title)
                 self.tab.activate()
                 return
         except Exception as e:
-            print(f"⚠️ [GPT] 查找标签页时出错: {e}")
+            log.warning("查找标签页时出错", model=self.model_name, error=str(e))
 
-        print("🆕 [GPT] 未找到已有页面，正在新建...")
-        self.tab = self.page.new_tab(self.conf['home_url'])
-        time.sleep(1)
-
-    async def stream_chat(self, message: str):
-        if not self.tab: self.activate_tab()
-        print(f"[GPT] 发送: {message}")
-        try:
-            answer_selector = self.conf['selectors']['answer']
-            existing_count = len(self.tab.eles(answer_selector))
-
-            input_ele = self._get_ele(self.conf['selectors']['input'])
-            if not input_ele: yield "Error: 找不到输入框"; return
-            input_ele.clear(); input_ele.input(message); time.sleep(0.5)
-
-            send_btn = self._get_ele(self.conf['selectors']['send'])
-            if send_btn: send_btn.click()
-            else: input_ele.input('\n')
-        except Exception as e: yield f"Error: {e}"; return
-
-        answer_box = self._wait_for_answer_box(existing_count)
-        if not answer_box: yield ""; return
-
-        async for chunk in self._robust_stream_loop(answer_box, answer_selector):
-            yield chunk
+        log.info("未找到已有页面，正在新建", model=self.model_name)
+        self._open_new_tab()
 
 class DoubaoBot(BaseBot):
     def __init__(self, page): super().__init__(page, 'doubao')
@@ -237,37 +358,14 @@ class DoubaoBot(BaseBot):
         try:
             self.tab = self.page.get_tab(url=self.conf['domain'])
             if self.tab:
-                print(f"✅ [Doubao] 找到已有标签页: {self.tab.title}")
+                log.info("找到已有标签页", model=self.model_name, title=self.tab.title)
                 self.tab.activate()
                 return
         except Exception as e:
-            print(f"⚠️ [Doubao] 查找标签页时出错: {e}")
+            log.warning("查找标签页时出错", model=self.model_name, error=str(e))
 
-        print("🆕 [Doubao] 未找到已有页面，正在新建...")
-        self.tab = self.page.new_tab(self.conf['home_url'])
-        time.sleep(1)
-
-    async def stream_chat(self, message: str):
-        if not self.tab: self.activate_tab()
-        print(f"[Doubao] 发送: {message}")
-        try:
-            answer_selector = self.conf['selectors']['answer']
-            existing_count = len(self.tab.eles(answer_selector))
-
-            input_ele = self._get_ele(self.conf['selectors']['input'])
-            if not input_ele: yield "Error: 找不到输入框"; return
-            input_ele.clear(); input_ele.input(message); time.sleep(0.5)
-
-            send_btn = self._get_ele(self.conf['selectors']['send'])
-            if send_btn: send_btn.click()
-            else: input_ele.input('\n')
-        except Exception as e: yield f"Error: {e}"; return
-
-        answer_box = self._wait_for_answer_box(existing_count)
-        if not answer_box: yield ""; return
-
-        async for chunk in self._robust_stream_loop(answer_box, answer_selector):
-            yield chunk
+        log.info("未找到已有页面，正在新建", model=self.model_name)
+        self._open_new_tab()
 
 class GeminiBot(BaseBot):
     def __init__(self, page): super().__init__(page, 'gemini')
@@ -276,37 +374,14 @@ class GeminiBot(BaseBot):
         try:
             self.tab = self.page.get_tab(url=self.conf['domain'])
             if self.tab:
-                print(f"✅ [Gemini] 找到已有标签页: {self.tab.title}")
+                log.info("找到已有标签页", model=self.model_name, title=self.tab.title)
                 self.tab.activate()
                 return
         except Exception as e:
-            print(f"⚠️ [Gemini] 查找标签页时出错: {e}")
-
-        print("🆕 [Gemini] 未找到已有页面，正在新建...")
-        self.tab = self.page.new_tab(self.conf['home_url'])
-        time.sleep(1)
-
-    async def stream_chat(self, message: str):
-        if not self.tab: self.activate_tab()
-        print(f"[Gemini] 发送: {message}")
-        try:
-            answer_selector = self.conf['selectors']['answer']
-            existing_count = len(self.tab.eles(answer_selector))
-
-            input_ele = self._get_ele(self.conf['selectors']['input'])
-            if not input_ele: yield "Error: 找不到输入框"; return
-            input_ele.clear(); input_ele.input(message); time.sleep(0.5)
-
-            send_btn = self._get_ele(self.conf['selectors']['send'])
-            if send_btn: send_btn.click()
-            else: input_ele.input('\n')
-        except Exception as e: yield f"Error: {e}"; return
+            log.warning("查找标签页时出错", model=self.model_name, error=str(e))
 
-        answer_box = self._wait_for_answer_box(existing_count)
-        if not answer_box: yield ""; return
-
-        async for chunk in self._robust_stream_loop(answer_box, answer_selector):
-            yield chunk
+        log.info("未找到已有页面，正在新建", model=self.model_name)
+        self._open_new_tab()
 
 class KimiBot(BaseBot):
     def __init__(self, page): super().__init__(page, 'kimi')
@@ -315,41 +390,57 @@ class KimiBot(BaseBot):
         try:
             self.tab = self.page.get_tab(url=self.conf['domain'])
             if self.tab:
-                print(f"✅ [Kimi] 找到已有标签页: {self.tab.title}")
+                log.info("找到已有标签页", model=self.model_name, title=self.tab.title)
                 self.tab.activate()
                 return
         except Exception as e:
-            print(f"⚠️ [Kimi] 查找标签页时出错: {e}")
+            log.warning("查找标签页时出错", model=self.model_name, error=str(e))
 
-        print("🆕 [Kimi] 未找到已有页面，正在新建...")
-        self.tab = self.page.new_tab(self.conf['home_url'])
-        time.sleep(1)
+        log.info("未找到已有页面，正在新建", model=self.model_name)
+        self._open_new_tab()
 
-    async def stream_chat(self, message: str):
-        if not self.tab: self.activate_tab()
-        print(f"[Kimi] 发送: {message}")
-        try:
-            answer_selector = self.conf['selectors']['answer']
-            existing_count = len(self.tab.eles(answer_selector))
-
-            input_ele = self._get_ele(self.conf['selectors']['input'])
-            if not input_ele: yield "Error: 找不到输入框"; return
-            input_ele.clear(); input_ele.input(message); time.sleep(0.5)
+class MockBot(BaseBot):
+    """不驱动浏览器的 bot（BOT_BACKEND = "mock"）：按 MOCK_BOT 参数流式产出脚本化的 Markdown 回答"""
+    TEMPLATE = ("**[Mock: {model}]** 收到：{message}\n\n"
+                "这是一段用于压测的模拟回答，后端没有驱动浏览器。\n\n"
+                "- 第一点：流式输出\n- 第二点：`代码片段`\n\n"
+                "```python\nprint('hello')\n```\n\n")
 
-            send_btn = self._get_ele(self.conf['selectors']['send'])
-            if send_btn: send_btn.click()
-            else: input_ele.input('\n')
-        except Exception as e: yield f"Error: {e}"; return
+    def __init__(self, page, model_name: str):
+        super().__init__(page, model_name)
+        self.params = dict(MOCK_BOT)
+        self.stopped = False
 
-        answer_box = self._wait_for_answer_box(existing_count)
-        if not answer_box: yield ""; return
+    def activate_tab(self):
+        pass
 
-        async for chunk in self._robust_stream_loop(answer_box, answer_selector):
+    async def stream_chat(self, message: str):
+        params = self.params
+        unit = self.TEMPLATE.format(model=self.model_name, message=message[:50])
+        text = (unit * (params['length'] // len(unit) + 1))[:params['length']]
+        sent_at = time.perf_counter()
+        async for chunk in self._timed(self._generate(text), sent_at):
             yield chunk
 
+    async def _generate(self, text: str):
+        params = self.params
+        await asyncio.sleep(params['ttft'])
+        for end in range(params['chunk_chars'], len(text) + params['chunk_chars'], params['chunk_chars']):
+            if self.stopped:
+                return
+            yield text[:end]
+            await asyncio.sleep(params['interval'])
+
+    def stop_generation(self):
+        self.stopped = True
+
+
 class BotFactory:
     @staticmethod
     def get_bot(model_name: str, page: ChromiumPage) -> BaseBot:
+        if BOT_BACKEND == 'mock':
+            if model_name not in MODEL_CONFIG: raise ValueError(f"Unknown model: {model_name}")
+            return MockBot(page, model_name)
         if model_name == 'deepseek': return DeepSeekBot(page)
         elif model_name == 'gpt': return GPTBot(page)
         elif model_name == 'doubao': return DoubaoBot(page)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+推送式回答变化检测
+
+向模型标签页注入一个 MutationObserver，监听最新回答节点的内容变化和停止按钮的出现/消失，
+通过 CDP 的 Runtime.addBinding 通道把事件推回 Python。
+流式监听循环因此只在页面真正变化时才被唤醒，省去空轮询的 CDP 往返和最多 200ms 的延迟。
+注入失败（选择器不是 CSS、CDP 不可用等）时由调用方回退到定时轮询。
+"""
+import asyncio
+import json
+import threading
+
+from logs import get_logger
+
+log = get_logger('dom_observer')
+
+BINDING_NAME = '__aiworldNotify'
+
+OBSERVER_JS = """
+(function(answerSel, stopSel, binding) {
+    if (window.__aiworldObserver) window.__aiworldObserver.disconnect();
+    if (typeof window[binding] !== 'function') return false;
+    let pending = false;
+    let stopPresent = !!document.querySelector(stopSel);
+    // 同一批变更只通知一次
+    const notify = (reason) => {
+        if (pending) return;
+        pending = true;
+        queueMicrotask(() => { pending = false; window[binding](reason); });
+    };
+    const observer = new MutationObserver((records) => {
+        const nowStop = !!document.querySelector(stopSel);
+        if (nowStop !== stopPresent) { stopPresent = nowStop; notify('stop'); return; }
+        for (const r of records) {
+            const node = r.target.nodeType === 3 ? r.target.parentElement : r.target;
+            if (node && node.closest && node.closest(answerSel)) { notify('answer'); return; }
+            for (const added of r.addedNodes) {
+                if (added.nodeType === 1 && (added.matches(answerSel) || added.querySelector(answerSel))) {
+                    notify('answer'); return;
+                }
+            }
+        }
+    });
+    observer.observe(document.body, {childList: true, subtree: true, characterData: true, attributes: true});
+    window.__aiworldObserver = observer;
+    return true;
+})(%s, %s, %s);
+"""
+
+DISCONNECT_JS = "if (window.__aiworldObserver) { window.__aiworldObserver.disconnect(); window.__aiworldObserver = null; }"
+
+
+def css_of(selector):
+    """把 DrissionPage 的选择器配置转换为 CSS 选择器；列表取并集，非 CSS 选择器返回 None"""
+    if isinstance(selector, list):
+        parts = [css_of(sel) for sel in selector]
+        return None if None in parts else ', '.join(parts)
+    if selector.startswith('css:'):
+        return selector[4:]
+    if selector.startswith('css='):
+        return selector[4:]
+    return None
+
+
+def _js_str(value: str) -> str:
+    return json.dumps(value)
+
+
+class AnswerObserver:
+    """单个回答流的变化通知器，install/close 需在标签页工作线程中调用"""
+
+    def __init__(self, tab, selectors, loop: asyncio.AbstractEventLoop):
+        self.tab = tab
+        self.selectors = selectors
+        self.loop = loop
+        self.installed = False
+        self.events = 0
+        self._event = asyncio.Event()
+        self._lock = threading.Lock()
+
+    def install(self) -> bool:
+        """[工作线程] 注册 CDP binding 并注入观察脚本，失败返回 False"""
+        answer_css = css_of(self.selectors['answer'])
+        stop_css = css_of(self.selectors['stop'])
+        if not answer_css or not stop_css:
+            return False
+        try:
+            self.tab.run_cdp('Runtime.enable')
+            self.tab.run_cdp('Runtime.addBinding', name=BINDING_NAME)
+            self.tab.driver.set_callback('Runtime.bindingCalled', self._on_binding)
+            ok = self.tab.run_js(OBSERVER_JS % (_js_str(answer_css), _js_str(stop_css), _js_str(BINDING_NAME)),
+                                 as_expr=True)
+        except Exception as e:
+            log.warning("MutationObserver 注入失败，回退到轮询", error=str(e))
+            return False
+        self.installed = bool(ok)
+        return self.installed
+
+    def _on_binding(self, **kwargs):
+        """[CDP 事件线程] 页面推送变化事件"""
+        if kwargs.get('name') != BINDING_NAME:
+            return
+        with self._lock:
+            self.events += 1
+        self.loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self, timeout: float) -> bool:
+        """等待下一次变化事件，超时返回 False（超时唤醒用于检查静默/退出条件）"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._event.clear()
+
+    def close(self):
+        """[工作线程] 断开观察者并移除回调"""
+        if not self.installed:
+            return
+        self.installed = False
+        try:
+            self.tab.driver.set_callback('Runtime.bindingCalled', None)
+            self.tab.run_js(DISCONNECT_JS, as_expr=True)
+        except Exception:
+            pass
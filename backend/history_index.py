@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+对话列表的内存元数据缓存与游标分页
+
+启动时构建一次所有对话的摘要（id / title / model / updated_at），按 (updated_at 倒序, id) 排好序，
+之后随保存、删除和服务端记录的每轮对话增量更新，列表接口不再扫描目录、逐个读取文件。
+文件存储还会定期按 mtime 扫描目录，发现外部新增 / 修改 / 删除的文件时只重新读取这些文件
+（mtime 与服务端自己最后一次写入后相同的文件已经通过写入路径更新过，跳过）。
+传入 search (history_search.SearchIndex) 时，同样的变化也会同步到全文索引。
+
+分页游标编码最后一条的 (updated_at, id)，对话在翻页过程中被更新时也不会重复或遗漏其余条目。
+"""
+import base64
+import bisect
+import json
+import time
+
+from history_store import make_title, session_summary
+from logs import get_logger
+
+log = get_logger('history')
+
+
+def encode_cursor(summary: dict) -> str:
+    # 与 _key 一致，updated_at 为空时按 0 排序
+    raw = json.dumps([summary["updated_at"] or 0, summary["id"]])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str):
+    try:
+        updated_at, chat_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return -float(updated_at), str(chat_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def _key(summary: dict):
+    return -(summary["updated_at"] or 0), summary["id"]
+
+
+class HistoryIndex:
+    def __init__(self, store, search=None):
+        self.store = store
+        self.search = search
+        # Key: chat_id, Value: 摘要
+        self.sessions = {}
+        # 按 _key 排序的键列表
+        self._order = []
+        # Key: chat_id, Value: 文件 mtime（仅文件存储）
+        self._mtimes = {}
+        self.built_at = None
+        self.build_time = 0.0
+
+    # --- 构建 / 外部变化扫描 ---
+
+    def build(self):
+        """[线程池] 启动时构建完整的摘要缓存"""
+        start = time.perf_counter()
+        if hasattr(self.store, 'scan'):
+            self.apply_changes(self.collect_changes())
+        else:
+            self._reset(self.store.list_sessions())
+            if self.search:
+                for chat_id in list(self.sessions):
+                    session = self.store.get(chat_id)
+                    if session:
+                        self.search.index_chat(session)
+        self.built_at = time.time()
+        self.build_time = time.perf_counter() - start
+
+    def _reset(self, summaries):
+        self.sessions = {s["id"]: s for s in summaries if s.get("id")}
+        self._order = sorted(_key(s) for s in self.sessions.values())
+
+    def collect_changes(self):
+        """[线程池] 按 mtime 找出外部变化的文件并重新读取，返回 (mtimes, 删除的 id, 变化的完整对话)"""
+        mtimes = self.store.scan()
+        removed = [chat_id for chat_id in self._mtimes if chat_id not in mtimes]
+        loaded = []
+        for chat_id, mtime in mtimes.items():
+            if self._mtimes.get(chat_id) == mtime:
+                continue
+            # 服务端自己写入的文件，写入时已更新过缓存和全文索引
+            if chat_id in self.sessions and self.store.written_mtime(chat_id) == mtime:
+                continue
+            try:
+                session = self.store.get(chat_id)
+            except Exception as e:
+                log.error("读取对话失败", chatId=chat_id, error=str(e))
+                continue
+            if session:
+                loaded.append(session)
+        return mtimes, removed, loaded
+
+    def apply_changes(self, changes) -> int:
+        """把 collect_changes 的结果合并进缓存，返回变化的对话数"""
+        mtimes, removed, loaded = changes
+        if not self.sessions:
+            self._reset(session_summary(s) for s in loaded)
+        else:
+            for chat_id in removed:
+                self.remove(chat_id)
+            for session in loaded:
+                self.put(session_summary(session))
+        if self.search:
+            for session in loaded:
+                self.search.index_chat(session)
+        self._mtimes = mtimes
+        return len(removed) + len(loaded)
+
+    # --- 增量更新（事件循环中调用） ---
+
+    def put(self, summary: dict):
+        old = self.sessions.get(summary["id"])
+        if old is not None:
+            self._discard(old)
+        self.sessions[summary["id"]] = summary
+        bisect.insort(self._order, _key(summary))
+
+    def put_session(self, session: dict):
+        """保存完整对话后更新摘要"""
+        self.put(session_summary(session))
+        if self.search:
+            self.search.index_chat(session)
+
+    def remove(self, chat_id: str):
+        old = self.sessions.pop(chat_id, None)
+        if old is not None:
+            self._discard(old)
+        if self.search:
+            self.search.remove_chat(chat_id)
+
+    def _discard(self, summary: dict):
+        i = bisect.bisect_left(self._order, _key(summary))
+        if i < len(self._order) and self._order[i] == _key(summary):
+            del self._order[i]
+
+    def on_ops(self, entries: list):
+        """服务端记录的增量操作（语义同 history_store.apply_op）"""
+        for chat_id, op in entries:
+            summary = dict(self.sessions.get(chat_id) or
+                           {"id": chat_id, "title": "New Chat", "model": None, "updated_at": 0})
+            if op["op"] == "append":
+                message = op["message"]
+                if op.get("model"):
+                    summary["model"] = op["model"]
+                if message["role"] == "user" and summary["title"] == "New Chat":
+                    summary["title"] = make_title(message["content"])
+            summary["updated_at"] = op.get("updated_at", summary["updated_at"])
+            self.put(summary)
+        if self.search:
+            self.search.on_ops(entries)
+
+    # --- 查询 ---
+
+    def page(self, limit: int = None, cursor: str = None) -> dict:
+        """按 (updated_at 倒序, id) 返回 cursor 之后的 limit 条"""
+        start = 0
+        if cursor:
+            start = bisect.bisect_right(self._order, decode_cursor(cursor))
+        end = len(self._order) if limit is None else start + limit
+        items = [self.sessions[chat_id] for _, chat_id in self._order[start:end]]
+        next_cursor = encode_cursor(items[-1]) if items and end < len(self._order) else None
+        return {"items": items, "next_cursor": next_cursor, "total": len(self._order)}
+
+    def all(self) -> list:
+        return [self.sessions[chat_id] for _, chat_id in self._order]
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+对话记录的写后缓冲
+
+服务端自己记录每一轮对话（用户消息在收到 chat 请求时、回答在流结束时），
+不再依赖前端每轮上传完整的 ChatSession。WebSocket 处理流程只把操作放进内存队列，
+后台任务每 flush_interval 秒把队列中的操作整批交给 store.apply（在线程池中执行），
+并每隔 compact_interval 秒压缩一次文件日志。读取历史前先 flush，保证读到刚写入的内容。
+"""
+import asyncio
+import time
+
+from logs import get_logger
+
+log = get_logger('history')
+
+
+class HistoryWriter:
+    def __init__(self, store, index=None, flush_interval: float = 0.5, compact_interval: float = 300,
+                 batch: int = 512):
+        self.store = store
+        # 写入成功后同步更新的对话列表缓存 (HistoryIndex)
+        self.index = index
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.batch = batch
+        # 待写入的 (chat_id, op)
+        self._pending = []
+        self._flush_lock = None
+        self._task = None
+        self._last_compact = time.time()
+
+        # 统计
+        self.flushes = 0
+        self.written = 0
+
+    # --- 记录操作（事件循环中调用，不阻塞） ---
+
+    def append_message(self, chat_id: str, role: str, content: str, model: str = None, timestamp: float = None):
+        now = time.time()
+        self._pending.append((chat_id, {
+            "op": "append",
+            "model": model,
+            "updated_at": now,
+            "message": {"role": role, "content": content,
+                        "timestamp": timestamp if timestamp is not None else now * 1000}
+        }))
+
+    def regenerate(self, chat_id: str):
+        """重新生成：丢弃最后一条用户消息之后的回答"""
+        self._pending.append((chat_id, {"op": "regenerate", "updated_at": time.time()}))
+
+    def has_pending(self, chat_id: str) -> bool:
+        return any(pending_id == chat_id for pending_id, _ in self._pending)
+
+    # --- 落盘 ---
+
+    async def flush(self):
+        """把当前缓冲的操作整批写入存储"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._pending:
+                entries, self._pending = self._pending[:self.batch], self._pending[self.batch:]
+                try:
+                    await asyncio.to_thread(self.store.apply, entries)
+                except Exception as e:
+                    # 写入失败时放回队首，下次重试
+                    self._pending[:0] = entries
+                    log.error("对话记录写入失败", pending=len(self._pending), error=str(e))
+                    return
+                if self.index:
+                    self.index.on_ops(entries)
+                self.flushes += 1
+                self.written += len(entries)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.time() - self._last_compact >= self.compact_interval:
+                self._last_compact = time.time()
+                try:
+                    await asyncio.to_thread(self.store.compact)
+                except Exception as e:
+                    log.error("对话日志压缩失败", error=str(e))
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        """停止后台任务，写完剩余操作并压缩日志"""
+        if self._task:
+            self._task.cancel()
+        await self.flush()
+        await asyncio.to_thread(self.store.compact)
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "flushes": self.flushes, "written": self.written}
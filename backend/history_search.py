@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+对话历史全文检索
+
+内存倒排索引，文档粒度为单条消息：
+  分词: 连续的中日韩字符切成相邻二字组（「讲个故事」-> 讲个 / 个故 / 故事），单个汉字保留为单字；
+        其他文字（拉丁字母含重音字母、西里尔字母等）/ 数字按单词切分并转小写，先做 NFKC 规范化
+        （组合字符合并、全角字母转半角）。查询使用同样的分词，要求命中全部词项（AND）。
+  排序: BM25，查询原文整体出现在消息中时额外加分；每个对话只取得分最高的一条消息。
+  存储: 每个词项一个 array('I') 文档号列表（文档号单调递增，天然有序）和对应的词频 array('H')，
+        求交集时从最短的列表出发，在其余列表上二分查找。删除只做标记，失效文档过多时整体重建。
+
+由 HistoryIndex 驱动增量更新：保存 / 删除对话、服务端记录的每轮对话、文件目录的外部变化。
+"""
+import heapq
+import html
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+# 中日韩字符连续段 | 其余的 Unicode 单词字符（字母、数字、下划线）
+TOKEN_RE = re.compile(f'[{_CJK}]+|[^\\W{_CJK}]+')
+CJK_RE = re.compile(f'[{_CJK}]')
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+# 查询原文整体出现时的加分倍数
+PHRASE_BOOST = 1.5
+
+
+def tokenize(text: str) -> list:
+    """中日韩文本切成二字组，拉丁文本按单词切分"""
+    tokens = []
+    for run in TOKEN_RE.findall(unicodedata.normalize('NFKC', text).lower()):
+        if CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def make_snippet(text: str, query: str, terms: list, width: int = 60) -> str:
+    """截取命中位置附近的片段，命中部分用 <mark> 包裹（其余内容做 HTML 转义）"""
+    lower = text.lower()
+    needles = [query.lower()] + sorted({t for t in terms}, key=len, reverse=True)
+    pos = next((p for p in (lower.find(n) for n in needles if n) if p >= 0), 0)
+    start = max(0, pos - width // 3)
+    end = min(len(text), start + width)
+    window = text[start:end]
+    window_lower = lower[start:end]
+
+    # 标记所有命中区间（查询原文优先，其次各词项）
+    marked = [False] * len(window)
+    for needle in needles:
+        if not needle:
+            continue
+        i = window_lower.find(needle)
+        while i >= 0:
+            for j in range(i, i + len(needle)):
+                marked[j] = True
+            i = window_lower.find(needle, i + 1)
+
+    parts, i = [], 0
+    while i < len(window):
+        j = i
+        while j < len(window) and marked[j] == marked[i]:
+            j += 1
+        chunk = html.escape(window[i:j].replace('\n', ' '))
+        parts.append(f"<mark>{chunk}</mark>" if marked[i] else chunk)
+        i = j
+    return ('…' if start > 0 else '') + ''.join(parts) + ('…' if end < len(text) else '')
+
+
+class SearchIndex:
+    def __init__(self, rebuild_ratio: float = 0.3):
+        self.rebuild_ratio = rebuild_ratio
+        # 文档号 -> (chat_id, 消息序号, role, 文本)，删除后置为 None
+        self.docs = []
+        self.doc_lens = array('I')
+        # 词项 -> (文档号列表, 词频列表)
+        self.postings = {}
+        # chat_id -> 该对话的文档号（按消息顺序）
+        self.chat_docs = {}
+        # 汉字 -> 包含它的二字组，用于单字查询
+        self.char_tokens = {}
+        self.live = 0
+        self.total_len = 0
+        self._lock = threading.Lock()
+
+    # --- 写入 ---
+
+    def _add_doc(self, chat_id: str, seq: int, role: str, text: str):
+        doc_id = len(self.docs)
+        tokens = tokenize(text)
+        self.docs.append((chat_id, seq, role, text))
+        self.doc_lens.append(len(tokens))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            entry = self.postings.get(token)
+            if entry is None:
+                entry = self.postings[token] = (array('I'), array('H'))
+                if len(token) == 2 and CJK_RE.match(token):
+                    for char in set(token):
+                        self.char_tokens.setdefault(char, []).append(token)
+            entry[0].append(doc_id)
+            entry[1].append(min(tf, 65535))
+        self.chat_docs.setdefault(chat_id, []).append(doc_id)
+        self.live += 1
+        self.total_len += len(tokens)
+
+    def _remove_doc(self, doc_id: int):
+        if self.docs[doc_id] is not None:
+            self.docs[doc_id] = None
+            self.live -= 1
+            self.total_len -= self.doc_lens[doc_id]
+
+    def index_chat(self, session: dict):
+        """（重新）索引一个完整对话"""
+        with self._lock:
+            self._remove_chat(session["id"])
+            for seq, message in enumerate(session.get("messages", [])):
+                self._add_doc(session["id"], seq, message.get("role", ""), message.get("content", ""))
+            self._maybe_rebuild()
+
+    def remove_chat(self, chat_id: str):
+        with self._lock:
+            self._remove_chat(chat_id)
+            self._maybe_rebuild()
+
+    def _remove_chat(self, chat_id: str):
+        for doc_id in self.chat_docs.pop(chat_id, []):
+            self._remove_doc(doc_id)
+
+    def on_ops(self, entries: list):
+        """服务端记录的增量操作（语义同 history_store.apply_op）"""
+        with self._lock:
+            for chat_id, op in entries:
+                doc_ids = self.chat_docs.get(chat_id, [])
+                if op["op"] == "append":
+                    message = op["message"]
+                    self._add_doc(chat_id, len(doc_ids), message["role"], message["content"])
+                elif op["op"] == "regenerate":
+                    roles = [self.docs[d][2] for d in doc_ids]
+                    if "user" in roles:
+                        last_user = len(roles) - 1 - roles[::-1].index("user")
+                        for doc_id in doc_ids[last_user + 1:]:
+                            self._remove_doc(doc_id)
+                        del doc_ids[last_user + 1:]
+            self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        """失效文档超过 rebuild_ratio 时重建，回收倒排列表中的空间"""
+        dead = len(self.docs) - self.live
+        if dead < 1000 or dead < self.rebuild_ratio * len(self.docs):
+            return
+        docs = [d for d in self.docs if d is not None]
+        self.docs, self.doc_lens, self.postings, self.chat_docs = [], array('I'), {}, {}
+        self.char_tokens = {}
+        self.live = self.total_len = 0
+        for chat_id, seq, role, text in docs:
+            self._add_doc(chat_id, seq, role, text)
+
+    # --- 查询 ---
+
+    def _postings_for(self, term: str):
+        """单个汉字在文本中通常只出现在二字组里，查询时合并所有包含它的二字组"""
+        entry = self.postings.get(term)
+        if len(term) != 1 or not CJK_RE.match(term):
+            return entry
+        merged = {}
+        if entry:
+            merged.update(zip(*entry))
+        for token in self.char_tokens.get(term, []):
+            for doc_id, tf in zip(*self.postings[token]):
+                merged[doc_id] = merged.get(doc_id, 0) + tf
+        if not merged:
+            return None
+        doc_ids = sorted(merged)
+        return array('I', doc_ids), array('I', (merged[d] for d in doc_ids))
+
+    def search(self, query: str, limit: int = 20, sessions: dict = None) -> list:
+        """
+        返回按得分排序的对话列表，每个对话附带得分最高的消息片段。
+        sessions 为 HistoryIndex 的摘要字典，用于补充标题等信息。
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            entries = [self._postings_for(t) for t in terms]
+            if any(e is None for e in entries):
+                return []
+            order = sorted(range(len(terms)), key=lambda i: len(entries[i][0]))
+            n = max(self.live, 1)
+            avg_len = self.total_len / n if self.live else 1.0
+            docs, doc_lens = self.docs, self.doc_lens
+
+            # BM25：从最短的倒排列表出发逐个词项累加得分，不含后续词项的文档被淘汰
+            scores = None
+            for i in order:
+                doc_ids, tfs = entries[i]
+                idf = math.log(1 + (n - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+                if scores is None:
+                    scores = {}
+                    for doc_id, tf in zip(doc_ids, tfs):
+                        if docs[doc_id] is not None:
+                            norm = K1 * (1 - B + B * doc_lens[doc_id] / avg_len)
+                            scores[doc_id] = idf * tf * (K1 + 1) / (tf + norm)
+                    continue
+                if len(scores) * 8 < len(doc_ids):
+                    # 候选远少于倒排列表时二分查找，否则直接建查找表
+                    found = {}
+                    for doc_id in scores:
+                        pos = bisect_left(doc_ids, doc_id)
+                        if pos < len(doc_ids) and doc_ids[pos] == doc_id:
+                            found[doc_id] = tfs[pos]
+                else:
+                    lookup = dict(zip(doc_ids, tfs))
+                    found = {doc_id: lookup[doc_id] for doc_id in scores if doc_id in lookup}
+                survivors = {}
+                for doc_id, tf in found.items():
+                    norm = K1 * (1 - B + B * doc_lens[doc_id] / avg_len)
+                    survivors[doc_id] = scores[doc_id] + idf * tf * (K1 + 1) / (tf + norm)
+                scores = survivors
+                if not scores:
+                    return []
+
+            # 只对得分靠前的文档检查原文整体命中并加分，再按对话去重
+            lowered = query.lower().strip()
+            best = {}
+            for doc_id in heapq.nlargest(limit * 10, scores, key=scores.get):
+                chat_id, seq, role, text = docs[doc_id]
+                score = scores[doc_id]
+                if len(terms) > 1 and lowered in text.lower():
+                    score *= PHRASE_BOOST
+                if chat_id not in best or score > best[chat_id][0]:
+                    best[chat_id] = (score, seq, role, text)
+
+        ranked = sorted(best.items(), key=lambda kv: kv[1][0], reverse=True)[:limit]
+        results = []
+        for chat_id, (score, seq, role, text) in ranked:
+            summary = (sessions or {}).get(chat_id, {})
+            results.append({
+                "id": chat_id,
+                "title": summary.get("title"),
+                "model": summary.get("model"),
+                "updated_at": summary.get("updated_at"),
+                "score": round(score, 4),
+                "message_index": seq,
+                "role": role,
+                "snippet": make_snippet(text, query.strip(), terms),
+            })
+        return results
+
+    def stats(self) -> dict:
+        return {"messages": self.live, "chats": len(self.chat_docs), "terms": len(self.postings),
+                "dead": len(self.docs) - self.live}
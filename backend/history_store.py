@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+对话历史存储
+
+两种后端，接口相同，由 config.HISTORY_BACKEND 选择：
+  file:   history_storage/<chat_id>.json，每个对话一个文件（原有格式）
+  sqlite: 标准库 sqlite3（WAL 模式），sessions 表保存摘要并按 updated_at 建索引，
+          messages 表保存消息。列表接口只查 sessions 表，不再读取所有消息。
+
+增量写入：服务端在每轮对话中以「操作」记录消息（见 apply_op），由 history_journal.HistoryWriter
+批量交给 store.apply：
+  file:   追加到 <chat_id>.journal（每行一个操作），读取时在 JSON 上重放；
+          日志超过 compact_every 条或定期压缩时，原子地（临时文件 + os.replace）重写 JSON 并清空日志
+  sqlite: 直接在一个事务中插入 / 删除消息行
+
+从 JSON 文件导入到 SQLite（一次性）：
+    python history_store.py import [history_storage] [history.db]
+SQLite 库首次创建（为空）时也会自动导入 HISTORY_DIR 中已有的 JSON 文件。
+"""
+import glob
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from logs import get_logger
+
+log = get_logger('history')
+
+
+def make_title(text: str) -> str:
+    """与前端一致：取第一条用户消息的前 20 个字符作为标题"""
+    return text.replace('\n', ' ').strip()[:20] or 'New Chat'
+
+
+def apply_op(session: dict, op: dict) -> dict:
+    """
+    在对话数据上应用一条增量操作：
+      {"op": "append", "model", "updated_at", "message": {"role", "content", "timestamp"}}
+      {"op": "regenerate", "updated_at"}  删除最后一条用户消息之后的回答（重新生成）
+    """
+    messages = session.setdefault("messages", [])
+    if op["op"] == "append":
+        message = op["message"]
+        messages.append(message)
+        if op.get("model"):
+            session["model"] = op["model"]
+        if message["role"] == "user" and session.get("title", "New Chat") == "New Chat":
+            session["title"] = make_title(message["content"])
+    elif op["op"] == "regenerate":
+        last_user = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=None)
+        if last_user is not None:
+            del messages[last_user + 1:]
+    session["updated_at"] = op.get("updated_at", session.get("updated_at", 0))
+    return session
+
+
+def session_summary(data: dict) -> dict:
+    """列表需要的摘要信息（字段缺失或为 null 时取默认值）"""
+    return {
+        "id": data.get("id"),
+        "title": data.get("title") or "New Chat",
+        "model": data.get("model") or None,
+        "updated_at": data.get("updated_at") or 0
+    }
+
+
+class FileHistoryStore:
+    """每个对话一个 JSON 文件，增量写入先追加到同名 .journal 日志"""
+
+    def __init__(self, directory: str, compact_every: int = 32):
+        self.directory = directory
+        self.compact_every = compact_every
+        # Key: chat_id, Value: 日志中未压缩的操作数
+        self._journal_sizes = {}
+        # Key: chat_id, Value: 本进程最后一次写入后的 mtime（与 scan 的取值方式相同）
+        self._written = {}
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, chat_id: str) -> str:
+        return os.path.join(self.directory, f"{chat_id}.json")
+
+    def _journal_path(self, chat_id: str) -> str:
+        return os.path.join(self.directory, f"{chat_id}.journal")
+
+    def _read_journal(self, chat_id: str) -> list:
+        """读取日志中的操作；崩溃时写了一半的最后一行直接忽略"""
+        path = self._journal_path(chat_id)
+        if not os.path.exists(path):
+            return []
+        ops = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    break
+        return ops
+
+    def _repair_journal(self, chat_id: str) -> int:
+        """截掉崩溃时写了一半的最后一行（否则后续追加会接在它后面），返回完整的操作数"""
+        path = self._journal_path(chat_id)
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+        return len(self._read_journal(chat_id))
+
+    def _load(self, chat_id: str):
+        """JSON 快照 + 日志重放"""
+        data = None
+        path = self._path(chat_id)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        ops = self._read_journal(chat_id)
+        if ops:
+            data = data or {"id": chat_id, "title": "New Chat", "model": None, "messages": [], "updated_at": 0}
+            for op in ops:
+                apply_op(data, op)
+        return data
+
+    def _write_snapshot(self, session: dict):
+        """先写临时文件再替换，崩溃时不会留下半截的 JSON"""
+        path = self._path(session["id"])
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(session, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def list_sessions(self) -> list:
+        sessions = []
+        with self._lock:
+            journaled = {os.path.basename(f)[:-len(".journal")]
+                         for f in glob.glob(os.path.join(self.directory, "*.journal"))}
+            for f in glob.glob(os.path.join(self.directory, "*.json")):
+                chat_id = os.path.basename(f)[:-len(".json")]
+                try:
+                    if chat_id in journaled:
+                        sessions.append(session_summary(self._load(chat_id)))
+                        journaled.discard(chat_id)
+                    else:
+                        with open(f, "r", encoding="utf-8") as file:
+                            sessions.append(session_summary(json.load(file)))
+                except Exception as e:
+                    log.error("读取对话文件失败", file=f, error=str(e))
+            # 只有日志、还没有快照的新对话
+            for chat_id in journaled:
+                data = self._load(chat_id)
+                if data:
+                    sessions.append(session_summary(data))
+        # 按更新时间倒序排列
+        sessions.sort(key=lambda x: x["updated_at"] or 0, reverse=True)
+        return sessions
+
+    def get(self, chat_id: str):
+        with self._lock:
+            return self._load(chat_id)
+
+    def scan(self) -> dict:
+        """各对话文件（快照与日志取较新者）的 mtime，供 HistoryIndex 发现外部变化"""
+        mtimes = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                chat_id, ext = os.path.splitext(entry.name)
+                if ext in (".json", ".journal"):
+                    mtime = entry.stat().st_mtime_ns
+                    mtimes[chat_id] = max(mtime, mtimes.get(chat_id, 0))
+        return mtimes
+
+    def _file_mtime(self, chat_id: str) -> int:
+        mtime = 0
+        for path in (self._path(chat_id), self._journal_path(chat_id)):
+            try:
+                mtime = max(mtime, os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                pass
+        return mtime
+
+    def written_mtime(self, chat_id: str):
+        """本进程最后一次写入该对话后的 mtime；scan 到相同的值说明文件没有被外部修改"""
+        with self._lock:
+            return self._written.get(chat_id)
+
+    def save(self, session: dict):
+        with self._lock:
+            self._write_snapshot(session)
+            self._drop_journal(session["id"])
+            self._written[session["id"]] = self._file_mtime(session["id"])
+
+    def apply(self, entries: list):
+        """批量追加操作 [(chat_id, op), ...]，每个对话的日志只打开、fsync 一次"""
+        grouped = {}
+        for chat_id, op in entries:
+            grouped.setdefault(chat_id, []).append(op)
+        with self._lock:
+            for chat_id, ops in grouped.items():
+                if chat_id not in self._journal_sizes:
+                    self._journal_sizes[chat_id] = self._repair_journal(chat_id)
+                with open(self._journal_path(chat_id), "a", encoding="utf-8") as f:
+                    f.write(''.join(json.dumps(op, ensure_ascii=False) + '\n' for op in ops))
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._journal_sizes[chat_id] += len(ops)
+                if self._journal_sizes[chat_id] >= self.compact_every:
+                    self.compact(chat_id)
+                self._written[chat_id] = self._file_mtime(chat_id)
+
+    def compact(self, chat_id: str = None):
+        """把日志合并进 JSON 快照；不指定 chat_id 时压缩所有日志"""
+        with self._lock:
+            if chat_id is None:
+                for f in glob.glob(os.path.join(self.directory, "*.journal")):
+                    self.compact(os.path.basename(f)[:-len(".journal")])
+                return
+            data = self._load(chat_id)
+            if data:
+                self._write_snapshot(data)
+            self._drop_journal(chat_id)
+            self._written[chat_id] = self._file_mtime(chat_id)
+
+    def _drop_journal(self, chat_id: str):
+        self._journal_sizes.pop(chat_id, None)
+        path = self._journal_path(chat_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def delete(self, chat_id: str) -> bool:
+        with self._lock:
+            existed = False
+            for path in (self._path(chat_id), self._journal_path(chat_id)):
+                if os.path.exists(path):
+                    os.remove(path)
+                    existed = True
+            self._journal_sizes.pop(chat_id, None)
+            self._written.pop(chat_id, None)
+            return existed
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    model TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at DESC, id);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    PRIMARY KEY (chat_id, seq)
+);
+"""
+
+
+class SQLiteHistoryStore:
+    """sessions + messages 两张表；单连接加锁，供线程池中的调用共享"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone() is None
+
+    def list_sessions(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, model, updated_at FROM sessions ORDER BY updated_at DESC, id").fetchall()
+        return [{"id": r[0], "title": r[1], "model": r[2], "updated_at": r[3]} for r in rows]
+
+    def get(self, chat_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, title, model, updated_at FROM sessions WHERE id = ?", (chat_id,)).fetchone()
+            if row is None:
+                return None
+            messages = self._conn.execute(
+                "SELECT role, content, timestamp FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,)).fetchall()
+        return {
+            "id": row[0],
+            "title": row[1],
+            "model": row[2],
+            "messages": [{"role": m[0], "content": m[1], "timestamp": m[2]} for m in messages],
+            "updated_at": row[3]
+        }
+
+    def save(self, session: dict):
+        self.save_many([session])
+
+    def save_many(self, sessions: list):
+        """在一个事务中写入多个完整对话（覆盖已有消息）"""
+        with self._lock, self._conn:
+            for session in sessions:
+                summary = session_summary(session)
+                self._conn.execute(
+                    "INSERT INTO sessions (id, title, model, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET title = excluded.title, model = excluded.model, "
+                    "updated_at = excluded.updated_at",
+                    (summary["id"], summary["title"], summary["model"], summary["updated_at"]))
+                self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (summary["id"],))
+                self._conn.executemany(
+                    "INSERT INTO messages (chat_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    [(summary["id"], i, m["role"], m.get("content") or "", m.get("timestamp") or 0)
+                     for i, m in enumerate(session.get("messages", []))])
+
+    def apply(self, entries: list):
+        """批量应用增量操作 [(chat_id, op), ...]（语义同 apply_op），整批一个事务"""
+        with self._lock, self._conn:
+            for chat_id, op in entries:
+                if op["op"] == "append":
+                    message = op["message"]
+                    title = make_title(message["content"]) if message["role"] == "user" else "New Chat"
+                    self._conn.execute(
+                        "INSERT INTO sessions (id, title, model, updated_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET "
+                        "title = CASE WHEN sessions.title = 'New Chat' THEN excluded.title ELSE sessions.title END, "
+                        "model = COALESCE(excluded.model, sessions.model), updated_at = excluded.updated_at",
+                        (chat_id, title, op.get("model"), op.get("updated_at", 0)))
+                    self._conn.execute(
+                        "INSERT INTO messages (chat_id, seq, role, content, timestamp) "
+                        "SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ? FROM messages WHERE chat_id = ?",
+                        (chat_id, message["role"], message["content"], message.get("timestamp", 0), chat_id))
+                elif op["op"] == "regenerate":
+                    self._conn.execute(
+                        "DELETE FROM messages WHERE chat_id = ? AND seq > "
+                        "(SELECT MAX(seq) FROM messages WHERE chat_id = ? AND role = 'user')",
+                        (chat_id, chat_id))
+                    self._conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?",
+                                       (op.get("updated_at", 0), chat_id))
+
+    def compact(self, chat_id: str = None):
+        """SQLite 直接写入表中，没有需要压缩的日志"""
+
+    def delete(self, chat_id: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM sessions WHERE id = ?", (chat_id,)).rowcount > 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def import_json_files(store: SQLiteHistoryStore, directory: str, batch: int = 500) -> int:
+    """把 directory 中的 chat_*.json（连同未压缩的日志）导入 SQLite，返回导入的对话数"""
+    source = FileHistoryStore(directory)
+    chat_ids = {os.path.splitext(os.path.basename(f))[0]
+                for pattern in ("*.json", "*.journal") for f in glob.glob(os.path.join(directory, pattern))}
+    sessions, count = [], 0
+    for chat_id in sorted(chat_ids):
+        try:
+            data = source.get(chat_id)
+        except Exception as e:
+            log.error("读取对话失败", chatId=chat_id, error=str(e))
+            continue
+        if not data or not data.get("id"):
+            continue
+        sessions.append(data)
+        if len(sessions) >= batch:
+            store.save_many(sessions)
+            count += len(sessions)
+            sessions = []
+    if sessions:
+        store.save_many(sessions)
+        count += len(sessions)
+    return count
+
+
+def make_store(backend: str, history_dir: str, db_path: str):
+    """按配置创建历史存储"""
+    if backend == "sqlite":
+        store = SQLiteHistoryStore(db_path)
+        if store.is_empty() and (glob.glob(os.path.join(history_dir, "*.json"))
+                                 or glob.glob(os.path.join(history_dir, "*.journal"))):
+            count = import_json_files(store, history_dir)
+            log.info("已导入对话到 SQLite", source=history_dir, db=db_path, count=count)
+        return store
+    if backend == "file":
+        return FileHistoryStore(history_dir)
+    raise ValueError(f"Unknown history backend: {backend}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'import':
+        print("用法: python history_store.py import [history_storage] [history.db]")
+        sys.exit(1)
+    source = sys.argv[2] if len(sys.argv) > 2 else "history_storage"
+    target = sys.argv[3] if len(sys.argv) > 3 else "history.db"
+    db = SQLiteHistoryStore(target)
+    print(f"📦 已导入 {import_json_files(db, source)} 个对话到 {target}")
+    db.close()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+精简模式
+
+模型标签页加载的是完整的网页应用：图片、字体、头像、视频、埋点与监控上报都照常加载，而我们只读取其中的文字。
+每个标签页因此要占几百 MB 内存，后台还在持续消耗 CPU。
+
+开启精简模式（LEAN_MODE，单个模型可在 MODEL_CONFIG 中用 'lean' 覆盖）后，标签页打开时：
+  拦截请求     在独立的 CDP 会话上开启 Fetch 拦截，LEAN_BLOCK_TYPES 中的资源类型（默认图片 / 字体 / 媒体）
+               以及 LEAN_BLOCK_URLS + 模型的 'lean_block_urls' 中的地址（埋点、监控上报）直接以 BlockedByClient 失败，
+               不下载也不解码；只有被拦截的请求才会暂停，其余请求不经过 Python
+  低成本渲染   固定较小的视口、设备像素比 1（减少光栅化面积），并声明 prefers-reduced-motion: reduce 让站点关掉动画
+规则绑定在该会话上，会话随标签页保留。新建的标签页先打开空白页、应用规则后再加载站点；
+沿用的已有标签页（可能是用户登录用的）立即生效渲染设置，拦截从下一次页面加载开始。
+登录页的验证码等依赖图片，需要登录时先关闭精简模式。
+"""
+import threading
+
+from DrissionPage._base.driver import Driver
+
+from config import LEAN_MODE, LEAN_BLOCK_TYPES, LEAN_BLOCK_URLS, LEAN_VIEWPORT, LEAN_REDUCED_MOTION
+from logs import get_logger
+
+log = get_logger('lean')
+
+
+def lean_settings(conf: dict):
+    """该模型的精简模式设置，未开启时返回 None"""
+    if not conf.get('lean', LEAN_MODE):
+        return None
+    return {
+        "block_types": list(LEAN_BLOCK_TYPES),
+        "block_urls": list(LEAN_BLOCK_URLS) + list(conf.get('lean_block_urls', [])),
+        "viewport": LEAN_VIEWPORT,
+        "reduced_motion": LEAN_REDUCED_MOTION,
+    }
+
+
+class LeanSession:
+    """一个标签页上的拦截与渲染设置（独立 CDP 会话，与 network_capture 的做法一致）"""
+
+    def __init__(self, tab, model_name: str, settings: dict):
+        self.tab = tab
+        self.model_name = model_name
+        self.settings = settings
+        self._driver = None
+        # Key: 资源类型, Value: 被拦截的请求数
+        self.blocked = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """[工作线程] 开启拦截并应用渲染设置，失败时抛出异常"""
+        settings = self.settings
+        self._driver = Driver(self.tab._target_id, self.tab.browser._ws_address)
+        self._driver.session_id = self._driver.run(
+            'Target.attachToTarget', targetId=self.tab._target_id, flatten=True)['sessionId']
+        patterns = ([{"urlPattern": "*", "resourceType": t, "requestStage": "Request"}
+                     for t in settings["block_types"]]
+                    + [{"urlPattern": url, "requestStage": "Request"} for url in settings["block_urls"]])
+        if patterns:
+            self._driver.set_callback('Fetch.requestPaused', self._on_paused)
+            self._driver.run('Fetch.enable', patterns=patterns)
+        if settings["viewport"]:
+            self._driver.run('Emulation.setDeviceMetricsOverride', width=settings["viewport"]["width"],
+                             height=settings["viewport"]["height"], deviceScaleFactor=1, mobile=False)
+        if settings["reduced_motion"]:
+            self._driver.run('Emulation.setEmulatedMedia',
+                             features=[{"name": "prefers-reduced-motion", "value": "reduce"}])
+
+    def stop(self):
+        """[工作线程] 关闭会话（拦截与渲染设置随之失效）"""
+        if self._driver:
+            try:
+                self._driver.stop()
+            except Exception:
+                pass
+            self._driver = None
+
+    # [CDP 事件线程] 只有匹配拦截规则的请求会暂停，全部直接失败
+    def _on_paused(self, **kwargs):
+        kind = kwargs.get('resourceType', 'Other')
+        with self._lock:
+            self.blocked[kind] = self.blocked.get(kind, 0) + 1
+        try:
+            self._driver.run('Fetch.failRequest', requestId=kwargs['requestId'], errorReason='BlockedByClient')
+        except Exception:
+            pass
+
+
+# Key: 标签页 target id, Value: LeanSession
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def apply_lean(tab, model_name: str, conf: dict) -> bool:
+    """[工作线程] 按模型配置为标签页开启精简模式（已开启的标签页不重复设置），返回是否生效"""
+    settings = lean_settings(conf)
+    if settings is None:
+        return False
+    with _sessions_lock:
+        if tab._target_id in _sessions:
+            return True
+    session = LeanSession(tab, model_name, settings)
+    try:
+        session.start()
+    except Exception as e:
+        session.stop()
+        log.warning("精简模式开启失败，按完整页面加载", model=model_name, error=str(e))
+        return False
+    with _sessions_lock:
+        _sessions[tab._target_id] = session
+    log.info("已开启精简模式", model=model_name, block_types=settings["block_types"],
+             block_urls=len(settings["block_urls"]))
+    return True
+
+
+def release_lean(tab):
+    """[工作线程] 标签页关闭前释放其拦截会话"""
+    with _sessions_lock:
+        session = _sessions.pop(tab._target_id, None)
+    if session:
+        session.stop()
+
+
+def is_lean(tab) -> bool:
+    with _sessions_lock:
+        return tab._target_id in _sessions
+
+
+def open_tab(page, url: str, model_name: str, conf: dict):
+    """[工作线程] 新建该模型的标签页：开启精简模式时先打开空白页、应用规则后再加载 url"""
+    if lean_settings(conf) is None:
+        return page.new_tab(url)
+    tab = page.new_tab()
+    apply_lean(tab, model_name, conf)
+    tab.get(url)
+    return tab
+
+
+def lean_summary() -> dict:
+    """各模型开启精简模式的标签页数与按资源类型统计的拦截请求数"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    summary = {}
+    for session in sessions:
+        entry = summary.setdefault(session.model_name, {"tabs": 0, "blocked": {}})
+        entry["tabs"] += 1
+        with session._lock:
+            for kind, count in session.blocked.items():
+                entry["blocked"][kind] = entry["blocked"].get(kind, 0) + count
+    return summary
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+结构化日志
+
+所有模块通过 get_logger(name) 输出日志事件：一条可读的消息加若干字段，
+当前请求的 chatId / model 由 bind() 写入 contextvars，同一请求链路上的日志自动带上
+（TabWorker 把上下文复制到标签页工作线程，浏览器操作的日志同样带 chatId）。
+
+LOG_FORMAT = "json" 时每行输出一个 JSON 对象，便于采集；"text" 时输出便于阅读的单行文本。
+"""
+import contextvars
+import json
+import logging
+import sys
+import time
+
+from config import LOG_FORMAT, LOG_LEVEL
+
+chat_id_var = contextvars.ContextVar('chat_id', default=None)
+model_var = contextvars.ContextVar('model', default=None)
+
+
+def bind(chat_id: str = None, model: str = None):
+    """设置当前上下文（任务 / 工作线程调用）的 chatId 与 model"""
+    if chat_id is not None:
+        chat_id_var.set(chat_id)
+    if model is not None:
+        model_var.set(model)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, 'fields', {})
+        if record.chat_id and 'chatId' not in fields:
+            entry["chatId"] = record.chat_id
+        if record.model and 'model' not in fields:
+            entry["model"] = record.model
+        entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = dict(getattr(record, 'fields', {}))
+        model = fields.pop('model', None) or record.model
+        chat_id = fields.pop('chatId', None) or record.chat_id
+        prefix = ' '.join(p for p in (model, chat_id) if p)
+        line = time.strftime('%H:%M:%S', time.localtime(record.created))
+        line += f" {record.levelname[0]} " + (f"[{prefix}] " if prefix else '') + record.getMessage()
+        if fields:
+            line += ' ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class _ContextFilter(logging.Filter):
+    def filter(self, record):
+        record.chat_id = chat_id_var.get()
+        record.model = model_var.get()
+        return True
+
+
+_root = logging.getLogger('aiworld')
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    _handler.addFilter(_ContextFilter())
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+
+class EventLogger:
+    """logger.info("消息", 字段=值, ...)"""
+
+    def __init__(self, name: str):
+        self._logger = _root.getChild(name)
+
+    def _log(self, level, msg, fields, exc_info=False):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, msg, extra={'fields': fields}, exc_info=exc_info)
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, exc_info=False, **fields):
+        self._log(logging.ERROR, msg, fields, exc_info)
+
+
+def get_logger(name: str) -> EventLogger:
+    return EventLogger(name)
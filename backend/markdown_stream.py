@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+流式回答的增量 HTML -> Markdown 转换
+
+思路：把回答框的 inner_html 切分为顶层节点（块元素 / 文本 / 注释），
+已闭合且未变化的顶层块的 Markdown 按 (html, 相邻节点) 缓存，
+每次轮询只重新转换最后一个仍在增长的块，再按 markdownify 的规则拼接。
+输出与对整段 HTML 调用 markdownify 的结果逐字节一致。
+"""
+import re
+
+from bs4 import BeautifulSoup, Comment, Doctype, NavigableString
+from markdownify import MarkdownConverter, re_extract_newlines, should_remove_whitespace_outside
+
+# 与 BaseBot._safe_to_markdown 保持一致：不含这些标签时视为纯文本
+HTML_PATTERN = re.compile(r'<(p|div|span|pre|code|br|ul|ol|li|h[1-6]|table|blockquote|em|strong|b|i)\b', re.IGNORECASE)
+
+# html.parser 视为空元素的标签（无需闭合标签）
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+             'link', 'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+             'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer'}
+# 内容按原始文本解析的标签
+RAW_TEXT_TAGS = {'script', 'style'}
+# 转换结果依赖兄弟节点的标签，出现在顶层时放弃增量，直接整段转换
+SIBLING_DEPENDENT_TAGS = {'li', 'tr', 'td', 'th', 'thead', 'tbody', 'tfoot'}
+
+TAG_RE = re.compile(
+    r'<(/?)([a-zA-Z][^\s/>]*)'
+    r'((?:\s*[^\s=/>]+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s>]+))?)*)'
+    r'\s*(/?)>'
+)
+MARKUP_RE = re.compile(r'<(?:/?[a-zA-Z]|!|\?)')
+
+
+class _Unsupported(Exception):
+    """HTML 中出现切分器无法可靠处理的结构，回退到整段转换"""
+
+
+def split_top_level(html: str, start: int = 0):
+    """
+    将 HTML 切分为顶层节点，返回 [(kind, name, start, end)]。
+    kind 为 'tag' / 'text' / 'comment'；嵌套规则与 bs4 的 html.parser 一致：
+    结束标签弹出到最近的同名标签，找不到同名标签时忽略。
+    """
+    nodes = []
+    stack = []
+    pos = start
+    node_start = start
+    length = len(html)
+
+    while pos < length:
+        m = MARKUP_RE.search(html, pos)
+        if not m:
+            break
+        lt = m.start()
+        if not stack and lt > node_start:
+            nodes.append(('text', None, node_start, lt))
+            node_start = lt
+
+        if html.startswith('<!--', lt):
+            end = html.find('-->', lt + 4)
+            if end < 0:
+                raise _Unsupported('unterminated comment')
+            pos = end + 3
+            if not stack:
+                nodes.append(('comment', None, lt, pos))
+                node_start = pos
+            continue
+        if html[lt + 1] in '!?':
+            # doctype / CDATA / 处理指令在回答框中不会出现，交给整段转换
+            raise _Unsupported('declaration')
+
+        t = TAG_RE.match(html, lt)
+        if not t:
+            raise _Unsupported('malformed tag')
+        closing, name, self_closing = t.group(1), t.group(2).lower(), t.group(4)
+        pos = t.end()
+
+        if closing:
+            if name in stack:
+                while stack.pop() != name:
+                    pass
+                if not stack:
+                    nodes.append(('tag', name, node_start, pos))
+                    node_start = pos
+            continue
+
+        if name in VOID_TAGS or self_closing:
+            if not stack:
+                nodes.append(('tag', name, lt, pos))
+                node_start = pos
+            continue
+
+        if name in RAW_TEXT_TAGS:
+            end = html.lower().find('</' + name, pos)
+            if end < 0:
+                raise _Unsupported('unterminated raw text')
+            close = html.find('>', end)
+            if close < 0:
+                raise _Unsupported('unterminated raw text')
+            pos = close + 1
+            if not stack:
+                nodes.append(('tag', name, lt, pos))
+                node_start = pos
+            continue
+
+        stack.append(name)
+
+    if stack:
+        # 最后一个顶层元素未闭合（inner_html 正常不会出现），整体视为一个节点
+        nodes.append(('tag', stack[0], node_start, length))
+    elif node_start < length:
+        nodes.append(('text', None, node_start, length))
+    return nodes
+
+
+def _stub(node, html):
+    """为相邻节点生成占位 HTML，保留转换时会检查的信息（标签名 / 是否为空白文本）"""
+    if node is None:
+        return ''
+    kind, name, start, end = node
+    if kind == 'comment':
+        return '<!---->'
+    if kind == 'text':
+        return ' ' if html[start:end].strip() == '' else 'x'
+    return '<%s>' % name if name in VOID_TAGS else '<%s></%s>' % (name, name)
+
+
+def _is_content(node, html):
+    """对应 markdownify 的 _is_block_content_element"""
+    kind, name, start, end = node
+    if kind == 'tag':
+        return True
+    if kind == 'text':
+        return html[start:end].strip() != ''
+    return False
+
+
+class IncrementalMarkdown:
+    """
+    单个回答流的增量转换器，每次生成创建一个实例。
+    convert() 的结果与 markdownify(html, **options) 完全一致。
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.converter = MarkdownConverter(**options)
+        # Key: (节点 html, 上一个节点占位, 下一个节点占位, 下一个内容节点占位), Value: Markdown 片段
+        self._cache = {}
+        # 稳定前缀：除最后一个顶层节点外的 HTML 及其切分结果
+        self._stable_html = ''
+        self._stable_nodes = []
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, html: str) -> str:
+        if not html:
+            return ""
+        if not HTML_PATTERN.search(html):
+            return html
+        try:
+            return self._convert_incremental(html)
+        except _Unsupported:
+            return self.converter.convert(html)
+
+    def _split(self, html: str):
+        if self._stable_nodes and html.startswith(self._stable_html):
+            nodes = self._stable_nodes + split_top_level(html, len(self._stable_html))
+        else:
+            nodes = split_top_level(html)
+        # 最后一个节点可能仍在增长，只把它之前的部分记为稳定前缀
+        if len(nodes) > 1:
+            self._stable_nodes = nodes[:-1]
+            self._stable_html = html[:nodes[-1][2]]
+        else:
+            self._stable_nodes = []
+            self._stable_html = ''
+        return nodes
+
+    def _convert_incremental(self, html: str) -> str:
+        nodes = self._split(html)
+        for kind, name, _, _ in nodes:
+            if kind == 'tag' and name in SIBLING_DEPENDENT_TAGS:
+                raise _Unsupported(name)
+
+        cache = {}
+        child_strings = []
+        next_content = None
+        # 倒序遍历以便得到每个节点之后的第一个内容节点（ul/ol 的转换依赖它）
+        for i in range(len(nodes) - 1, -1, -1):
+            node = nodes[i]
+            prev_node = nodes[i - 1] if i > 0 else None
+            next_node = nodes[i + 1] if i + 1 < len(nodes) else None
+            segment = html[node[2]:node[3]]
+            key = (segment, _stub(prev_node, html), _stub(next_node, html), _stub(next_content, html))
+            text = self._cache.get(key)
+            if text is None:
+                self.misses += 1
+                text = self._convert_node(node, key)
+            else:
+                self.hits += 1
+            cache[key] = text
+            child_strings.append(text)
+            if _is_content(node, html):
+                next_content = node
+        child_strings.reverse()
+        # 只保留本次用到的条目，缓存大小与回答的块数同阶
+        self._cache = cache
+        return self._join(child_strings)
+
+    def _convert_node(self, node, key):
+        """在带占位兄弟节点的迷你文档中转换单个顶层节点"""
+        segment, prev_stub, next_stub, next_content_stub = key
+        kind = node[0]
+        if kind == 'comment':
+            return ''
+        tail = next_stub
+        if next_content_stub and next_content_stub != next_stub:
+            tail += next_content_stub
+        soup = BeautifulSoup(prev_stub + segment + tail, **self.converter.options['bs4_options'])
+        children = list(soup.children)
+        el = children[1] if prev_stub else children[0]
+
+        if isinstance(el, (Comment, Doctype)):
+            return ''
+        if isinstance(el, NavigableString) and str(el).strip() == '':
+            # 对应 process_tag 中顶层 _can_ignore 的判定（[document] 不移除内部空白）
+            if (should_remove_whitespace_outside(el.previous_sibling)
+                    or should_remove_whitespace_outside(el.next_sibling)):
+                return ''
+        return self.converter.process_element(el, parent_tags={'[document]'})
+
+    def _join(self, child_strings):
+        """复刻 MarkdownConverter.process_tag 对顶层子节点的换行合并与文档级 strip"""
+        updated_child_strings = ['']
+        for child_string in child_strings:
+            if not child_string:
+                continue
+            leading_nl, content, trailing_nl = re_extract_newlines.match(child_string).groups()
+            if updated_child_strings[-1] and leading_nl:
+                prev_trailing_nl = updated_child_strings.pop()
+                num_newlines = min(2, max(len(prev_trailing_nl), len(leading_nl)))
+                leading_nl = '\n' * num_newlines
+            updated_child_strings.extend([leading_nl, content, trailing_nl])
+        text = ''.join(updated_child_strings)
+        return self.converter.convert__document_(None, text, parent_tags=set())
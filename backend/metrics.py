@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+指标采集与 Prometheus 文本格式输出
+
+一次对话的各阶段（租用标签页、激活标签页、写入提示词、输入发送、等待回答框、首个内容块、Markdown 转换、
+结束判定滞后、整体生成、回收标签页）用 span() 计时，按 stage / model 记入直方图 aiworld_stage_seconds；
+WebSocket 发送耗时、进行中的任务数、排队深度等由 server.py 在 /metrics 请求时补充。
+各指标可在工作线程中安全更新。
+
+分片模式（SHARDS > 0）下生成发生在各分片进程里：前端在 /metrics 请求时经管道取回各分片的 snapshot()，
+与本进程的指标一起输出，分片的序列多一个 shard 标签（用 sum without (shard) 得到全局值）。
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from logs import get_logger, model_var
+
+log = get_logger('metrics')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = []
+
+
+def _label_str(names, values) -> str:
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"')) for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict):
+        return tuple(labels.get(n, '') for n in self.labels)
+
+    def render(self, shards: dict = None) -> list:
+        """shards: Key: 分片序号, Value: 该分片中本指标的 [(标签值, 值)]"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.items():
+            lines.extend(self._series(self.labels, key, value))
+        for shard, items in sorted((shards or {}).items()):
+            for key, value in items:
+                lines.extend(self._series(self.labels + ('shard',), tuple(key) + (shard,), value))
+        return lines
+
+    def items(self) -> list:
+        """[(标签值, 值)] 的副本（可经管道传给前端进程）"""
+        with self._lock:
+            return [(key, list(value) if isinstance(value, list) else value)
+                    for key, value in sorted(self.values.items())]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def _series(self, names, key, value) -> list:
+        return [f"{self.name}{_label_str(names, key)} {value}"]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # Key: 标签值, Value: [各桶计数..., sum, count]
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _series(self, names, key, series) -> list:
+        lines = [f"{self.name}_bucket{_label_str(names + ('le',), key + (bound,))} {count}"
+                 for bound, count in zip(self.buckets, series)]
+        lines.append(f"{self.name}_bucket{_label_str(names + ('le',), key + ('+Inf',))} {series[-1]}")
+        lines.append(f"{self.name}_sum{_label_str(names, key)} {series[-2]}")
+        lines.append(f"{self.name}_count{_label_str(names, key)} {series[-1]}")
+        return lines
+
+
+def snapshot() -> dict:
+    """本进程所有指标的当前值，Key: 指标名, Value: [(标签值, 值)]（分片进程经管道交给前端）"""
+    return {metric.name: metric.items() for metric in _registry}
+
+
+def render(shards: dict = None) -> str:
+    """shards: Key: 分片序号, Value: 该分片的 snapshot()"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render({index: values.get(metric.name, []) for index, values in (shards or {}).items()}))
+    return '\n'.join(lines) + '\n'
+
+
+# --- 指标定义 ---
+
+STAGE_SECONDS = Histogram('aiworld_stage_seconds', '对话各阶段耗时', ('stage', 'model'))
+WS_SEND_SECONDS = Histogram('aiworld_ws_send_seconds', 'WebSocket 单帧发送耗时',
+                            buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5))
+WS_COALESCED = Counter('aiworld_ws_coalesced_total', '客户端跟不上时被新内容替换掉的内容块数')
+WS_QUEUE_DEPTH = Gauge('aiworld_ws_queue_depth', '所有连接发送队列中待发送的帧数')
+WS_QUEUE_BYTES = Gauge('aiworld_ws_queue_bytes', '所有连接发送队列中待发送的内容大小（字符数）')
+CHATS_TOTAL = Counter('aiworld_chats_total', '按结果统计的对话数', ('model', 'outcome'))
+CHUNKS_TOTAL = Counter('aiworld_chunks_total', '发送给前端的内容帧数', ('model',))
+ACTIVE_TASKS = Gauge('aiworld_active_tasks', '进行中的生成任务数')
+QUEUED_CHATS = Gauge('aiworld_queued_chats', '等待生成名额的请求数')
+POOL_BUSY = Gauge('aiworld_pool_busy_tabs', '标签页池中占用的标签页数', ('model',))
+POOL_QUEUE = Gauge('aiworld_pool_queue_depth', '等待标签页的请求数', ('model',))
+TAB_DOM_NODES = Gauge('aiworld_tab_dom_nodes', '标签页最近一次采样的 DOM 节点数', ('model', 'slot'))
+TAB_JS_HEAP = Gauge('aiworld_tab_js_heap_bytes', '标签页最近一次采样的 JS 堆已用大小（字节）', ('model', 'slot'))
+TAB_CPU_SECONDS = Gauge('aiworld_tab_cpu_seconds', '标签页主线程累计耗时（秒，Performance.getMetrics 的 TaskDuration）',
+                        ('model', 'slot'))
+TAB_RECYCLES = Counter('aiworld_tab_recycles_total', '超出预算被回收的标签页数', ('model', 'reason'))
+PROCESS_RSS = Gauge('process_resident_memory_bytes', '进程常驻内存（字节）')
+
+
+def process_rss():
+    """当前进程的常驻内存字节数（读取 /proc，其他平台返回 None）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def observe_stage(stage: str, seconds: float, model: str = None):
+    STAGE_SECONDS.observe(seconds, stage=stage, model=model or model_var.get() or '')
+
+
+@contextmanager
+def span(stage: str, model: str = None, **fields):
+    """计时一个阶段：记入直方图并输出 debug 日志（with 块内抛出的异常照常传播）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe_stage(stage, elapsed, model)
+        log.debug("阶段耗时", stage=stage, seconds=round(elapsed, 4), **fields)
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+网络层流式响应捕获
+
+DOM 抓取要等页面渲染、再加上轮询间隔，且站点改一个 CSS 类名就会失效。
+模型可以在 MODEL_CONFIG 中声明其流式补全请求的 URL 正则和帧解析器：
+
+    'stream': {'url': r'/api/v0/chat/completion', 'parser': 'sse_patch'}
+
+bot 发送消息前，在独立的 CDP 会话上开启 Network 域；匹配到该请求的响应后调用
+Network.streamResourceContent，之后每个 Network.dataReceived 事件都携带新到达的原始字节，
+由解析器切分成 SSE / NDJSON 帧并提取增量文本。捕获失败（没有匹配请求、连接中断）时
+由 bot 回退到 DOM 监听循环。
+"""
+import asyncio
+import base64
+import codecs
+import json
+import re
+
+from DrissionPage._base.driver import Driver
+
+from logs import get_logger
+
+log = get_logger('capture')
+
+
+class CaptureFailed(Exception):
+    """未捕获到流式请求，或流中途失败"""
+
+
+# --- 帧解析器 ---
+
+class _LineParser:
+    """按行切分原始文本流，子类实现 parse_line 返回增量文本（或 None）"""
+
+    def __init__(self, spec: dict):
+        self.spec = spec
+        self._buffer = ''
+
+    def feed(self, text: str):
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        tokens = []
+        for line in lines:
+            token = self.parse_line(line.rstrip('\r'))
+            if token:
+                tokens.append(token)
+        return tokens
+
+    def parse_line(self, line: str):
+        raise NotImplementedError
+
+
+def _dig(obj, path):
+    """按路径 (键名 / 下标列表) 取值，路径不存在时返回 None"""
+    for key in path:
+        try:
+            obj = obj[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return obj
+
+
+class SSEJsonParser(_LineParser):
+    """
+    标准 SSE：data: {...}，用 spec['path'] 指定增量文本的位置，
+    默认为 OpenAI 兼容格式 choices[0].delta.content
+    """
+
+    def parse_line(self, line):
+        if not line.startswith('data:'):
+            return None
+        payload = line[5:].strip()
+        if not payload or payload == '[DONE]':
+            return None
+        try:
+            obj = json.loads(payload)
+        except ValueError:
+            return None
+        value = _dig(obj, self.spec.get('path', ['choices', 0, 'delta', 'content']))
+        return value if isinstance(value, str) else None
+
+
+class NDJSONParser(_LineParser):
+    """每行一个 JSON 对象，同样用 spec['path'] 指定增量文本"""
+
+    def parse_line(self, line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            return None
+        value = _dig(obj, self.spec.get('path', ['content']))
+        return value if isinstance(value, str) else None
+
+
+class SSEPatchParser(_LineParser):
+    """
+    「JSON patch 增量」风格的 SSE（DeepSeek / ChatGPT 网页端）：
+    data: {"v": "文本"} 表示向当前字段追加；{"p": 路径, "o": "append", "v": "文本"} 指定字段；
+    {"o": "patch", "v": [...]} 为批量操作。只收集路径匹配 spec['content_path'] 的追加文本。
+    """
+
+    def __init__(self, spec):
+        super().__init__(spec)
+        self._content_re = re.compile(spec.get('content_path', r'content'))
+        self._path = None
+
+    def parse_line(self, line):
+        if not line.startswith('data:'):
+            return None
+        try:
+            obj = json.loads(line[5:].strip())
+        except ValueError:
+            return None
+        return ''.join(self._apply(obj)) or None
+
+    def _apply(self, op):
+        if not isinstance(op, dict):
+            return []
+        if 'p' in op:
+            self._path = op['p']
+        value = op.get('v')
+        if op.get('o', '').lower() == 'patch' and isinstance(value, list):
+            return [t for sub in value for t in self._apply(sub)]
+        if isinstance(value, str) and op.get('o', 'append').lower() == 'append':
+            if self._path is None or self._content_re.search(self._path):
+                return [value]
+        return []
+
+
+PARSERS = {
+    'sse_json': SSEJsonParser,
+    'ndjson': NDJSONParser,
+    'sse_patch': SSEPatchParser,
+}
+
+
+# --- 捕获器 ---
+
+class NetworkCapture:
+    """单次生成的网络流捕获，start/stop 需在标签页工作线程中调用"""
+
+    def __init__(self, tab, spec: dict, loop: asyncio.AbstractEventLoop):
+        self.tab = tab
+        self.spec = spec
+        self.loop = loop
+        self.url_re = re.compile(spec['url'])
+        self.parser = PARSERS[spec.get('parser', 'sse_json')](spec)
+        self._driver = None
+        self._request_id = None
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._queue = asyncio.Queue()
+
+    def start(self) -> bool:
+        """[工作线程] 在独立 CDP 会话上开启网络事件监听（与 DrissionPage 的 listen 做法一致）"""
+        try:
+            self._driver = Driver(self.tab._target_id, self.tab.browser._ws_address)
+            self._driver.session_id = self._driver.run(
+                'Target.attachToTarget', targetId=self.tab._target_id, flatten=True)['sessionId']
+            self._driver.run('Network.enable')
+            self._driver.set_callback('Network.responseReceived', self._on_response)
+            self._driver.set_callback('Network.dataReceived', self._on_data)
+            self._driver.set_callback('Network.loadingFinished', self._on_finished)
+            self._driver.set_callback('Network.loadingFailed', self._on_failed)
+            return True
+        except Exception as e:
+            log.warning("网络捕获启动失败，使用 DOM 监听", error=str(e))
+            self.stop()
+            return False
+
+    def stop(self):
+        """[工作线程] 关闭独立的 CDP 会话"""
+        if self._driver:
+            try:
+                self._driver.stop()
+            except Exception:
+                pass
+            self._driver = None
+
+    def _put(self, item):
+        self.loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    def _feed(self, data: bytes):
+        text = self._decoder.decode(data)
+        for token in self.parser.feed(text):
+            self._put(('token', token))
+
+    # [CDP 事件线程] 回调
+    def _on_response(self, **kwargs):
+        if self._request_id or not self.url_re.search(kwargs['response']['url']):
+            return
+        self._request_id = kwargs['requestId']
+        try:
+            result = self._driver.run('Network.streamResourceContent', requestId=self._request_id)
+        except Exception as e:
+            self._put(('failed', str(e)))
+            return
+        if not isinstance(result, dict) or 'error' in result:
+            self._put(('failed', str(result)))
+            return
+        self._put(('matched', None))
+        if result.get('bufferedData'):
+            self._feed(base64.b64decode(result['bufferedData']))
+
+    def _on_data(self, **kwargs):
+        if kwargs.get('requestId') == self._request_id and kwargs.get('data'):
+            self._feed(base64.b64decode(kwargs['data']))
+
+    def _on_finished(self, **kwargs):
+        if kwargs.get('requestId') == self._request_id:
+            self._feed(b'\n')  # 冲刷最后一行
+            self._put(('finished', None))
+
+    def _on_failed(self, **kwargs):
+        if kwargs.get('requestId') == self._request_id:
+            self._put(('failed', kwargs.get('errorText')))
+
+    async def stream(self, match_timeout: float = 10, idle_timeout: float = 60):
+        """
+        逐次产出累计的回答文本。
+        没有匹配到请求或流中途失败时抛出 CaptureFailed，调用方据此回退到 DOM 监听。
+        """
+        content = ''
+        timeout = match_timeout
+        while True:
+            try:
+                kind, value = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                if not content:
+                    raise CaptureFailed('未捕获到流式请求')
+                return
+            if kind == 'matched':
+                timeout = idle_timeout
+            elif kind == 'token':
+                content += value
+                yield content
+            elif kind == 'finished':
+                return
+            elif kind == 'failed':
+                raise CaptureFailed(value or '流式请求失败')
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+单次往返的页面状态探针
+
+原先每次轮询要：tab.eles(answer) 取全部回答、读取 inner_html、再用 tab.ele 逐个尝试停止按钮的
+备用选择器，每一步都是一次（或多次）CDP 往返，未匹配的选择器还要等满 DrissionPage 的隐式等待。
+探针把这些合并成一次 Runtime.evaluate：页面内按顺序尝试各候选选择器，返回回答数量、
+最新回答的 HTML（长度没变时只返回长度）和停止按钮状态。
+
+每个模型记住上次命中的选择器（SelectorCache），下次优先尝试它，只有失配时才依次尝试备用选择器；
+命中 / 失配次数会被统计，站点改版导致主选择器失配时打印日志。
+
+selectors 中配置了 'turn'（每一轮对话的容器）时，回答只在发送后新增的轮次中查找，
+数量也按轮次计，不再每次轮询都对整页的历史回答做 querySelectorAll。
+"""
+import json
+import threading
+
+from dom_observer import css_of
+from logs import get_logger
+
+log = get_logger('selectors')
+
+PROBE_JS = """
+(function(answerSels, stopSels, turnSel, prevLen, since) {
+    const result = {answer: -1, stop: -1, count: 0, len: 0, html: null, present: false, fresh: false, scoped: false};
+    let last = null;
+    // 配置了轮次容器时只在最新的轮次里找回答：轮次列表的父节点缓存在页面上，每次从末尾往前看新增的轮次，
+    // 不随对话变长而变慢；页面上还没有轮次（新对话）或轮次选择器失配时退回整页查找
+    let root = null;
+    if (turnSel) {
+        root = window.__aiworldTurnRoot;
+        if (!(root && root.isConnected)) {
+            const first = document.querySelector(turnSel);
+            root = window.__aiworldTurnRoot = first ? first.parentElement : null;
+        }
+    }
+    if (root) {
+        result.scoped = true;
+        result.count = root.childElementCount;
+        let el = root.lastElementChild;
+        for (let n = result.count - Math.max(since, 0); el && n > 0 && !last; el = el.previousElementSibling, n--) {
+            if (!el.matches(turnSel)) continue;
+            for (let i = 0; i < answerSels.length; i++) {
+                const nodes = el.querySelectorAll(answerSels[i]);
+                if (nodes.length) { last = nodes[nodes.length - 1]; result.answer = i; break; }
+            }
+        }
+        result.fresh = !!last;
+    } else {
+        for (let i = 0; i < answerSels.length; i++) {
+            const nodes = document.querySelectorAll(answerSels[i]);
+            if (nodes.length) {
+                last = nodes[nodes.length - 1];
+                result.answer = i;
+                result.count = nodes.length;
+                break;
+            }
+        }
+        result.fresh = result.count > since;
+    }
+    if (last) {
+        result.len = last.innerHTML.length;
+        if (result.len !== prevLen) result.html = last.innerHTML;
+    }
+    for (let i = 0; i < stopSels.length; i++) {
+        if (document.querySelector(stopSels[i])) { result.stop = i; result.present = true; break; }
+    }
+    return JSON.stringify(result);
+})(%s, %s, %s, %d, %d);
+"""
+
+
+def _candidates(selector_config):
+    return selector_config if isinstance(selector_config, list) else [selector_config]
+
+
+class SelectorCache:
+    """某个模型各角色（input / send / stop / answer）上次命中的选择器及命中统计"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        # Key: 角色, Value: 上次命中的选择器
+        self.preferred = {}
+        # Key: 角色, Value: {"hits": 优先选择器命中, "fallbacks": 备用选择器命中, "none": 全部未命中}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def ordered(self, role: str, selector_config):
+        """上次命中的选择器排在最前"""
+        candidates = _candidates(selector_config)
+        preferred = self.preferred.get(role)
+        if preferred in candidates and candidates[0] != preferred:
+            return [preferred] + [s for s in candidates if s != preferred]
+        return list(candidates)
+
+    def record(self, role: str, ordered: list, index: int):
+        """记录一次查找结果：index 为命中的候选下标，-1 表示全部未命中"""
+        with self._lock:
+            counter = self.counters.setdefault(role, {"hits": 0, "fallbacks": 0, "none": 0})
+            if index < 0:
+                counter["none"] += 1
+                return
+            if index == 0:
+                counter["hits"] += 1
+            else:
+                counter["fallbacks"] += 1
+                log.warning("选择器失配，改用后备选择器", model=self.model_name, role=role,
+                            selector=ordered[0], fallback=ordered[index])
+            self.preferred[role] = ordered[index]
+
+    def resolve(self, tab, role: str, selector_config, wait: bool = True):
+        """
+        [工作线程] 查找元素：先不等待地按优先顺序尝试所有候选，都没有时
+        （wait=True）再对首选选择器使用 DrissionPage 的默认隐式等待
+        """
+        ordered = self.ordered(role, selector_config)
+        for i, sel in enumerate(ordered):
+            ele = tab.ele(sel, timeout=0)
+            if ele:
+                self.record(role, ordered, i)
+                return ele
+        if wait:
+            ele = tab.ele(ordered[0])
+            if ele:
+                self.record(role, ordered, 0)
+                return ele
+        self.record(role, ordered, -1)
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {role: dict(counter, preferred=self.preferred.get(role))
+                    for role, counter in self.counters.items()}
+
+
+# Key: model_name, Value: SelectorCache
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def selector_cache(model_name: str) -> SelectorCache:
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = SelectorCache(model_name)
+        return _caches[model_name]
+
+
+def selector_summary() -> dict:
+    """各模型选择器的命中 / 失配统计"""
+    with _caches_lock:
+        items = list(_caches.items())
+    return {name: cache.stats() for name, cache in items}
+
+
+class PageProbe:
+    """把「最新回答 + 回答数量 + 停止按钮」合并为一次 JS 调用；选择器不是 CSS 时不可用"""
+
+    def __init__(self, tab, model_name: str, selectors: dict):
+        self.tab = tab
+        self.cache = selector_cache(model_name)
+        self.selectors = selectors
+        self.available = all(css_of(sel) for sel in _candidates(selectors['answer']) + _candidates(selectors['stop']))
+        # 轮次容器（可选，不是 CSS 时忽略）
+        self.turn = css_of(selectors['turn']) if selectors.get('turn') else None
+        # 发送前的数量：只有之后新增的轮次 / 回答才算本次的回答
+        self.since = 0
+
+    def run(self, previous_len: int = -1) -> dict:
+        """
+        [工作线程] 返回 {"count", "fresh", "len", "html", "present"}：
+        count 为轮次数（未配置或未找到轮次容器时为回答数），fresh 表示 since 之后出现了回答，
+        html 仅在最新回答的长度与 previous_len 不同时返回，否则为 None
+        """
+        answer_order = self.cache.ordered('answer', self.selectors['answer'])
+        stop_order = self.cache.ordered('stop', self.selectors['stop'])
+        raw = self.tab.run_js(PROBE_JS % (json.dumps([css_of(s) for s in answer_order]),
+                                          json.dumps([css_of(s) for s in stop_order]),
+                                          json.dumps(self.turn), previous_len, self.since), as_expr=True)
+        result = json.loads(raw)
+        # 按轮次查找时最新的轮次可能还是提问本身，没找到回答不算失配
+        if result['answer'] >= 0 or not result['scoped']:
+            self.cache.record('answer', answer_order, result['answer'])
+        # 停止按钮不存在是常态（生成结束），只统计命中
+        if result['stop'] >= 0:
+            self.cache.record('stop', stop_order, result['stop'])
+        return result
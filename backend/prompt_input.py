@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+提示词输入
+
+原先各 bot 发送前 input_ele.clear() + input_ele.input(message)，再固定 sleep(0.5)：清空要逐个发送按键事件，
+输入前还要等元素可点击；contenteditable 编辑器（GPT 的 ProseMirror、Kimi、Gemini 的 Quill）对多行文本的
+insertText 处理不一致，几 KB 的日志 / 代码粘贴进去容易丢换行。
+
+现在按模型选择一次性写入的方式（MODEL_CONFIG 中的 'input_mode'，默认 INPUT_MODE）：
+  value   textarea / input：用原生 setter 写入 value 并派发 input 事件（React 受控组件也能感知）
+  paste   富文本编辑器：选中编辑器全部内容后派发带 text/plain 的 paste 事件，由编辑器自己一次性解析成段落
+  insert  CDP Input.insertText：选中全部内容后以一次文本提交替换（通用）
+  type    DrissionPage 的 ele.input（旧行为）
+写入后读回编辑器文本（忽略空白差异）确认与提示词一致才发送，代替固定等待；
+不一致时依次回退到 insert / type，并记住该模型最后成功的方式。
+"""
+import re
+import threading
+import time
+
+from config import INPUT_MODE, INPUT_VERIFY_TIMEOUT
+from logs import get_logger
+
+log = get_logger('input')
+
+MODES = ('value', 'paste', 'insert', 'type')
+
+# 编辑器根节点：选择器可能指向 contenteditable 内部的 <p>
+_ROOT_JS = """
+const root = (el) => el.closest('textarea, input, [contenteditable="true"], [contenteditable=""]') || el;
+const readText = (el) => (el.tagName === 'TEXTAREA' || el.tagName === 'INPUT') ? el.value : el.innerText;
+const selectAll = (el) => {
+    el.focus();
+    if (el.tagName === 'TEXTAREA' || el.tagName === 'INPUT') { el.select(); return; }
+    const range = document.createRange();
+    range.selectNodeContents(el);
+    const sel = window.getSelection();
+    sel.removeAllRanges();
+    sel.addRange(range);
+};
+"""
+
+_VALUE_JS = _ROOT_JS + """
+const el = root(this);
+if (el.tagName !== 'TEXTAREA' && el.tagName !== 'INPUT') return null;
+const proto = el.tagName === 'TEXTAREA' ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, arguments[0]);
+el.dispatchEvent(new Event('input', {bubbles: true}));
+el.focus();
+return readText(el);
+"""
+
+_PASTE_JS = _ROOT_JS + """
+const el = root(this);
+selectAll(el);
+const data = new DataTransfer();
+data.setData('text/plain', arguments[0]);
+el.dispatchEvent(new ClipboardEvent('paste', {clipboardData: data, bubbles: true, cancelable: true}));
+return readText(el);
+"""
+
+_SELECT_JS = _ROOT_JS + """
+selectAll(root(this));
+"""
+
+_READ_JS = _ROOT_JS + """
+return readText(root(this));
+"""
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Key: model_name, Value: 该模型最后一次成功的写入方式
+_preferred = {}
+_preferred_lock = threading.Lock()
+
+
+def _normalize(text) -> str:
+    return _WHITESPACE.sub('', text or '')
+
+
+def _write(tab, ele, message: str, mode: str):
+    """[工作线程] 按指定方式写入，返回写入后立即读回的文本（无法读回时为 None）"""
+    if mode == 'value':
+        text = ele.run_js(_VALUE_JS, message)
+        if text is None:
+            raise ValueError("输入框不是 textarea / input")
+        return text
+    if mode == 'paste':
+        return ele.run_js(_PASTE_JS, message)
+    if mode == 'insert':
+        ele.run_js(_SELECT_JS)
+        tab.run_cdp('Input.insertText', text=message)
+        return None
+    ele.clear()
+    ele.input(message)
+    return None
+
+
+def _verify(ele, expected: str, text, timeout: float) -> bool:
+    """[工作线程] 等到编辑器文本与提示词一致（编辑器可能在下一帧才更新 DOM）"""
+    deadline = time.time() + timeout
+    while True:
+        if text is not None and _normalize(text) == expected:
+            return True
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.02)
+        text = ele.run_js(_READ_JS)
+
+
+def fill_prompt(tab, ele, message: str, model_name: str, mode: str = None):
+    """
+    [工作线程] 把提示词整体写入输入框并确认，返回成功的写入方式；所有方式都未能确认时返回 None
+    （此时输入框中是最后一次尝试写入的内容）
+    """
+    with _preferred_lock:
+        first = _preferred.get(model_name) or mode or INPUT_MODE
+    order = [first] + [m for m in ('insert', 'type') if m != first]
+    expected = _normalize(message)
+    for current in order:
+        start = time.perf_counter()
+        try:
+            text = _write(tab, ele, message, current)
+            ok = _verify(ele, expected, text, INPUT_VERIFY_TIMEOUT)
+        except Exception as e:
+            log.warning("写入输入框失败", model=model_name, mode=current, error=str(e))
+            continue
+        if ok:
+            if current != first:
+                log.warning("输入方式回退", model=model_name, mode=first, fallback=current)
+            with _preferred_lock:
+                _preferred[model_name] = current
+            log.debug("提示词已写入", model=model_name, mode=current, chars=len(message),
+                      seconds=round(time.perf_counter() - start, 4))
+            return current
+    return None
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+首轮提问的回答缓存与进行中请求合并
+
+很多用户会向同一个模型发送相同的开场提问。开启 RESPONSE_CACHE 后，新对话的第一条消息按
+(模型, 规范化后的提问) 查缓存：
+  命中:     直接回放缓存的流，不再驱动浏览器标签页；
+  正在生成: 同样的提问正在由另一个对话生成时，挂到那条流上一起接收（合并），不再占用新的标签页；
+  未命中:   由独立的生产任务驱动浏览器生成，完整结束后写入缓存。
+
+缓存按 TTL 过期，总字节数超出上限时按 LRU 淘汰。流以增量形式 (offset, delta) 保存，回放时还原为完整快照。
+生产任务不属于任何一个客户端：发起者停止或断开时，只要还有其他订阅者，生成就继续；
+最后一个订阅者离开时才取消生产任务并点击停止按钮。
+
+注意：命中缓存的对话在浏览器中没有对应的会话，后续追问会在新会话中进行（模型看不到这一轮），
+因此默认关闭，仅适合开场白类的提问。
+"""
+import asyncio
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+from stream_protocol import common_prefix_len
+
+
+def normalize_prompt(text: str) -> str:
+    """全角 / 半角统一、合并空白"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def _to_delta(previous: str, content: str):
+    offset = len(previous) if content.startswith(previous) else common_prefix_len(previous, content)
+    return offset, content[offset:]
+
+
+class CachedResponse:
+    def __init__(self, chunks: list, created_at: float):
+        # [(offset, delta), ...]
+        self.chunks = chunks
+        self.created_at = created_at
+        self.size = sum(len(delta.encode('utf-8')) for _, delta in chunks)
+
+
+class Flight:
+    """一次进行中的真实生成，可以有多个订阅者"""
+
+    def __init__(self, key, owner_chat_id: str):
+        self.key = key
+        self.owner = owner_chat_id
+        self.chunks = []
+        self.content = ""
+        self.done = False
+        self.error = None
+        self.subscribers = set()
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def push(self, content: str):
+        self.chunks.append(_to_delta(self.content, content))
+        self.content = content
+        self._notify()
+
+    def finish(self, error: BaseException = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        """从头开始产出完整快照，直到生成结束"""
+        content, i = "", 0
+        while True:
+            while i < len(self.chunks):
+                offset, delta = self.chunks[i]
+                content = content[:offset] + delta
+                i += 1
+                yield content
+            if self.done:
+                if self.error:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = 3600, max_bytes: int = 64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Key: (model, 规范化提问), Value: CachedResponse，按最近使用排序
+        self.entries = OrderedDict()
+        self.bytes = 0
+        # Key: (model, 规范化提问), Value: Flight
+        self.flights = {}
+        # Key: chat_id, Value: 该对话订阅的 Flight
+        self.chat_flights = {}
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    # --- 缓存条目 ---
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created_at > self.ttl:
+            self._evict(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, chunks: list):
+        if key in self.entries:
+            self._evict(key)
+        entry = CachedResponse(chunks, time.time())
+        if entry.size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.bytes += entry.size
+        while self.bytes > self.max_bytes:
+            self._evict(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _evict(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.bytes -= entry.size
+
+    # --- 流 ---
+
+    async def stream(self, model_name: str, chat_id: str, message: str, produce, on_abandon=None):
+        """
+        产出回答的完整快照。produce(chat_id) 返回真实生成的异步生成器；
+        生产任务因所有订阅者离开而被取消时调用 on_abandon(owner_chat_id)。
+        """
+        key = (model_name, normalize_prompt(message))
+        entry = self._get(key)
+        if entry:
+            self.hits += 1
+            self.bytes_saved += entry.size
+            content = ""
+            for offset, delta in entry.chunks:
+                content = content[:offset] + delta
+                yield content
+                await asyncio.sleep(0)
+            return
+
+        flight = self.flights.get(key)
+        if flight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            flight = self.flights[key] = Flight(key, chat_id)
+            flight.task = asyncio.create_task(self._produce(flight, produce))
+
+        flight.subscribers.add(chat_id)
+        self.chat_flights[chat_id] = flight
+        completed = False
+        try:
+            async for content in flight.follow():
+                yield content
+            completed = True
+        finally:
+            flight.subscribers.discard(chat_id)
+            if self.chat_flights.get(chat_id) is flight:
+                del self.chat_flights[chat_id]
+            if completed and chat_id != flight.owner:
+                self.bytes_saved += len(flight.content.encode('utf-8'))
+            if not flight.subscribers and not flight.done:
+                # 最后一个订阅者离开（停止 / 断开 / 新提问），结束真实生成
+                flight.task.cancel()
+                if on_abandon:
+                    on_abandon(flight.owner)
+
+    async def _produce(self, flight: Flight, produce):
+        try:
+            async for content in produce(flight.owner):
+                flight.push(content)
+        except asyncio.CancelledError:
+            flight.finish()
+            raise
+        except Exception as e:
+            flight.finish(e)
+        else:
+            flight.finish()
+            # 只缓存正常结束、且不是错误提示的回答
+            if flight.content and not flight.content.startswith("Error:"):
+                self._put(flight.key, flight.chunks)
+        finally:
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key]
+
+    def is_shared(self, chat_id: str) -> bool:
+        """该对话正在接收的流是否还有其他订阅者（此时停止只应断开该对话，而不点击停止按钮）"""
+        flight = self.chat_flights.get(chat_id)
+        return bool(flight and len(flight.subscribers) > 1)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "evictions": self.evictions,
+            "in_flight": len(self.flights),
+        }
@@ -1,18 +1,48 @@
 import asyncio
+import itertools
 import os
-import json
-import glob
 import time
 from typing import List, Optional
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse
 from pydantic import BaseModel
-from crawler_base import BotFactory, ChromiumPage
+from crawler_base import BotFactory
+from browser_io import shutdown_all as shutdown_browser_workers
+from tab_pool import TabPool
+from shard import ShardRouter
+from completion import completion_summary
+from page_probe import selector_summary
+from history_store import make_store
+from history_journal import HistoryWriter
+from history_index import HistoryIndex
+from history_search import SearchIndex
+from response_cache import ResponseCache
+from warmup import Warmup, launch_browser
+from lean_mode import lean_summary
+from batch import BatchRunner
+from config import (MODEL_CONFIG, TAB_POOL_SIZE, TAB_POOL_MAX_QUEUE, TAB_POOL_WAIT_TIMEOUT,
+                    SHARDS, SHARD_DATA_DIR, HISTORY_BACKEND, HISTORY_DIR, HISTORY_DB, HISTORY_SCAN_INTERVAL,
+                    RESPONSE_CACHE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES, BOT_BACKEND,
+                    WS_SEND_QUEUE_BYTES, WS_ACK_WINDOW, MAX_CONCURRENT_CHATS, MAX_CONCURRENT_PER_MODEL, CHAT_QUEUE_TIMEOUT,
+                    CHROME_PATH, WARMUP_TABS, BROWSER_START_TIMEOUT, JOBS_DIR, BATCH_CONCURRENCY,
+                    BATCH_MAX_ATTEMPTS, BATCH_RETRY_DELAY, TAB_BUDGET, TAB_RECYCLE_MODE)
+from stream_protocol import PROTOCOL_SNAPSHOT, make_encoder, parse_protocol
+from logs import bind, get_logger
+from metrics import (ACTIVE_TASKS, CHATS_TOTAL, POOL_BUSY, POOL_QUEUE, PROCESS_RSS, QUEUED_CHATS, WS_QUEUE_BYTES,
+                     WS_QUEUE_DEPTH, process_rss, render)
+from task_manager import AdmissionTimeout, TaskManager
+from ws_sender import ConnectionSender, sender_summary
+
+log = get_logger('server')
 
 # --- 配置 ---
-HISTORY_DIR = "history_storage"
-if not os.path.exists(HISTORY_DIR):
-    os.makedirs(HISTORY_DIR)
+history_store = make_store(HISTORY_BACKEND, HISTORY_DIR, HISTORY_DB)
+# 对话列表的内存摘要缓存（启动时构建，之后增量更新）
+history_search = SearchIndex()
+history_index = HistoryIndex(history_store, search=history_search)
+# 服务端记录每轮对话，后台批量落盘
+history_writer = HistoryWriter(history_store, index=history_index)
 
 app = FastAPI()
 
@@ -36,55 +66,67 @@ class ChatSession(BaseModel):
     messages: List[Message]
     updated_at: float
 
+class AppendMessage(BaseModel):
+    role: str
+    content: str
+    timestamp: Optional[float] = None
+    model: Optional[str] = None
+
+class JobItem(BaseModel):
+    model: str
+    prompt: str
+    id: Optional[str] = None  # 调用方自己的编号，原样写入结果
+
+class JobRequest(BaseModel):
+    items: List[JobItem]
+    max_attempts: Optional[int] = None
+
 # --- 历史记录 API ---
 
 @app.get("/api/history")
-async def get_history_list():
-    """获取所有对话的历史列表（按时间倒序）"""
-    sessions = []
-    files = glob.glob(os.path.join(HISTORY_DIR, "*.json"))
-
-    for f in files:
-        try:
-            with open(f, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                # 只返回列表需要的摘要信息，不返回所有 messages 以减少流量
-                sessions.append({
-                    "id": data.get("id"),
-                    "title": data.get("title", "New Chat"),
-                    "model": data.get("model"),
-                    "updated_at": data.get("updated_at", 0)
-                })
-        except Exception as e:
-            print(f"Error reading file {f}: {e}")
-            continue
+async def get_history_list(limit: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    获取对话的历史列表（按时间倒序），由内存摘要缓存提供。
+    不带参数时返回完整列表；带 limit / cursor 时分页返回 {"items", "next_cursor", "total"}
+    """
+    await history_writer.flush()
+    # 只返回列表需要的摘要信息，不返回所有 messages 以减少流量
+    if limit is None and cursor is None:
+        return history_index.all()
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    try:
+        return history_index.page(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # 按更新时间倒序排列
-    sessions.sort(key=lambda x: x["updated_at"], reverse=True)
-    return sessions
+@app.get("/api/history/search")
+async def search_history(q: str, limit: int = 20):
+    """全文检索历史消息，返回按相关度排序的对话及高亮片段"""
+    await history_writer.flush()
+    return await asyncio.to_thread(history_search.search, q, max(1, min(limit, 100)), history_index.sessions)
 
 @app.get("/api/history/{chat_id}")
 async def get_chat_detail(chat_id: str):
     """获取指定对话的完整内容"""
-    file_path = os.path.join(HISTORY_DIR, f"{chat_id}.json")
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Chat not found")
-
+    await history_writer.flush()
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        data = await asyncio.to_thread(history_store.get, chat_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return data
 
 @app.post("/api/history")
 async def save_chat(session: ChatSession):
-    """保存或更新对话"""
-    file_path = os.path.join(HISTORY_DIR, f"{session.id}.json")
+    """保存或更新对话（整体覆盖；常规对话由服务端逐条记录，见 append_message）"""
+    await history_writer.flush()
     try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            # model_dump() 是 pydantic v2 写法, v1 使用 dict()
-            # 为了兼容性，这里使用 jsonable_encoder 或者直接 dict()
-            json.dump(session.dict(), f, ensure_ascii=False, indent=2)
+        # model_dump() 是 pydantic v2 写法, v1 使用 dict()
+        data = session.dict()
+        await asyncio.to_thread(history_store.save, data)
+        history_index.put_session(data)
         return {"status": "success"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -92,69 +134,360 @@ async def save_chat(session: ChatSession):
 @app.delete("/api/history/{chat_id}")
 async def delete_chat(chat_id: str):
     """删除对话"""
-    file_path = os.path.join(HISTORY_DIR, f"{chat_id}.json")
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    await history_writer.flush()
+    if await asyncio.to_thread(history_store.delete, chat_id):
+        history_index.remove(chat_id)
         return {"status": "deleted"}
     raise HTTPException(status_code=404, detail="Chat not found")
 
+@app.post("/api/history/{chat_id}/messages")
+async def append_message(chat_id: str, message: AppendMessage):
+    """向对话追加一条消息（只写日志，不重写整个对话）"""
+    history_writer.append_message(chat_id, message.role, message.content, message.model, message.timestamp)
+    return {"status": "success"}
+
 # --- WebSocket & 浏览器逻辑 (保持不变) ---
 
 # 初始化浏览器
 # --- WebSocket & 浏览器逻辑 ---
 
 # 初始化浏览器
-try:
-    page = ChromiumPage()
-    print("浏览器后端初始化成功")
-except Exception as e:
-    print(f"浏览器启动失败: {e}")
-    page = None
-
-# 使用字典来管理并发任务和Bot实例
-# Key: model_name, Value: Task
-active_tasks = {}
-# Key: model_name, Value: Bot Instance
+# 分片模式下浏览器由各分片进程持有，前端进程只负责路由；mock 后端不启动浏览器
+# 浏览器在 startup 后于后台启动（见 start_browser），HTTP 接口不必等它
+page = None
+mock_backend = BOT_BACKEND == 'mock'
+router = ShardRouter(SHARDS, SHARD_DATA_DIR) if SHARDS > 0 and not mock_backend else None
+warmup = Warmup()
+
+# 每个模型一个标签页池，Key: model_name, Value: TabPool（浏览器启动后创建）
+tab_pools = {}
+
+async def start_browser():
+    """[后台任务] 启动浏览器、创建标签页池，并行打开各模型的标签页并等待就绪"""
+    global page, tab_pools
+    page = await warmup.launch(lambda: launch_browser(CHROME_PATH))
+    if page is None:
+        return
+    tab_pools = {
+        name: TabPool(name, page, conf, size=conf.get('tabs', TAB_POOL_SIZE), max_queue=TAB_POOL_MAX_QUEUE,
+                      budget={**TAB_BUDGET, **conf.get('tab_budget', {})}, recycle_mode=TAB_RECYCLE_MODE)
+        for name, conf in MODEL_CONFIG.items()
+    }
+    if WARMUP_TABS:
+        await warmup.warm_pools(tab_pools, lambda name: BotFactory.get_bot(name, page))
+    else:
+        warmup.track(tab_pools, 'lazy')
+
+@app.get("/health")
+async def get_health():
+    """启动状态：浏览器是否已启动、各模型标签页是否就绪（输入框已出现）"""
+    health = warmup.health()
+    if router:
+        shards = router.stats()
+        health["shards"] = shards
+        if not all(s["alive"] for s in shards):
+            health["status"] = "degraded"
+    return health
+
+@app.get("/api/pools")
+async def get_pool_stats():
+    """各模型标签页池的占用率、排队深度、排队等待时间，以及各标签页的资源采样与回收次数"""
+    return [pool.stats() for pool in tab_pools.values()]
+
+@app.get("/api/lean")
+async def get_lean_stats():
+    """各模型开启精简模式的标签页数与被拦截的请求数"""
+    return lean_summary()
+
+@app.get("/api/shards")
+async def get_shard_stats():
+    """分片模式下各浏览器进程的存活状态、重启次数与进行中的对话数"""
+    return router.stats() if router else []
+
+@app.get("/api/completion")
+async def get_completion_stats():
+    """各模型的 token 间隔分布与结束判定的检测滞后"""
+    return completion_summary()
+
+@app.get("/api/selectors")
+async def get_selector_stats():
+    """各模型选择器的命中统计与当前优先使用的选择器（用于发现站点改版）"""
+    return selector_summary()
+
+@app.on_event("startup")
+async def startup_event():
+    """构建对话列表缓存、启动后台写入任务；在后台启动浏览器（分片模式下启动浏览器工作进程）"""
+    await asyncio.to_thread(history_index.build)
+    log.info("对话列表缓存已构建", sessions=len(history_index.sessions), seconds=round(history_index.build_time, 2))
+    history_writer.start()
+    # 继续执行上次未完成的批量任务
+    await batch_runner.load()
+    if hasattr(history_store, 'scan'):
+        asyncio.create_task(scan_history_changes())
+    if router:
+        warmup.disable("分片模式：浏览器由各分片进程启动")
+        await router.start()
+    elif mock_backend:
+        warmup.disable("mock 后端不启动浏览器")
+    else:
+        asyncio.create_task(start_browser())
+
+async def scan_history_changes():
+    """定期按 mtime 发现外部对 history_storage 的修改（文件存储）"""
+    while True:
+        await asyncio.sleep(HISTORY_SCAN_INTERVAL)
+        try:
+            changes = await asyncio.to_thread(history_index.collect_changes)
+            history_index.apply_changes(changes)
+        except Exception as e:
+            log.error("扫描对话目录失败", error=str(e))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """服务关闭时停止批量任务（下次启动继续）、写完对话记录，释放各标签页的工作线程与分片进程"""
+    await batch_runner.shutdown()
+    await history_writer.close()
+    shutdown_browser_workers()
+    if router:
+        await router.shutdown()
+
+# 各连接的生成任务，以及全局 / 每个模型的并发上限与排队
+task_manager = TaskManager(MAX_CONCURRENT_CHATS,
+                           {name: conf.get('max_concurrent') for name, conf in MODEL_CONFIG.items()},
+                           MAX_CONCURRENT_PER_MODEL, CHAT_QUEUE_TIMEOUT)
+# 连接编号
+connection_ids = itertools.count(1)
+# Key: chat_id, Value: Bot Instance (用于点击对应标签页的停止按钮)
 active_bots = {}
+# Key: chat_id, Value: 当前流的帧编码器 (快照 / 增量)
+stream_encoders = {}
+# 首轮提问的回答缓存（可选）
+response_cache = ResponseCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES) if RESPONSE_CACHE else None
+
+@app.get("/api/cache")
+async def get_cache_stats():
+    """回答缓存的命中率、合并次数与节省的字节数"""
+    return response_cache.stats() if response_cache else {"enabled": False}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的指标（各阶段耗时直方图、WebSocket 发送耗时、任务数与标签页池占用；分片模式含各分片的指标）"""
+    ACTIVE_TASKS.set(task_manager.running)
+    QUEUED_CHATS.set(task_manager.queued)
+    for pool in tab_pools.values():
+        stats = pool.stats()
+        POOL_BUSY.set(stats["busy"], model=pool.model_name)
+        POOL_QUEUE.set(stats["queue_depth"], model=pool.model_name)
+    senders = sender_summary()
+    WS_QUEUE_DEPTH.set(senders["queue_depth"])
+    WS_QUEUE_BYTES.set(senders["queue_bytes"])
+    rss = process_rss()
+    if rss is not None:
+        PROCESS_RSS.set(rss)
+    # 分片模式下各阶段耗时记录在分片进程中，取回后以 shard 标签输出
+    shards = await router.collect_metrics() if router else None
+    return PlainTextResponse(render(shards), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/tasks")
+async def get_task_stats():
+    """进行中 / 排队中的生成数、各模型占用与排队等待时间"""
+    return task_manager.stats()
+
+@app.get("/api/connections")
+async def get_connection_stats():
+    """各 WebSocket 连接发送队列的深度、合并次数与发送阻塞时间"""
+    return sender_summary()
+
+async def chat_stream(model_name: str, chat_id: str, message: str):
+    """产出回答的完整 Markdown：分片模式转发给对应的浏览器进程，否则在本进程租用标签页生成"""
+    if router:
+        async for content in router.stream_chat(model_name, chat_id, message):
+            yield content
+        return
+
+    if not mock_backend:
+        # 浏览器仍在后台启动时等它完成
+        await warmup.wait_browser(BROWSER_START_TIMEOUT)
+    bot = BotFactory.get_bot(model_name, page)
+    active_bots[chat_id] = bot
+    try:
+        if mock_backend:
+            # mock 后端没有标签页，直接生成
+            source = bot.stream_chat(message)
+        else:
+            # 租用该模型的一个标签页，同一标签页同一时间只服务一次生成
+            source = tab_pools[model_name].stream_chat(bot, chat_id, message, TAB_POOL_WAIT_TIMEOUT)
+        async for content in source:
+            yield content
+    finally:
+        if active_bots.get(chat_id) is bot:
+            del active_bots[chat_id]
+
+def stop_chat(chat_id: str):
+    """点击对话所在标签页的停止按钮（提交到标签页工作线程，先于下一个租用者执行）"""
+    if router:
+        router.stop(chat_id)
+    elif chat_id in active_bots:
+        active_bots[chat_id].stop_generation()
+
+# 批量任务：与前端对话共用 bot、标签页池和生成名额
+batch_runner = BatchRunner(JOBS_DIR, chat_stream, task_manager.slot, stop_chat,
+                           {name: conf.get('batch_concurrency') for name, conf in MODEL_CONFIG.items()},
+                           BATCH_CONCURRENCY, BATCH_MAX_ATTEMPTS, BATCH_RETRY_DELAY)
+
+@app.post("/api/jobs")
+async def create_job(job: JobRequest):
+    """提交一批 {model, prompt}，后台执行，结果逐条写入 <job_id>.jsonl"""
+    if not job.items:
+        raise HTTPException(status_code=400, detail="items must not be empty")
+    unknown = sorted({item.model for item in job.items} - set(MODEL_CONFIG))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown model: {', '.join(unknown)}")
+    created = await batch_runner.submit([item.dict(exclude_none=True) for item in job.items], job.max_attempts)
+    return created.stats()
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """所有批量任务的进度（最新的在前）"""
+    return batch_runner.stats()
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """批量任务的进度：完成 / 失败 / 进行中 / 等待的条目数与各模型统计"""
+    job = batch_runner.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.stats()
+
+@app.get("/api/jobs/{job_id}/results")
+async def get_job_results(job_id: str):
+    """已完成条目的结果 JSONL（按完成顺序，每行带 index）"""
+    job = batch_runner.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not os.path.exists(job.output_path):
+        return PlainTextResponse("", media_type="application/x-ndjson")
+    return FileResponse(job.output_path, media_type="application/x-ndjson")
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """取消批量任务：停止正在生成的条目，已完成的结果保留"""
+    if job_id not in batch_runner.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await batch_runner.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return batch_runner.jobs[job_id].stats()
 
 # === 修改点 1: 增加 chat_id 参数，并在返回消息中带上它 ===
-async def handle_chat_stream(websocket: WebSocket, bot, message: str, model_name: str, chat_id: str):
+# 内容和结束帧都交给连接的发送队列，不等待客户端读取，慢客户端不会拖慢标签页上的监听
+async def handle_chat_stream(sender: ConnectionSender, conn_id: int, message: str, model_name: str, chat_id: str,
+                             protocol: int = PROTOCOL_SNAPSHOT, cacheable: bool = False):
+    # 本任务及其提交到标签页工作线程的操作，日志都带上 chatId / model
+    bind(chat_id=chat_id, model=model_name)
+    encoder = make_encoder(protocol)
+    stream_encoders[chat_id] = encoder
+    content = ""
+    # 首块延迟与总耗时从收到请求算起（包括排队），随 done 帧发给前端
+    start = time.perf_counter()
+    result = {"status": "done", "ttfc": None, "seconds": None}
+
+    def done_frame():
+        # seq 取发送时编码器的最终值
+        return {"type": "done", "model": model_name, "chatId": chat_id, "seq": encoder.seq,
+                "ttfc": result["ttfc"], "seconds": result["seconds"]}
+
+    def on_queued(ahead: int):
+        # 生成数已达上限，告诉前端前面还有多少个请求
+        sender.send_frame({"type": "queued", "model": model_name, "chatId": chat_id, "position": ahead}, chat_id)
+
     try:
-        async for content in bot.stream_chat(message):
-            await websocket.send_json({
-                "type": "chunk",
-                "model": model_name,
-                "chatId": chat_id, # <--- 关键：把 ID 传回去，前端靠这个分发消息
-                "content": content
-            })
-
-        await websocket.send_json({
-            "type": "done",
-            "model": model_name,
-            "chatId": chat_id
-        })
+        async with task_manager.slot(conn_id, model_name, on_queued):
+            if cacheable:
+                source = response_cache.stream(model_name, chat_id, message,
+                                               lambda owner: chat_stream(model_name, owner, message),
+                                               on_abandon=stop_chat)
+            else:
+                source = chat_stream(model_name, chat_id, message)
+            async for content in source:
+                if result["ttfc"] is None and content:
+                    result["ttfc"] = time.perf_counter() - start
+                # 帧中带上 model / chatId，前端靠 chatId 分发消息
+                sender.send_content(chat_id, model_name, encoder, content)
+
+        result["seconds"] = time.perf_counter() - start
+        sender.send_frame(done_frame, chat_id)
+        CHATS_TOTAL.inc(model=model_name, outcome="done")
 
     except asyncio.CancelledError:
-        print(f"任务被取消: {chat_id}")
-        await websocket.send_json({"type": "done", "model": model_name, "chatId": chat_id})
+        log.info("任务被取消")
+        result.update(status="cancelled", seconds=time.perf_counter() - start)
+        CHATS_TOTAL.inc(model=model_name, outcome="cancelled")
+        sender.send_frame(done_frame, chat_id)
     except Exception as e:
-        print(f"流式传输错误 ({model_name}): {e}")
-        await websocket.send_json({
+        if not isinstance(e, AdmissionTimeout):
+            log.error("流式传输错误", error=str(e))
+        result.update(status="error", seconds=time.perf_counter() - start)
+        CHATS_TOTAL.inc(model=model_name, outcome="error")
+        sender.send_frame({
             "type": "error",
             "model": model_name,
             "chatId": chat_id,
             "content": str(e)
-        })
+        }, chat_id)
+    finally:
+        if stream_encoders.get(chat_id) is encoder:
+            del stream_encoders[chat_id]
+        # 回答（包括被停止时已生成的部分）由服务端记录
+        if content:
+            history_writer.append_message(chat_id, "assistant", content, model_name)
+    return result
+
+async def run_fanout(sender: ConnectionSender, conn_id: int, fanout_id: str, models: list, message: str,
+                     protocol: int = PROTOCOL_SNAPSHOT):
+    """
+    同一提问同时发给多个模型。每个分支是一个独立的对话（chatId = <fanoutId>_<model>），
+    帧照常带 model / chatId，可以用 stop 单独停止某个分支，也可以用 fanoutId 停止全部分支；
+    全部结束后发送 fanout_done，汇总各分支的状态、首块延迟与总耗时
+    """
+    start = time.perf_counter()
+    # Key: model_name, Value: 分支的 chatId
+    branches = {model: f"{fanout_id}_{model}" for model in dict.fromkeys(models)}
+    sender.send_frame({"type": "fanout", "fanoutId": fanout_id, "branches": branches})
+    tasks = {}
+    for model, chat_id in branches.items():
+        history_writer.append_message(chat_id, "user", message, model)
+        tasks[model] = task_manager.start(conn_id, chat_id,
+                                          handle_chat_stream(sender, conn_id, message, model, chat_id, protocol))
+    try:
+        outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    except asyncio.CancelledError:
+        # 停止整个 fanout：点击各分支标签页的停止按钮并取消分支
+        for model, task in tasks.items():
+            if not task.done():
+                stop_chat(branches[model])
+                task.cancel()
+        outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    results = {}
+    for (model, chat_id), outcome in zip(branches.items(), outcomes):
+        if isinstance(outcome, BaseException):
+            # 分支在开始前就被取消（handle_chat_stream 尚未运行）
+            outcome = {"status": "cancelled", "ttfc": None, "seconds": None}
+        results[model] = dict(outcome, chatId=chat_id)
+    sender.send_frame({"type": "fanout_done", "fanoutId": fanout_id, "seconds": time.perf_counter() - start,
+                       "branches": results})
 
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
 
-    if not page:
+    if warmup.failed:
         await websocket.send_json({"type": "error", "content": "Error: 后端浏览器未启动"})
         await websocket.close()
         return
 
+    conn_id = next(connection_ids)
+    sender = ConnectionSender(websocket, WS_SEND_QUEUE_BYTES, WS_ACK_WINDOW)
+    sender.start()
     try:
         while True:
             data = await websocket.receive_json()
@@ -162,54 +495,99 @@ async def websocket_endpoint(websocket: WebSocket):
 
             # 1. 停止指令
             if msg_type == "stop":
-                # 修改：根据 chatId 停止特定任务
-                target_chat_id = data.get("chatId")
-                target_model = data.get("model")
+                # 修改：根据 chatId 停止特定任务（fanoutId 停止该 fanout 的全部分支）
+                target_chat_id = data.get("chatId") or data.get("fanoutId")
+
+                # 先点击该对话所在标签页的停止按钮，再取消流式任务
+                # （与其他对话合并的流只断开本对话，生成由其余订阅者继续接收）
+                if target_chat_id and not (response_cache and response_cache.is_shared(target_chat_id)):
+                    stop_chat(target_chat_id)
 
-                if target_chat_id and target_chat_id in active_tasks:
-                    if not active_tasks[target_chat_id].done():
-                        active_tasks[target_chat_id].cancel()
+                if target_chat_id:
+                    # 排队中的请求直接取消，不占用名额
+                    task_manager.cancel(target_chat_id)
+                continue
+
+            # 多模型并发：同一提问发给 models 中的每个模型
+            if msg_type == "fanout":
+                fanout_id = data.get("fanoutId")
+                models = data.get("models") or []
+                user_msg = data.get("message")
+                if not fanout_id or not user_msg or not models:
+                    continue
+                unknown = [m for m in models if m not in MODEL_CONFIG]
+                if unknown:
+                    sender.send_frame({"type": "error", "fanoutId": fanout_id,
+                                       "content": f"Unknown model: {', '.join(unknown)}"})
+                    continue
+                task_manager.start(conn_id, fanout_id, run_fanout(sender, conn_id, fanout_id, models, user_msg,
+                                                                  parse_protocol(data.get("protocol"))))
+                continue
+
+            # 增量协议：前端已处理到第 seq 帧（发送队列据此做流控）
+            if msg_type == "ack":
+                sender.ack(data.get("chatId"), data.get("seq"))
+                continue
 
-                # 如果需要停止底层生成（如 DeepSeek 按钮），还是需要 model
-                if target_model and target_model in active_bots:
-                    active_bots[target_model].stop_generation()
+            # 增量协议：前端发现序号/偏移不连续，请求下一帧发送全量内容
+            if msg_type == "resync":
+                encoder = stream_encoders.get(data.get("chatId"))
+                if encoder:
+                    encoder.request_resync()
                 continue
 
             # 2. 聊天请求
             model_name = data.get("model")
             user_msg = data.get("message")
             chat_id = data.get("chatId") # <--- 获取前端传来的 ID
+            # 旧前端不带 protocol 字段，默认快照模式；新前端声明 2 以启用增量帧
+            protocol = parse_protocol(data.get("protocol"))
 
             if not model_name or not user_msg or not chat_id:
                 continue
 
             # 如果同一个会话再次提问，取消该会话之前的任务
-            if chat_id in active_tasks and not active_tasks[chat_id].done():
-                active_tasks[chat_id].cancel()
+            previous = task_manager.get(chat_id)
+            if previous:
+                previous.cancel()
+                # 等它记录完已生成的部分回答，保证历史中消息的先后顺序
+                await asyncio.wait([previous], timeout=2)
 
             try:
-                current_bot = BotFactory.get_bot(model_name, page)
-                active_bots[model_name] = current_bot
+                if model_name not in MODEL_CONFIG:
+                    raise ValueError(f"Unknown model: {model_name}")
+
+                # 新对话的第一条消息可以使用回答缓存
+                cacheable = bool(response_cache and not data.get("regenerate")
+                                 and MODEL_CONFIG[model_name].get('cache', True)
+                                 and chat_id not in history_index.sessions
+                                 and not history_writer.has_pending(chat_id))
+
+                # 重新生成时丢弃上一次的回答，否则记录这条用户消息
+                if data.get("regenerate"):
+                    history_writer.regenerate(chat_id)
+                else:
+                    history_writer.append_message(chat_id, "user", user_msg, model_name)
 
                 # 创建任务，使用 chat_id 作为 Key
-                task = asyncio.create_task(
-                    handle_chat_stream(websocket, current_bot, user_msg, model_name, chat_id)
-                )
-                active_tasks[chat_id] = task
+                task_manager.start(conn_id, chat_id,
+                                   handle_chat_stream(sender, conn_id, user_msg, model_name, chat_id, protocol,
+                                                      cacheable))
 
             except Exception as e:
-                await websocket.send_json({
+                sender.send_frame({
                     "type": "error",
                     "model": model_name,
                     "chatId": chat_id,
                     "content": str(e)
-                })
+                }, chat_id)
 
     except WebSocketDisconnect:
-        print("前端已断开连接")
-        for task in active_tasks.values():
-            if not task.done():
-                task.cancel()
+        log.info("前端已断开连接")
+    finally:
+        # 只取消本连接的任务，其他连接的生成不受影响
+        task_manager.cancel_connection(conn_id)
+        await sender.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+多进程浏览器分片
+
+SHARDS > 0 时，FastAPI 前端进程不再自己启动浏览器，而是启动 N 个工作进程，
+每个进程拥有独立的 Chromium 实例（自动分配调试端口，独立的用户数据目录）、
+独立的 asyncio 事件循环和标签页池。前端按 chatId 把对话固定路由到某个分片，
+通过 multiprocessing.Pipe 发送请求并接收流式内容；工作进程意外退出后自动重启，
+其上进行中的对话以 error 帧结束，前端本身不受影响。
+
+IPC 消息格式：
+  前端 -> 分片: {"op": "chat", "req": 请求号, "model", "chatId", "message"} / {"op": "stop", "chatId"}
+               / {"op": "cancel", "req"} (前端的流被取消时，只结束对应的那一次请求)
+               / {"op": "metrics", "req"} (前端 /metrics 请求时取回分片的指标)
+  分片 -> 前端: {"req", "type": "chunk", "offset", "delta"} / {"req", "type": "done"} / {"req", "type": "error", "content"}
+               / {"req", "type": "metrics", "values": metrics.snapshot()}
+  chunk 使用 Python 字符偏移的增量，避免在管道里反复传输完整快照。
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import zlib
+
+from logs import get_logger
+from stream_protocol import common_prefix_len
+
+log = get_logger('shard')
+
+
+def _free_port() -> int:
+    """向系统申请一个空闲端口作为 Chromium 调试端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# --- 工作进程 ---
+
+def worker_main(index: int, conn, data_dir: str):
+    """分片工作进程入口：启动独立浏览器并处理前端转发的对话请求"""
+    from DrissionPage import ChromiumOptions, ChromiumPage
+    from config import (CHROME_PATH, MODEL_CONFIG, TAB_POOL_SIZE, TAB_POOL_MAX_QUEUE, TAB_POOL_WAIT_TIMEOUT,
+                        TAB_BUDGET, TAB_RECYCLE_MODE, WARMUP_TABS)
+    from crawler_base import BotFactory
+    from metrics import POOL_BUSY, POOL_QUEUE, PROCESS_RSS, process_rss, snapshot
+    from tab_pool import TabPool
+    from warmup import Warmup
+
+    port = _free_port()
+    co = ChromiumOptions(read_file=False).set_browser_path(CHROME_PATH)
+    co.set_local_port(port)
+    co.set_user_data_path(os.path.abspath(os.path.join(data_dir, f"shard_{index}")))
+    page = ChromiumPage(addr_or_opts=co)
+    log.info("分片浏览器已启动", shard=index, port=port)
+
+    tab_pools = {
+        name: TabPool(name, page, conf, size=conf.get('tabs', TAB_POOL_SIZE), max_queue=TAB_POOL_MAX_QUEUE,
+                      budget={**TAB_BUDGET, **conf.get('tab_budget', {})}, recycle_mode=TAB_RECYCLE_MODE)
+        for name, conf in MODEL_CONFIG.items()
+    }
+    send_lock = threading.Lock()
+
+    def send(msg):
+        with send_lock:
+            conn.send(msg)
+
+    async def run_chat(req, model_name, chat_id, message, bots):
+        sent = ""
+        bot = None
+        try:
+            bot = BotFactory.get_bot(model_name, page)
+            bots[chat_id] = bot
+            async for content in tab_pools[model_name].stream_chat(bot, chat_id, message, TAB_POOL_WAIT_TIMEOUT):
+                offset = len(sent) if content.startswith(sent) else common_prefix_len(sent, content)
+                send({"req": req, "type": "chunk", "offset": offset, "delta": content[offset:]})
+                sent = content
+            send({"req": req, "type": "done"})
+        except asyncio.CancelledError:
+            send({"req": req, "type": "done"})
+        except Exception as e:
+            send({"req": req, "type": "error", "content": str(e)})
+        finally:
+            if bots.get(chat_id) is bot:
+                del bots[chat_id]
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        inbox = asyncio.Queue()
+        tasks = {}
+        bots = {}
+
+        def reader():
+            while True:
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    loop.call_soon_threadsafe(inbox.put_nowait, None)
+                    return
+                loop.call_soon_threadsafe(inbox.put_nowait, msg)
+
+        threading.Thread(target=reader, daemon=True).start()
+        if WARMUP_TABS:
+            # 与单进程模式相同，启动后并行打开本分片各模型的标签页
+            asyncio.create_task(Warmup().warm_pools(tab_pools, lambda name: BotFactory.get_bot(name, page)))
+        while True:
+            msg = await inbox.get()
+            if msg is None:
+                break
+            chat_id = msg.get("chatId")
+            if msg["op"] == "stop":
+                if chat_id in bots:
+                    bots[chat_id].stop_generation()
+                for task_chat_id, task in list(tasks.values()):
+                    if task_chat_id == chat_id and not task.done():
+                        task.cancel()
+            elif msg["op"] == "cancel":
+                entry = tasks.get(msg["req"])
+                if entry and not entry[1].done():
+                    entry[1].cancel()
+            elif msg["op"] == "metrics":
+                for pool in tab_pools.values():
+                    stats = pool.stats()
+                    POOL_BUSY.set(stats["busy"], model=pool.model_name)
+                    POOL_QUEUE.set(stats["queue_depth"], model=pool.model_name)
+                rss = process_rss()
+                if rss is not None:
+                    PROCESS_RSS.set(rss)
+                send({"req": msg["req"], "type": "metrics", "values": snapshot()})
+            elif msg["op"] == "chat":
+                req = msg["req"]
+                task = asyncio.create_task(run_chat(req, msg["model"], chat_id, msg["message"], bots))
+                tasks[req] = (chat_id, task)
+                task.add_done_callback(lambda t, r=req: tasks.pop(r, None))
+
+    asyncio.run(serve())
+
+
+# --- 前端路由 ---
+
+class ShardHandle:
+    """前端持有的一个分片：进程、管道与读线程"""
+
+    def __init__(self, index: int, data_dir: str):
+        self.index = index
+        self.data_dir = data_dir
+        self.process = None
+        self.conn = None
+        self.restarts = 0
+        self.started_at = 0.0
+        self._send_lock = threading.Lock()
+
+    def start(self, on_message):
+        ctx = multiprocessing.get_context('spawn')
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(self.index, child_conn, self.data_dir),
+                                   name=f"browser-shard-{self.index}", daemon=True)
+        self.process.start()
+        self.started_at = time.time()
+        child_conn.close()
+        self.conn = parent_conn
+        threading.Thread(target=self._read_loop, args=(parent_conn, on_message), daemon=True).start()
+
+    def _read_loop(self, conn, on_message):
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                return
+            on_message(self.index, msg)
+
+    def send(self, msg):
+        with self._send_lock:
+            self.conn.send(msg)
+
+    def alive(self) -> bool:
+        return bool(self.process and self.process.is_alive())
+
+    def stop(self):
+        if self.process and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+        if self.conn:
+            self.conn.close()
+
+
+class ShardRouter:
+    """把对话按 chatId 固定路由到分片进程，并把分片的流式结果转回异步生成器"""
+
+    def __init__(self, count: int, data_dir: str = "browser_data"):
+        self.shards = [ShardHandle(i, data_dir) for i in range(count)]
+        self._req_ids = itertools.count(1)
+        # Key: 请求号, Value: (分片序号, asyncio.Queue)
+        self._streams = {}
+        self._loop = None
+        self._monitor = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        for shard in self.shards:
+            shard.start(self._on_message)
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def shutdown(self):
+        if self._monitor:
+            self._monitor.cancel()
+        for shard in self.shards:
+            await asyncio.to_thread(shard.stop)
+
+    def shard_for(self, chat_id: str) -> ShardHandle:
+        """同一个 chatId 始终落在同一个分片上（其标签页池保存着对话上下文）"""
+        return self.shards[zlib.crc32(chat_id.encode('utf-8')) % len(self.shards)]
+
+    def _on_message(self, index, msg):
+        """[读线程] 分片返回的消息转交给事件循环"""
+        self._loop.call_soon_threadsafe(self._dispatch, msg)
+
+    def _dispatch(self, msg):
+        entry = self._streams.get(msg.get("req"))
+        if entry:
+            entry[1].put_nowait(msg)
+
+    async def stream_chat(self, model_name: str, chat_id: str, message: str):
+        """与 bot.stream_chat 相同的接口：逐次产出回答的完整 Markdown"""
+        shard = self.shard_for(chat_id)
+        req = next(self._req_ids)
+        queue = asyncio.Queue()
+        self._streams[req] = (shard.index, queue)
+        content = ""
+        finished = False
+        try:
+            await asyncio.to_thread(shard.send, {"op": "chat", "req": req, "model": model_name,
+                                                 "chatId": chat_id, "message": message})
+            while True:
+                msg = await queue.get()
+                if msg["type"] == "chunk":
+                    content = content[:msg["offset"]] + msg["delta"]
+                    yield content
+                elif msg["type"] == "done":
+                    finished = True
+                    return
+                else:
+                    finished = True
+                    raise RuntimeError(msg.get("content") or "分片处理失败")
+        finally:
+            self._streams.pop(req, None)
+            if not finished:
+                # 前端的流被取消（新提问 / 断开连接），通知分片结束这一次请求
+                self._send_quietly(shard, {"op": "cancel", "req": req})
+
+    async def collect_metrics(self, timeout: float = 2) -> dict:
+        """取回各存活分片的指标，Key: 分片序号, Value: metrics.snapshot()；超时未返回的分片跳过"""
+        async def collect(shard):
+            req = next(self._req_ids)
+            queue = asyncio.Queue()
+            self._streams[req] = (shard.index, queue)
+            try:
+                await asyncio.to_thread(shard.send, {"op": "metrics", "req": req})
+                msg = await asyncio.wait_for(queue.get(), timeout)
+                return shard.index, msg.get("values")
+            except (asyncio.TimeoutError, OSError, ValueError):
+                log.warning("分片指标未返回", shard=shard.index)
+                return shard.index, None
+            finally:
+                self._streams.pop(req, None)
+
+        results = await asyncio.gather(*(collect(s) for s in self.shards if s.alive()))
+        return {index: values for index, values in results if values is not None}
+
+    def stop(self, chat_id: str):
+        """点击对话所在标签页的停止按钮并结束分片上的生成"""
+        self._send_quietly(self.shard_for(chat_id), {"op": "stop", "chatId": chat_id})
+
+    @staticmethod
+    def _send_quietly(shard: ShardHandle, msg):
+        if shard.alive():
+            try:
+                shard.send(msg)
+            except (OSError, ValueError):
+                pass
+
+    async def _watch(self):
+        """监控分片进程，退出后立即以 error 结束其上的对话，退避后重启"""
+        while True:
+            await asyncio.sleep(1)
+            for shard in self.shards:
+                if shard.alive():
+                    # 稳定运行一段时间后清零崩溃计数，偶发的崩溃不再累积退避时间
+                    if shard.restarts and time.time() - shard.started_at > 60:
+                        shard.restarts = 0
+                    continue
+                self._fail_streams(shard.index)
+                # 连续崩溃时指数退避，避免浏览器无法启动时疯狂重启
+                if time.time() - shard.started_at < min(30, 2 ** shard.restarts):
+                    continue
+                log.warning("分片进程已退出，正在重启", shard=shard.index, exitcode=shard.process.exitcode)
+                await asyncio.to_thread(shard.stop)
+                shard.restarts += 1
+                shard.start(self._on_message)
+
+    def _fail_streams(self, index: int):
+        """以 error 结束该分片上进行中的对话（移出 _streams，不会重复通知）"""
+        for req, (shard_index, queue) in list(self._streams.items()):
+            if shard_index == index:
+                del self._streams[req]
+                queue.put_nowait({"req": req, "type": "error", "content": "浏览器分片进程崩溃，正在自动重启"})
+
+    def stats(self):
+        return [{"shard": s.index, "alive": s.alive(), "pid": s.process.pid if s.process else None,
+                 "restarts": s.restarts,
+                 "active_streams": sum(1 for index, _ in self._streams.values() if index == s.index)}
+                for s in self.shards]
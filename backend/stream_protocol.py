@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+WebSocket 流式协议
+
+v1 (快照模式): 每个 chunk 帧携带当前回答的完整 Markdown，前端直接整体替换。
+v2 (增量模式): chunk 帧只携带 offset 之后的新文本，前端截断到 offset 后追加；
+              当前缀被大幅改写或前端请求时，发送一次 resync 全量帧。
+              前端每收到一帧回复 {"type": "ack", "chatId", "seq"}，server 据此限制未确认的帧数（见 ws_sender.py）。
+
+offset 按 UTF-16 码元计算，与前端 JS 字符串的 length / slice 保持一致。
+"""
+
+PROTOCOL_SNAPSHOT = 1
+PROTOCOL_DELTA = 2
+
+
+def parse_protocol(value) -> int:
+    """解析前端声明的协议版本，未声明（旧前端）时回退到快照模式"""
+    try:
+        version = int(value)
+    except (TypeError, ValueError):
+        return PROTOCOL_SNAPSHOT
+    return PROTOCOL_DELTA if version >= PROTOCOL_DELTA else PROTOCOL_SNAPSHOT
+
+
+def utf16_len(text: str) -> int:
+    """计算字符串在 JS 中的长度（UTF-16 码元数）"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def common_prefix_len(a: str, b: str) -> int:
+    """二分查找两个字符串的公共前缀长度（借助 C 层的切片比较，避免逐字符循环）"""
+    lo, hi = 0, min(len(a), len(b))
+    if a[:hi] == b[:hi]:
+        return hi
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class DeltaEncoder:
+    """
+    把 bot 产出的完整 Markdown 快照编码成 v2 增量帧。
+    每个流（chatId 的一次生成）使用一个独立的实例。
+    """
+
+    def __init__(self, rewrite_ratio: float = 0.5):
+        # 如果需要改写的尾部超过已发送内容的该比例，直接发送 resync 全量帧
+        self.rewrite_ratio = rewrite_ratio
+        self.seq = 0
+        self._sent = ""
+        self._sent_utf16 = 0
+        self._force_resync = False
+
+    def request_resync(self):
+        """前端检测到序号/偏移不连续时调用，下一帧改为全量帧"""
+        self._force_resync = True
+
+    def encode(self, content: str):
+        """返回需要发送的帧（不含 model/chatId），内容无变化时返回 None"""
+        if content == self._sent and not self._force_resync:
+            return None
+
+        self.seq += 1
+        if content.startswith(self._sent):
+            prefix = len(self._sent)
+        else:
+            prefix = common_prefix_len(self._sent, content)
+
+        rewritten = len(self._sent) - prefix
+        if self._force_resync or (rewritten and rewritten > len(self._sent) * self.rewrite_ratio):
+            frame = {"type": "resync", "v": PROTOCOL_DELTA, "seq": self.seq, "content": content}
+            self._force_resync = False
+            self._sent_utf16 = utf16_len(content)
+        else:
+            # 只对被改写的尾部重新计算 UTF-16 长度，保持 O(delta)
+            offset = self._sent_utf16 - utf16_len(self._sent[prefix:])
+            delta = content[prefix:]
+            frame = {"type": "chunk", "v": PROTOCOL_DELTA, "seq": self.seq,
+                     "offset": offset, "delta": delta}
+            self._sent_utf16 = offset + utf16_len(delta)
+
+        self._sent = content
+        return frame
+
+
+class SnapshotEncoder:
+    """v1 兼容模式：原样发送完整快照"""
+
+    def __init__(self):
+        self.seq = 0
+
+    def request_resync(self):
+        pass
+
+    def encode(self, content: str):
+        self.seq += 1
+        return {"type": "chunk", "content": content}
+
+
+def make_encoder(protocol: int):
+    """根据协议版本创建编码器"""
+    if protocol == PROTOCOL_DELTA:
+        return DeltaEncoder()
+    return SnapshotEncoder()
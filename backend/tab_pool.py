@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+每个模型的标签页池
+
+同一个模型可以开多个标签页，每个标签页同一时间只租给一次生成使用，避免两个对话
+往同一个输入框里打字、互相读到对方的回答。标签页都忙时请求排队（超出队列长度直接拒绝）。
+池中记录 chatId -> (标签页, 会话 URL)，后续追问优先回到原来的标签页，
+如果原标签页正忙或已被其他对话占用，则在空闲标签页中打开该会话的 URL 继续对话。
+记录按最近使用保留 TAB_AFFINITY_MAX 条（批量任务、分叉对话每条都是新的 chatId）。
+
+标签页长期复用时历史回答越积越多，单页应用的状态也只增不减，选择器越来越慢、内存越占越多。
+每次生成结束后通过 CDP 采样 DOM 节点数（Memory.getDOMCounters）、JS 堆（Runtime.getHeapUsage）
+和主线程累计耗时（Performance.getMetrics 的 TaskDuration，近似该标签页占用的 CPU），
+生成轮数、节点数、堆大小任一达到预算时在后台回收：打开新对话页（或新建标签页并关闭旧的），
+等到输入框出现后才归还给下一个请求。被回收的对话仍记录着会话 URL，追问时照常打开。
+（同一站点的标签页可能共用一个渲染进程，此时 DOM 计数是整个进程的）
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from browser_io import get_worker
+from config import TAB_AFFINITY_MAX
+from lean_mode import apply_lean, is_lean, open_tab, release_lean
+from logs import get_logger
+from metrics import TAB_CPU_SECONDS, TAB_DOM_NODES, TAB_JS_HEAP, TAB_RECYCLES, observe_stage, span
+
+log = get_logger('tab_pool')
+
+
+class PoolBusyError(Exception):
+    """标签页全部占用且等待队列已满，或排队超时"""
+
+
+class TabSlot:
+    """池中的一个标签页"""
+
+    def __init__(self, model_name: str, index: int):
+        self.index = index
+        self.tab = None
+        # 每个标签页一个专属工作线程
+        self.worker = get_worker(f"{model_name}#{index}")
+        self.busy = False
+        # 输入框已出现（预热或第一次打开后）
+        self.ready = False
+        # 标签页当前展示的对话（None 为尚未使用的新对话页）
+        self.chat_id = None
+        self.leased_at = None
+        # 页面加载后完成的生成轮数（回收或打开会话 URL 时清零）
+        self.turns = 0
+        # 最近一次采样：{"dom_nodes", "js_heap_mb", "cpu_seconds"}
+        self.usage = None
+        # 已开启 Performance 域的标签页（回收换了新标签页后重新开启）
+        self.perf_tab = None
+        # 页面加载后第一轮就超出资源预算：会话本身就这么大，重新打开也一样，只按轮数回收
+        self.oversized = False
+        self.recycles = 0
+
+
+class TabPool:
+    def __init__(self, model_name: str, page, conf: dict, size: int = 1, max_queue: int = 8, budget: dict = None,
+                 recycle_mode: str = 'navigate', max_affinity: int = TAB_AFFINITY_MAX):
+        self.model_name = model_name
+        self.page = page
+        self.conf = conf
+        self.slots = [TabSlot(model_name, i) for i in range(max(1, size))]
+        self.max_queue = max_queue
+        # {"turns", "dom_nodes", "js_heap_mb"}，0 或缺省表示不限制
+        self.budget = budget or {}
+        self.recycle_mode = recycle_mode
+        # 生成结束后的采样 / 回收任务（持有引用，避免被回收）
+        self._maintenance = set()
+        # Key: chat_id, Value: {"slot": 标签页序号, "url": 会话 URL}，按最近使用排序
+        self.affinity = OrderedDict()
+        self.max_affinity = max_affinity
+        # 等待中的请求：(chat_id, Future)
+        self._waiters = deque()
+
+        # 统计
+        self.leases = 0
+        self.rejected = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # Key: 回收原因（超出的预算项）, Value: 次数
+        self.recycles = {}
+
+    # --- 租用 / 归还 ---
+
+    @asynccontextmanager
+    async def lease(self, chat_id: str, timeout: float = None, bot=None):
+        """
+        租用一个标签页：async with pool.lease(chat_id) as slot。
+        传入 bot 时归还前先在后台检查预算（必要时回收），不拖慢本次生成的结束
+        """
+        slot = await self.acquire(chat_id, timeout)
+        try:
+            yield slot
+        finally:
+            if bot is not None and slot.tab is not None and any(self.budget.values()):
+                task = asyncio.create_task(self._maintain(slot, bot))
+                self._maintenance.add(task)
+                task.add_done_callback(self._maintenance.discard)
+            else:
+                self.release(slot)
+
+    async def acquire(self, chat_id: str, timeout: float = None) -> TabSlot:
+        start = time.time()
+        slot = self._pick_free(chat_id)
+        if slot is None:
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise PoolBusyError(f"[{self.model_name}] 标签页全部占用，排队已满 ({self.max_queue})")
+            future = asyncio.get_running_loop().create_future()
+            entry = (chat_id, future)
+            self._waiters.append(entry)
+            try:
+                slot = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise PoolBusyError(f"[{self.model_name}] 排队超时 ({timeout}s)")
+            except asyncio.CancelledError:
+                # 标签页已经交给本请求但请求被取消，归还给下一个等待者
+                if future.done() and not future.cancelled():
+                    self.release(future.result())
+                raise
+            finally:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+
+        waited = time.time() - start
+        observe_stage('tab_wait', waited, self.model_name)
+        self.leases += 1
+        self.wait_count += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        slot.leased_at = time.time()
+        return slot
+
+    def _pick_free(self, chat_id: str):
+        """优先选择保存该对话上下文的标签页，其次选择空闲时间最长的标签页"""
+        free = [s for s in self.slots if not s.busy]
+        if not free:
+            return None
+        preferred = self.affinity.get(chat_id)
+        slot = None
+        if preferred is not None:
+            slot = next((s for s in free if s.index == preferred["slot"]), None)
+        if slot is None:
+            slot = min(free, key=lambda s: s.leased_at or 0)
+        slot.busy = True
+        return slot
+
+    def release(self, slot: TabSlot):
+        """归还标签页，直接交给队首仍在等待的请求"""
+        slot.busy = False
+        while self._waiters:
+            chat_id, future = self._waiters.popleft()
+            if future.done():
+                continue
+            slot.busy = True
+            future.set_result(slot)
+            return
+
+    async def stream_chat(self, bot, chat_id: str, message: str, timeout: float = None):
+        """租用标签页、切换到目标对话并流式生成，结束后记录对话位置"""
+        async with self.lease(chat_id, timeout, bot) as slot:
+            with span('prepare', self.model_name):
+                await self.prepare(slot, bot, chat_id)
+            try:
+                async for content in bot.stream_chat(message):
+                    yield content
+            finally:
+                slot.turns += 1
+                await self.remember(slot, chat_id)
+
+    # --- 标签页准备 ---
+
+    async def prepare(self, slot: TabSlot, bot, chat_id: str):
+        """把 bot 绑定到标签页，并确保标签页展示的是该对话（必要时打开会话 URL 或新对话页）"""
+        await slot.worker.run(self._prepare_sync, slot, bot, chat_id)
+        bot.attach(slot)
+
+    def _prepare_sync(self, slot: TabSlot, bot, chat_id: str):
+        """[工作线程] 打开标签页并切换到目标对话"""
+        if slot.tab is None or (slot.chat_id is None and chat_id not in self.affinity):
+            # 未打开的标签页先打开；预热打开的标签页停在新对话页，新对话直接使用
+            if slot.tab is None:
+                self._open_sync(slot, bot)
+                slot.chat_id = None
+            if chat_id not in self.affinity:
+                slot.chat_id = chat_id
+                return
+            # 已有会话记录的追问：刚打开的标签页停在新对话页，继续往下打开会话 URL
+
+        if slot.chat_id == chat_id:
+            return
+        record = self.affinity.get(chat_id)
+        target = record["url"] if record and record.get("url") else self.conf['home_url']
+        log.info("标签页切换到对话", model=self.model_name, slot=slot.index, chatId=chat_id)
+        slot.tab.get(target)
+        slot.chat_id = chat_id
+        slot.turns = 0
+        slot.oversized = False
+
+    def _open_sync(self, slot: TabSlot, bot) -> bool:
+        """[工作线程] 打开标签页并等待输入框出现，返回是否就绪"""
+        if slot.index == 0:
+            # 第一个标签页沿用已有的同域名页面（用户可能已在其中登录）
+            bot.activate_tab()
+            slot.tab = bot.tab
+            apply_lean(slot.tab, self.model_name, self.conf)
+        else:
+            log.info("为标签页池新建标签页", model=self.model_name, slot=slot.index)
+            slot.tab = open_tab(self.page, self.conf['home_url'], self.model_name, self.conf)
+            bot.tab = slot.tab
+        slot.turns = 0
+        slot.oversized = False
+        slot.ready = bot.wait_ready()
+        return slot.ready
+
+    async def warm(self, make_bot) -> int:
+        """
+        预先打开池中所有标签页并等待就绪，返回就绪的标签页数。
+        第一个标签页先打开（它会复用已有的同域名页面，不能与新建的标签页混淆），其余并行打开
+        """
+        first = await self._warm_slot(self.slots[0], make_bot)
+        rest = await asyncio.gather(*(self._warm_slot(s, make_bot) for s in self.slots[1:]))
+        return sum([first, *rest])
+
+    async def _warm_slot(self, slot: TabSlot, make_bot) -> bool:
+        def open_if_needed():
+            # 已被对话请求打开的标签页不再重复打开
+            return slot.ready if slot.tab is not None else self._open_sync(slot, make_bot())
+        return await slot.worker.run(open_if_needed)
+
+    async def remember(self, slot: TabSlot, chat_id: str):
+        """生成结束后记录对话所在的标签页和会话 URL，供后续追问使用"""
+        try:
+            url = await slot.worker.run(lambda: slot.tab.url)
+        except Exception:
+            url = None
+        self.affinity[chat_id] = {"slot": slot.index, "url": url}
+        self.affinity.move_to_end(chat_id)
+        while len(self.affinity) > self.max_affinity:
+            self.affinity.popitem(last=False)
+
+    def forget(self, chat_id: str):
+        self.affinity.pop(chat_id, None)
+
+    # --- 生命周期 ---
+
+    async def _maintain(self, slot: TabSlot, bot):
+        """[后台任务] 采样标签页的资源占用，超出预算时回收；完成后才归还标签页"""
+        try:
+            usage = await slot.worker.run(self._sample_sync, slot)
+            reason = self._over_budget(slot, usage)
+            if reason:
+                with span('recycle', self.model_name):
+                    await slot.worker.run(self._recycle_sync, slot, bot, reason)
+        except Exception as e:
+            log.warning("标签页采样 / 回收失败", model=self.model_name, slot=slot.index, error=str(e))
+        finally:
+            self.release(slot)
+
+    def _sample_sync(self, slot: TabSlot) -> dict:
+        """[工作线程] 通过 CDP 读取 DOM 节点数、JS 堆已用大小与主线程累计耗时"""
+        if slot.perf_tab is not slot.tab:
+            slot.tab.run_cdp('Performance.enable')
+            slot.perf_tab = slot.tab
+        counters = slot.tab.run_cdp('Memory.getDOMCounters')
+        heap = slot.tab.run_cdp('Runtime.getHeapUsage')
+        perf = {m['name']: m['value'] for m in slot.tab.run_cdp('Performance.getMetrics')['metrics']}
+        slot.usage = {"dom_nodes": counters['nodes'], "js_heap_mb": round(heap['usedSize'] / 2 ** 20, 1),
+                      "cpu_seconds": round(perf.get('TaskDuration', 0.0), 2)}
+        TAB_DOM_NODES.set(counters['nodes'], model=self.model_name, slot=slot.index)
+        TAB_JS_HEAP.set(heap['usedSize'], model=self.model_name, slot=slot.index)
+        TAB_CPU_SECONDS.set(perf.get('TaskDuration', 0.0), model=self.model_name, slot=slot.index)
+        return slot.usage
+
+    def _over_budget(self, slot: TabSlot, usage: dict):
+        """返回第一个达到的预算项，都未达到时返回 None"""
+        values = {"turns": slot.turns, **usage}
+        for key, limit in self.budget.items():
+            if not limit or values.get(key, 0) < limit:
+                continue
+            if key != 'turns' and (slot.oversized or slot.turns <= 1):
+                if not slot.oversized:
+                    slot.oversized = True
+                    log.info("会话页面加载后即超出预算，只按轮数回收", model=self.model_name, slot=slot.index,
+                             chatId=slot.chat_id, **usage)
+                continue
+            return key
+        return None
+
+    def _recycle_sync(self, slot: TabSlot, bot, reason: str):
+        """[工作线程] 回收标签页：打开新对话页或换一个新标签页，等待输入框出现"""
+        log.info("回收标签页", model=self.model_name, slot=slot.index, reason=reason, turns=slot.turns,
+                 mode=self.recycle_mode, **slot.usage)
+        if self.recycle_mode == 'new_tab':
+            old = slot.tab
+            slot.tab = open_tab(self.page, self.conf['home_url'], self.model_name, self.conf)
+            try:
+                release_lean(old)
+                old.close()
+            except Exception as e:
+                log.warning("关闭旧标签页失败", model=self.model_name, slot=slot.index, error=str(e))
+        else:
+            slot.tab.get(self.conf['home_url'])
+        bot.tab = slot.tab
+        slot.chat_id = None
+        slot.turns = 0
+        slot.oversized = False
+        slot.recycles += 1
+        self.recycles[reason] = self.recycles.get(reason, 0) + 1
+        TAB_RECYCLES.inc(model=self.model_name, reason=reason)
+        slot.ready = bot.wait_ready()
+        if not slot.ready:
+            log.warning("回收后的标签页未就绪：等待输入框超时", model=self.model_name, slot=slot.index)
+
+    # --- 统计 ---
+
+    def stats(self) -> dict:
+        busy = sum(1 for s in self.slots if s.busy)
+        return {
+            "model": self.model_name,
+            "size": len(self.slots),
+            "busy": busy,
+            "ready": sum(1 for s in self.slots if s.ready),
+            "occupancy": busy / len(self.slots),
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "leases": self.leases,
+            "rejected": self.rejected,
+            "wait_avg": self.wait_total / self.wait_count if self.wait_count else 0.0,
+            "wait_max": self.wait_max,
+            "chats": len(self.affinity),
+            "recycles": self.recycles,
+            "tabs": [{"slot": s.index, "turns": s.turns, "recycles": s.recycles,
+                      "lean": s.tab is not None and is_lean(s.tab), **(s.usage or {})} for s in self.slots],
+        }
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+生成任务管理与准入控制
+
+原先 server.py 用模块级的 active_tasks 记录所有连接的任务：一个前端断开会取消所有连接的任务，
+结束的任务也从不移除。现在每个任务登记在 (连接, chatId) 下，任务结束时自动移除；
+断开连接只取消该连接自己的任务。
+
+同时进行的生成受全局上限和每个模型的上限约束。达到上限时请求进入等待队列，
+各连接轮流获得名额（同一个连接连发多个请求不会把其他连接挤到后面），
+排队时向前端发送 queued 帧，超过等待时间返回错误。
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from logs import get_logger
+
+log = get_logger('tasks')
+
+
+class AdmissionTimeout(Exception):
+    """排队超时仍未获得生成名额"""
+
+
+class _Waiter:
+    __slots__ = ('model', 'future', 'queued_at')
+
+    def __init__(self, model: str, future):
+        self.model = model
+        self.future = future
+        self.queued_at = time.time()
+
+
+class TaskManager:
+    def __init__(self, global_limit: int = 32, model_limits: dict = None, default_model_limit: int = 8,
+                 queue_timeout: float = 60):
+        self.global_limit = global_limit
+        # Key: model_name, Value: 该模型同时进行的生成上限
+        self.model_limits = model_limits or {}
+        self.default_model_limit = default_model_limit
+        self.queue_timeout = queue_timeout
+
+        # Key: chat_id, Value: (conn_id, Task)
+        self.tasks = {}
+        # Key: conn_id, Value: 该连接的 chat_id 集合
+        self.connections = {}
+
+        self.running = 0
+        # Key: model_name, Value: 进行中的生成数
+        self.running_by_model = {}
+        # Key: conn_id, Value: 该连接等待中的请求 (_Waiter 队列)
+        self.waiters = {}
+        # 有等待请求的连接，按轮转顺序排列
+        self._rotation = deque()
+
+        # 统计
+        self.admitted = 0
+        self.queued_total = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    # --- 任务登记 ---
+
+    def start(self, conn_id: str, chat_id: str, coro) -> asyncio.Task:
+        """创建并登记任务，结束后自动移除"""
+        task = asyncio.create_task(coro)
+        self.tasks[chat_id] = (conn_id, task)
+        self.connections.setdefault(conn_id, set()).add(chat_id)
+        task.add_done_callback(lambda t: self._forget(conn_id, chat_id, t))
+        return task
+
+    def _forget(self, conn_id: str, chat_id: str, task: asyncio.Task):
+        if self.tasks.get(chat_id, (None, None))[1] is task:
+            del self.tasks[chat_id]
+            chats = self.connections.get(conn_id)
+            if chats is not None:
+                chats.discard(chat_id)
+                if not chats:
+                    del self.connections[conn_id]
+
+    def get(self, chat_id: str):
+        """该对话进行中的任务（已结束或不存在时返回 None）"""
+        entry = self.tasks.get(chat_id)
+        return entry[1] if entry and not entry[1].done() else None
+
+    def cancel(self, chat_id: str) -> bool:
+        task = self.get(chat_id)
+        if task:
+            task.cancel()
+        return task is not None
+
+    def cancel_connection(self, conn_id: str) -> int:
+        """连接断开：只取消该连接自己的任务（排队中的请求随任务一起取消）"""
+        chat_ids = list(self.connections.get(conn_id, ()))
+        for chat_id in chat_ids:
+            self.cancel(chat_id)
+        return len(chat_ids)
+
+    # --- 准入控制 ---
+
+    def model_limit(self, model: str) -> int:
+        return self.model_limits.get(model) or self.default_model_limit
+
+    def _has_capacity(self, model: str) -> bool:
+        return self.running < self.global_limit and self.running_by_model.get(model, 0) < self.model_limit(model)
+
+    def _take(self, model: str):
+        self.running += 1
+        self.running_by_model[model] = self.running_by_model.get(model, 0) + 1
+
+    def release(self, model: str):
+        self.running -= 1
+        self.running_by_model[model] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """按连接轮转，把空出的名额分给第一个模型有余量的等待请求"""
+        granted = True
+        while granted and self._rotation and self.running < self.global_limit:
+            granted = False
+            for _ in range(len(self._rotation)):
+                conn_id = self._rotation[0]
+                self._rotation.rotate(-1)
+                queue = self.waiters[conn_id]
+                waiter = next((w for w in queue if not w.future.done() and self._has_capacity(w.model)), None)
+                if waiter is None:
+                    continue
+                self._remove_waiter(conn_id, waiter)
+                self._take(waiter.model)
+                waiter.future.set_result(None)
+                granted = True
+                break
+
+    def _remove_waiter(self, conn_id: str, waiter: _Waiter):
+        queue = self.waiters.get(conn_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self.waiters[conn_id]
+            self._rotation.remove(conn_id)
+
+    async def acquire(self, conn_id: str, model: str, on_queued=None):
+        """获得一个生成名额；需要排队时调用 on_queued(前面等待的请求数)"""
+        waiter = _Waiter(model, asyncio.get_running_loop().create_future())
+        ahead = self.queued
+        if conn_id not in self.waiters:
+            self.waiters[conn_id] = deque()
+            self._rotation.append(conn_id)
+        self.waiters[conn_id].append(waiter)
+        self._dispatch()
+
+        if not waiter.future.done():
+            self.queued_total += 1
+            if on_queued:
+                on_queued(ahead)
+            # 不用 wait_for：名额与取消同时到达时它会吞掉取消，已断开连接的请求仍会开始生成
+            try:
+                await asyncio.wait([waiter.future], timeout=self.queue_timeout)
+            except asyncio.CancelledError:
+                # 名额已经分给本请求但请求被取消，交还给下一个等待者
+                if waiter.future.done():
+                    self.release(model)
+                raise
+            finally:
+                if not waiter.future.done():
+                    waiter.future.cancel()
+                self._remove_waiter(conn_id, waiter)
+            if waiter.future.cancelled():
+                self.timeouts += 1
+                log.warning("排队超时", model=model, timeout=self.queue_timeout)
+                raise AdmissionTimeout(f"排队超时 ({self.queue_timeout}s)，当前生成数已达上限")
+
+        waited = time.time() - waiter.queued_at
+        self.admitted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    @asynccontextmanager
+    async def slot(self, conn_id: str, model: str, on_queued=None):
+        """async with manager.slot(conn_id, model): 占用一个生成名额"""
+        await self.acquire(conn_id, model, on_queued)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    # --- 统计 ---
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self.waiters.values())
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "global_limit": self.global_limit,
+            "running_by_model": {m: n for m, n in self.running_by_model.items() if n},
+            "queued": self.queued,
+            "queued_connections": len(self.waiters),
+            "tasks": len(self.tasks),
+            "connections": len(self.connections),
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "timeouts": self.timeouts,
+            "wait_avg": self.wait_total / self.admitted if self.admitted else 0.0,
+            "wait_max": self.wait_max,
+        }
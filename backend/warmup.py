@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+启动预热
+
+原先导入 config.py 就会写一次 DrissionPage 的配置文件（每个导入它的模块、每个分片进程都会再写），
+server.py 在导入时同步启动浏览器，各模型的标签页要等到第一条消息才打开，打开后固定 sleep(1)。
+
+现在 HTTP 接口在启动后立即可用，浏览器在后台启动（配置文件只在路径变化时写入），
+启动后并行打开所有模型的标签页，等到输入框出现才算就绪；/health 按模型报告就绪状态。
+浏览器启动期间到达的对话请求等待启动完成，而不是直接报错。
+"""
+import asyncio
+import time
+
+from logs import get_logger
+
+log = get_logger('warmup')
+
+
+def ensure_browser_path(path: str):
+    """DrissionPage 配置文件中的浏览器路径与 path 不同时才写入"""
+    from DrissionPage import ChromiumOptions
+    co = ChromiumOptions()
+    if co.browser_path != path:
+        co.set_browser_path(path).save()
+        log.info("已写入浏览器路径配置", path=path)
+
+
+def launch_browser(path: str):
+    """[后台线程] 写入浏览器路径（必要时）并启动 / 接管浏览器"""
+    from DrissionPage import ChromiumPage
+    ensure_browser_path(path)
+    return ChromiumPage()
+
+
+class Warmup:
+    """浏览器启动与各模型标签页预热的状态"""
+
+    def __init__(self):
+        # pending / starting / ready / failed / disabled（mock 后端、分片模式下由分片进程各自启动）
+        self.browser = 'pending'
+        self.browser_error = None
+        self.browser_seconds = None
+        self.started_at = time.time()
+        # Key: model_name, Value: {"state": pending / opening / ready / partial / failed / lazy（不预热，
+        #                         第一条消息时打开）, "ready": 就绪标签页数,
+        #                         "tabs": 标签页数, "seconds": 预热耗时, "error": 错误信息}
+        self.models = {}
+        self._browser_done = asyncio.Event()
+
+    def disable(self, reason: str):
+        self.browser = 'disabled'
+        self.browser_error = reason
+        self._browser_done.set()
+
+    @property
+    def failed(self) -> bool:
+        return self.browser == 'failed'
+
+    async def launch(self, launch):
+        """在后台线程中启动浏览器，失败时返回 None"""
+        self.browser = 'starting'
+        start = time.perf_counter()
+        try:
+            page = await asyncio.to_thread(launch)
+        except Exception as e:
+            self.browser = 'failed'
+            self.browser_error = str(e)
+            log.error("浏览器启动失败", error=str(e))
+            return None
+        finally:
+            self.browser_seconds = time.perf_counter() - start
+            self._browser_done.set()
+        self.browser = 'ready'
+        log.info("浏览器后端初始化成功", seconds=round(self.browser_seconds, 2))
+        return page
+
+    async def wait_browser(self, timeout: float):
+        """等待浏览器启动完成；启动失败或超时抛出 RuntimeError"""
+        try:
+            await asyncio.wait_for(self._browser_done.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"后端浏览器仍在启动（已等待 {timeout}s）")
+        if self.failed:
+            raise RuntimeError(f"后端浏览器未启动: {self.browser_error}")
+
+    def track(self, pools: dict, state: str = 'pending'):
+        for name, pool in pools.items():
+            self.models[name] = {"state": state, "ready": 0, "tabs": len(pool.slots), "seconds": None,
+                                 "error": None}
+
+    async def warm_pools(self, pools: dict, make_bot):
+        """并行预热所有模型的标签页池；make_bot(model_name) 为每个标签页创建一个 bot"""
+        self.track(pools)
+        start = time.perf_counter()
+        await asyncio.gather(*(self._warm_pool(name, pool, make_bot) for name, pool in pools.items()))
+        log.info("标签页预热完成", seconds=round(time.perf_counter() - start, 2),
+                 ready={name: m["state"] for name, m in self.models.items()})
+
+    async def _warm_pool(self, name: str, pool, make_bot):
+        status = self.models[name]
+        status["state"] = "opening"
+        start = time.perf_counter()
+        try:
+            status["ready"] = await pool.warm(lambda: make_bot(name))
+            status["state"] = ("ready" if status["ready"] == status["tabs"]
+                               else "partial" if status["ready"] else "failed")
+        except Exception as e:
+            status["state"] = "failed"
+            status["error"] = str(e)
+            log.error("标签页预热失败", model=name, error=str(e))
+        status["seconds"] = time.perf_counter() - start
+
+    def health(self) -> dict:
+        """整体状态：ok（全部就绪）/ starting / degraded（部分模型未就绪）/ down（浏览器启动失败）"""
+        states = [m["state"] for m in self.models.values()]
+        if self.failed:
+            status = 'down'
+        elif self.browser in ('pending', 'starting') or any(s in ('pending', 'opening') for s in states):
+            status = 'starting'
+        elif all(s in ('ready', 'lazy') for s in states):
+            status = 'ok'
+        else:
+            status = 'degraded'
+        return {
+            "status": status,
+            "uptime": time.time() - self.started_at,
+            "browser": {"state": self.browser, "seconds": self.browser_seconds, "error": self.browser_error},
+            "models": self.models,
+        }
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+每个 WebSocket 连接的发送队列
+
+原先 handle_chat_stream 对每一块内容都 await websocket.send_json：客户端读得慢（网络差、页面在后台）时
+send_json 在写缓冲上等待，bot 的监听循环随之停住，还一直占着浏览器标签页。
+
+现在生成任务只把内容放进连接的发送队列（不等待），由连接自己的发送任务依次写出：
+  - 内容块以「最新快照」入队，发送时才由该对话的编码器编码成快照 / 增量帧，
+    所以合并不会破坏增量协议的 seq / offset；
+  - 同一对话尚未发出的上一块在客户端跟不上时直接被新内容替换（latest-wins），客户端跳过中间状态，直接收到最新内容；
+  - done / error 等控制帧从不合并或丢弃，并保证排在该对话所有内容之后。
+
+帧很小，发出去的数据先被两端的内核缓冲和客户端库吸收，一个回答整个放得下，server 这一侧的队列根本积压不起来，
+客户端读得慢时 done 帧也要排在几十个旧帧后面。所以增量协议的客户端每处理完一帧回复
+{"type": "ack", "chatId", "seq"}：一个流已发出但未确认的帧达到 window 时暂停发送该对话的内容，
+期间的新内容合并进排队的那一块；该对话的控制帧入队后不再等待确认，内容连同控制帧立即发出。
+收到第一个 ack 之前（旧前端、快照协议）不做流控，只在待发送内容超过 max_bytes（按字符数估算）时合并，作为兜底。
+"""
+import asyncio
+import time
+from collections import deque
+
+from logs import get_logger
+from metrics import CHUNKS_TOTAL, WS_COALESCED, WS_SEND_SECONDS
+
+log = get_logger('ws')
+
+# 当前所有连接的发送器
+_senders = set()
+
+
+class _Entry:
+    __slots__ = ('chat_id', 'model', 'encoder', 'content', 'frame', 'size')
+
+    def __init__(self, chat_id, model=None, encoder=None, content=None, frame=None):
+        self.chat_id = chat_id
+        self.model = model
+        self.encoder = encoder
+        self.content = content
+        # dict，或发送时才调用的函数（例如 done 帧要带上编码器最终的 seq）
+        self.frame = frame
+        self.size = len(content) if content is not None else 0
+
+
+class _Flow:
+    """一个流（对话的一次生成，即一个编码器）已发出与已确认的帧序号"""
+    __slots__ = ('encoder', 'sent', 'acked')
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.sent = 0
+        # 收到第一个 ack 之前为 None（不做流控）
+        self.acked = None
+
+
+class ConnectionSender:
+    def __init__(self, websocket, max_bytes: int = 256 * 1024, window: int = 4):
+        self.websocket = websocket
+        self.max_bytes = max_bytes
+        self.window = window
+        self.closed = False
+        self._queue = deque()
+        # Key: chat_id, Value: 该对话排在队列中、尚未发出的最后一块内容
+        self._last_content = {}
+        # Key: chat_id, Value: _Flow
+        self._flows = {}
+        # Key: chat_id, Value: 排在队列中的控制帧数（大于 0 时该对话的内容不再等待确认）
+        self._closing = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        # 统计
+        self.bytes = 0
+        self.peak_bytes = 0
+        self.peak_depth = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.stall_total = 0.0
+        self.stall_max = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        _senders.add(self)
+
+    async def close(self):
+        self.closed = True
+        _senders.discard(self)
+        self._queue.clear()
+        self._last_content.clear()
+        self._flows.clear()
+        self._closing.clear()
+        self.bytes = 0
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    # --- 入队（不等待） ---
+
+    def send_content(self, chat_id: str, model: str, encoder, content: str):
+        """对话的最新完整内容；客户端跟不上时替换该对话尚未发出的上一块"""
+        if self.closed:
+            return
+        last = self._last_content.get(chat_id)
+        if last is not None and (self._held(chat_id) or self.bytes + len(content) > self.max_bytes):
+            self.bytes += len(content) - last.size
+            last.content, last.size, last.encoder = content, len(content), encoder
+            self.coalesced += 1
+            WS_COALESCED.inc()
+            return
+        entry = _Entry(chat_id, model, encoder, content)
+        self._last_content[chat_id] = entry
+        self._push(entry)
+
+    def send_frame(self, frame, chat_id: str = None):
+        """控制帧（done / error 等），从不合并或丢弃"""
+        if self.closed:
+            return
+        # 之后同一 chatId 的新内容（例如重新提问）不能合并到这一帧之前
+        self._last_content.pop(chat_id, None)
+        if chat_id is not None:
+            self._closing[chat_id] = self._closing.get(chat_id, 0) + 1
+        self._push(_Entry(chat_id, frame=frame))
+
+    def ack(self, chat_id: str, seq):
+        """客户端已处理到该对话的第 seq 帧"""
+        flow = self._flows.get(chat_id)
+        # 上一个流迟到的确认（序号大于本流已发出的）直接忽略
+        if flow is None or not isinstance(seq, int) or seq > flow.sent:
+            return
+        flow.acked = max(flow.acked or 0, seq)
+        self._wakeup.set()
+
+    def _held(self, chat_id: str) -> bool:
+        """该对话的内容是否在等待客户端确认"""
+        if self._closing.get(chat_id):
+            return False
+        flow = self._flows.get(chat_id)
+        return flow is not None and flow.acked is not None and flow.sent - flow.acked >= self.window
+
+    def _take(self):
+        """取出队列中第一个可以发送的帧；等待确认的对话跳过，其后同一对话的帧保持顺序"""
+        held = set()
+        for i, entry in enumerate(self._queue):
+            if entry.chat_id in held:
+                continue
+            if entry.content is not None and self._held(entry.chat_id):
+                held.add(entry.chat_id)
+                continue
+            del self._queue[i]
+            return entry
+        return None
+
+    def _push(self, entry: _Entry):
+        self._queue.append(entry)
+        self.bytes += entry.size
+        self.peak_bytes = max(self.peak_bytes, self.bytes)
+        self.peak_depth = max(self.peak_depth, len(self._queue))
+        self._wakeup.set()
+
+    # --- 发送任务 ---
+
+    async def _run(self):
+        try:
+            while True:
+                entry = self._take()
+                if entry is None:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                self.bytes -= entry.size
+                if self._last_content.get(entry.chat_id) is entry:
+                    del self._last_content[entry.chat_id]
+                if entry.content is None and entry.chat_id is not None:
+                    self._closed_one(entry.chat_id)
+                frame = self._materialize(entry)
+                if frame is None:
+                    continue
+                if entry.content is not None:
+                    self._sent_one(entry)
+                start = time.perf_counter()
+                await self.websocket.send_json(frame)
+                elapsed = time.perf_counter() - start
+                WS_SEND_SECONDS.observe(elapsed)
+                self.stall_total += elapsed
+                self.stall_max = max(self.stall_max, elapsed)
+                self.sent += 1
+                if entry.content is not None:
+                    CHUNKS_TOTAL.inc(model=entry.model)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 连接已断开：之后的帧直接丢弃，由 websocket_endpoint 负责清理任务
+            log.info("发送失败，连接已关闭", error=str(e))
+            await self.close()
+
+    def _sent_one(self, entry: _Entry):
+        flow = self._flows.get(entry.chat_id)
+        if flow is None or flow.encoder is not entry.encoder:
+            # 该对话的新一次生成，序号从头开始
+            flow = self._flows[entry.chat_id] = _Flow(entry.encoder)
+        flow.sent = entry.encoder.seq
+
+    def _closed_one(self, chat_id: str):
+        # 控制帧之后的内容属于新的流（或新的排队），之前的确认不再有意义
+        self._flows.pop(chat_id, None)
+        count = self._closing.get(chat_id, 0) - 1
+        if count > 0:
+            self._closing[chat_id] = count
+        else:
+            self._closing.pop(chat_id, None)
+
+    @staticmethod
+    def _materialize(entry: _Entry):
+        if entry.content is None:
+            return entry.frame() if callable(entry.frame) else entry.frame
+        frame = entry.encoder.encode(entry.content)
+        if frame is None:
+            return None
+        frame["model"] = entry.model
+        frame["chatId"] = entry.chat_id
+        return frame
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._queue),
+            "queue_bytes": self.bytes,
+            "peak_depth": self.peak_depth,
+            "peak_bytes": self.peak_bytes,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "stall_total": self.stall_total,
+            "stall_max": self.stall_max,
+        }
+
+
+def sender_summary() -> dict:
+    """所有连接发送队列的汇总与逐连接统计"""
+    connections = [s.stats() for s in list(_senders)]
+    return {
+        "connections": len(connections),
+        "queue_depth": sum(c["queue_depth"] for c in connections),
+        "queue_bytes": sum(c["queue_bytes"] for c in connections),
+        "coalesced": sum(c["coalesced"] for c in connections),
+        "stall_max": max((c["stall_max"] for c in connections), default=0.0),
+        "details": connections,
+    }
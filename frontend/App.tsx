@@ -18,8 +18,8 @@ import {
   Copy,
   RotateCw
 } from 'lucide-react';
-import { MODELS, WS_URL } from './constants';
-import { Model, Message, ViewState } from './types';
+import { MODELS, WS_URL, STREAM_PROTOCOL } from './constants';
+import { Model, Message, ViewState, StreamFrame } from './types';
 import MarkdownRenderer from './components/MarkdownRenderer';
 
 // --- API 配置 ---
@@ -93,6 +93,8 @@ const App: React.FC = () => {
   const [conversations, setConversations] = useState<Record<string, Message[]>>({});
   // Key: Chat ID, Value: boolean
   const [typingStatus, setTypingStatus] = useState<Record<string, boolean>>({});
+  // Key: Chat ID, Value: 排队时前面还有多少个请求（后端生成数已达上限）
+  const [queueStatus, setQueueStatus] = useState<Record<string, number>>({});
 
   const [input, setInput] = useState('');
   const [isConnected, setIsConnected] = useState(false);
@@ -114,6 +116,10 @@ const App: React.FC = () => {
   const scrollRef = useRef<HTMLDivElement>(null);
   const currentChatIdRef = useRef(currentChatId);
   const shouldAutoScrollRef = useRef(true);
+  // 增量协议的本地缓冲：Key: Chat ID, Value: 已拼接的回答文本与最后处理的帧序号
+  const streamBufferRef = useRef<Record<string, { text: string; seq: number }>>({});
+  // 已发出 resync、尚未收到全量帧的 Chat ID：期间的增量帧直接丢弃，不重复请求
+  const resyncPendingRef = useRef<Set<string>>(new Set());
 
   // 计算属性：仅获取当前 ChatID 的消息，确保数据隔离
   const currentMessages = useMemo(() => {
@@ -127,6 +133,8 @@ const App: React.FC = () => {
     return typingStatus[currentChatId] || false;
   }, [typingStatus, currentChatId]);
 
+  const currentQueuePosition = currentChatId ? queueStatus[currentChatId] : undefined;
+
   // --- 持久化副作用 ---
   useEffect(() => {
     localStorage.setItem('app_view', view);
@@ -182,23 +190,6 @@ const App: React.FC = () => {
     } catch (err) { console.error(err); }
   };
 
-  const saveCurrentChatToBackend = async (msgs: Message[], modelId: string, chatId: string | null) => {
-    if (msgs.length === 0 || !chatId) return;
-
-    const firstUserMsg = msgs.find(m => m.role === 'user');
-    const title = firstUserMsg ? firstUserMsg.content.replace(/\n/g, ' ').trim().slice(0, 20) : 'New Chat';
-    try {
-      await fetch(`${API_BASE}/history`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          id: chatId, title, model: modelId, messages: msgs, updated_at: Date.now() / 1000
-        })
-      });
-      fetchHistory();
-    } catch (err) { console.error(err); }
-  };
-
   // --- 初始化逻辑 ---
   useEffect(() => {
     fetchHistory();
@@ -225,36 +216,74 @@ const App: React.FC = () => {
     if (socketRef.current?.readyState === WebSocket.OPEN) return;
     const socket = new WebSocket(WS_URL);
 
-    socket.onopen = () => setIsConnected(true);
+    socket.onopen = () => { resyncPendingRef.current.clear(); setIsConnected(true); };
 
     socket.onmessage = (event) => {
-      const data = JSON.parse(event.data);
+      const data: StreamFrame = JSON.parse(event.data);
       const targetChatId = data.chatId; // <--- 关键：只处理指定 ChatID 的消息
 
       if (!targetChatId) return;
 
+      if (data.type === 'queued') {
+        setQueueStatus(prev => ({ ...prev, [targetChatId]: data.position || 0 }));
+        return;
+      }
+      // 收到内容或结束帧说明已不在排队
+      setQueueStatus(prev => {
+        if (!(targetChatId in prev)) return prev;
+        const { [targetChatId]: _, ...rest } = prev;
+        return rest;
+      });
+
       if (data.type === 'done' || data.type === 'error') {
+        delete streamBufferRef.current[targetChatId];
+        resyncPendingRef.current.delete(targetChatId);
         setTypingStatus(prev => ({ ...prev, [targetChatId]: false }));
         return;
       }
 
-      if (data.type === 'chunk') {
-        const chunk = data.content;
-        setConversations(prev => {
-          // 只更新对应 ChatID 的消息列表，绝对不会影响当前视图（如果 ID 不同）
-          const currentChatMsgs = prev[targetChatId] || [];
-          const lastMsg = currentChatMsgs[currentChatMsgs.length - 1];
-
-          let newChatMsgs;
-          if (lastMsg && lastMsg.role === 'assistant') {
-            newChatMsgs = [...currentChatMsgs];
-            newChatMsgs[newChatMsgs.length - 1] = { ...lastMsg, content: chunk };
-          } else {
-            newChatMsgs = [...currentChatMsgs, { role: 'assistant', content: chunk, timestamp: Date.now() }];
-          }
-          return { ...prev, [targetChatId]: newChatMsgs };
-        });
+      let chunk: string;
+      if (data.v === 2) {
+        // 增量协议：按 seq/offset 拼接，发现不连续时请求全量 resync
+        // 每收到一帧（包括等待 resync 时丢弃的帧）都回复 ack，server 据此控制未确认的帧数
+        socket.send(JSON.stringify({ type: 'ack', chatId: targetChatId, seq: data.seq }));
+        const buffer = streamBufferRef.current[targetChatId];
+        const pending = resyncPendingRef.current;
+        if (data.type === 'resync') {
+          pending.delete(targetChatId);
+          chunk = data.content || '';
+        } else if (pending.has(targetChatId)) {
+          return;
+        } else if (data.seq === 1) {
+          chunk = data.delta || '';
+        } else if (buffer && data.seq === buffer.seq + 1 && data.offset! <= buffer.text.length) {
+          chunk = buffer.text.slice(0, data.offset) + (data.delta || '');
+        } else {
+          pending.add(targetChatId);
+          socket.send(JSON.stringify({ type: 'resync', chatId: targetChatId }));
+          return;
+        }
+        streamBufferRef.current[targetChatId] = { text: chunk, seq: data.seq! };
+      } else if (data.type === 'chunk') {
+        chunk = data.content || '';
+      } else {
+        return;
       }
+
+      setConversations(prev => {
+        // 只更新对应 ChatID 的消息列表，绝对不会影响当前视图（如果 ID 不同）
+        const currentChatMsgs = prev[targetChatId] || [];
+        const lastMsg = currentChatMsgs[currentChatMsgs.length - 1];
+
+        let newChatMsgs;
+        if (lastMsg && lastMsg.role === 'assistant') {
+          newChatMsgs = [...currentChatMsgs];
+          newChatMsgs[newChatMsgs.length - 1] = { ...lastMsg, content: chunk };
+        } else {
+          newChatMsgs = [...currentChatMsgs, { role: 'assistant', content: chunk, timestamp: Date.now() }];
+        }
+        return { ...prev, [targetChatId]: newChatMsgs };
+      });
     };
 
     socket.onerror = () => setIsConnected(false);
@@ -267,9 +296,10 @@ const App: React.FC = () => {
     return () => socketRef.current?.close();
   }, [view, connectWebSocket]);
 
+  // 对话由后端逐条记录（用户消息 + 最终回答），这里只刷新侧边栏
   useEffect(() => {
     if (!isCurrentModelTyping && currentMessages.length > 0 && currentChatId) {
-      saveCurrentChatToBackend(currentMessages, selectedModel.id, currentChatId);
+      fetchHistory();
     }
   }, [isCurrentModelTyping]);
 
@@ -338,7 +368,8 @@ const App: React.FC = () => {
         type: 'chat',
         model: selectedModel.id,
         chatId: activeChatId,
-        message: input
+        message: input,
+        protocol: STREAM_PROTOCOL
       }));
     }
 
@@ -351,7 +382,6 @@ const App: React.FC = () => {
         updated_at: Date.now() / 1000
       };
       setHistoryList(prev => [optimisticHistoryItem, ...prev]);
-      saveCurrentChatToBackend(nextMessages, selectedModel.id, activeChatId);
     }
 
     setInput('');
@@ -381,7 +411,9 @@ const App: React.FC = () => {
         type: 'chat',
         model: selectedModel.id,
         chatId: currentChatId, // <--- 关键
-        message: lastUserMsg.content
+        message: lastUserMsg.content,
+        regenerate: true, // 后端据此丢弃上一次的回答，而不是再记录一次用户消息
+        protocol: STREAM_PROTOCOL
       }));
     }
   };
@@ -629,6 +661,9 @@ const App: React.FC = () => {
                           <div className="w-1.5 h-1.5 bg-blue-500 rounded-full animate-bounce [animation-delay:0.1s]"></div>
                           <div className="w-1.5 h-1.5 bg-blue-500 rounded-full animate-bounce [animation-delay:0.2s]"></div>
                         </div>
+                        {currentQueuePosition !== undefined && (
+                            <span className="text-xs text-gray-400">排队中，前面还有 {currentQueuePosition} 个请求</span>
+                        )}
                       </div>
                   )}
                 </div>
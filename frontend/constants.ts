@@ -34,4 +34,6 @@ export const MODELS: Model[] = [
   }
 ];
 
-export const WS_URL = 'ws://127.0.0.1:8000/ws/chat';
\ No newline at end of file
+export const WS_URL = 'ws://127.0.0.1:8000/ws/chat';
+// WebSocket 流式协议版本：1 = 完整快照，2 = 增量帧 (offset + delta，必要时 resync)
+export const STREAM_PROTOCOL = 2;
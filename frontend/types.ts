@@ -15,3 +15,33 @@ export enum ViewState {
   LANDING = 'landing',
   CHAT = 'chat'
 }
+
+// 后端推送的流式帧
+// v1: { type: 'chunk', content }
+// v2: { type: 'chunk', v: 2, seq, offset, delta } / { type: 'resync', v: 2, seq, content }
+//     前端每收到一帧回复 { type: 'ack', chatId, seq }
+export interface StreamFrame {
+  type: 'chunk' | 'resync' | 'done' | 'error' | 'queued' | 'fanout' | 'fanout_done';
+  model?: string;
+  chatId?: string;
+  v?: number;
+  seq?: number;
+  offset?: number;
+  delta?: string;
+  content?: string;
+  // queued 帧：前面还在等待的请求数
+  position?: number;
+  // done 帧：从发出请求到首块 / 结束的耗时（秒）
+  ttfc?: number | null;
+  seconds?: number | null;
+  // fanout 帧：各模型分支的 chatId；fanout_done 帧：各分支的状态与耗时
+  fanoutId?: string;
+  branches?: Record<string, string | FanoutBranchResult>;
+}
+
+export interface FanoutBranchResult {
+  status: 'done' | 'cancelled' | 'error';
+  chatId: string;
+  ttfc: number | null;
+  seconds: number | null;
+}